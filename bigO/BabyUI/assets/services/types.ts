@@ -13,6 +13,7 @@ interface Pagination {
   num_records: number;
   num_per_page: number;
   current_page_num: number;
+  next_cursor: string | null;
 }
 interface Search {
   query: string | null;
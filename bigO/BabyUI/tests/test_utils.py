@@ -0,0 +1,99 @@
+import datetime
+
+import pytest
+from asgiref.sync import async_to_sync
+
+from bigO.users.models import User
+from bigO.users.tests.factories import UserFactory
+from django.core.cache import cache
+from django.test import RequestFactory
+from django.utils import timezone
+
+from ..utils import ListPageHandler, decode_cursor, encode_cursor, get_keyset_fields
+
+pytestmark = pytest.mark.django_db
+
+BASE_TIME = datetime.datetime(2026, 10, 18, 10, 0, tzinfo=datetime.UTC)
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    # the cursors of the pages are remembered by their query, they must not be kept between the tests
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    cache.clear()
+
+
+@pytest.fixture
+def users() -> list[User]:
+    last_logins = [
+        # ties
+        *[BASE_TIME] * 4,
+        # in the same millisecond
+        *[BASE_TIME + datetime.timedelta(microseconds=i) for i in (1, 2, 250, 999)],
+        BASE_TIME + datetime.timedelta(milliseconds=1),
+        *[None] * 3,
+    ]
+    res = []
+    for last_login in last_logins:
+        user = UserFactory()
+        User.objects.filter(id=user.id).update(last_login=last_login, date_joined=BASE_TIME)
+        res.append(user)
+    return res
+
+
+def get_all_pages(ordering: list[str], per_page: int) -> list[int]:
+    """the pks of all the pages, the next page is requested with the cursor of the previous one like the ui does"""
+    res = []
+    cursor = None
+    page_number = 1
+    while True:
+        params = {"u_page_number": page_number, "u_per_page": per_page}
+        if cursor:
+            params["u_cursor"] = cursor
+        handler = ListPageHandler(
+            RequestFactory().get("/", params),
+            User.objects.order_by(*ordering),
+            render_record_callback=lambda i: i,
+            prefix="u",
+            keyset=True,
+        )
+        page = async_to_sync(handler.get_page)()
+        res.extend(i.pk for i in page.records)
+        if page_number >= page.num_pages:
+            return res
+        cursor = page.next_cursor
+        page_number += 1
+
+
+@pytest.mark.parametrize(
+    "ordering",
+    [
+        ["last_login"],
+        ["-last_login"],
+        ["date_joined"],
+        ["-date_joined"],
+    ],
+)
+@pytest.mark.parametrize("per_page", [1, 2, 3])
+def test_keyset_pages(users, ordering, per_page):
+    """no row is repeated or skipped on the ties, the sub millisecond differences and the nulls"""
+    pk_ordering = "-pk" if ordering[-1].startswith("-") else "pk"
+    expected = list(User.objects.order_by(*ordering, pk_ordering).values_list("pk", flat=True))
+
+    assert get_all_pages(ordering, per_page) == expected
+
+
+def test_cursor_keeps_microseconds():
+    queryset = User.objects.order_by("last_login", "pk")
+    fields = get_keyset_fields(queryset, ["last_login", "pk"])
+    values = [BASE_TIME + datetime.timedelta(microseconds=250), 7]
+
+    assert decode_cursor(encode_cursor(values), fields) == values
+
+
+def test_cursor_of_nulls_is_not_decoded():
+    fields = get_keyset_fields(User.objects.all(), ["last_login", "pk"])
+
+    assert decode_cursor(encode_cursor([None, 7]), fields) is None
+    assert decode_cursor(encode_cursor([timezone.now()]), fields) is None
+    assert decode_cursor("not a cursor", fields) is None
@@ -1,11 +1,17 @@
+import base64
+import datetime
+import json
 from collections.abc import Awaitable, Callable
-from typing import Generic, Literal, TypeAlias, TypeVar
+from hashlib import sha256
+from typing import Generic, Literal, NamedTuple, TypeAlias, TypeVar
 
 import pydantic
 from asgiref.sync import sync_to_async
 
-from django.core.paginator import Paginator
-from django.db.models import QuerySet
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Field, Q, QuerySet
 
 OutputRecordT = TypeVar("OutputRecordT", bound=pydantic.BaseModel)
 InputRecordT = TypeVar("InputRecordT", bound=QuerySet)
@@ -16,6 +22,7 @@ class Pagination(pydantic.BaseModel):
     num_records: int
     num_per_page: int
     current_page_num: int
+    next_cursor: str | None = None
 
 
 class Search(pydantic.BaseModel):
@@ -63,9 +70,104 @@ render_record_callback_type: TypeAlias = Callable[[InputRecordT], Awaitable[Outp
 sort_callback_type: TypeAlias = Callable[
     [QuerySet[InputRecordT], list[tuple[str, bool]]], Awaitable[QuerySet[InputRecordT], list[tuple[str, bool]]]
 ]
+page_queryset_callback_type: TypeAlias = Callable[[list], QuerySet[InputRecordT]]
+
+
+class PageSlice(NamedTuple):
+    records: list
+    number: int
+    num_pages: int
+    count: int
+    per_page: int
+    next_cursor: str | None
+
+
+def get_query_digest(queryset: QuerySet, *extra) -> str | None:
+    try:
+        query = str(queryset.query)
+    except EmptyResultSet:
+        return None
+    return sha256(repr((query, *extra)).encode("utf-8")).hexdigest()
+
+
+def get_keyset_ordering(queryset: QuerySet) -> list[str] | None:
+    """the ordering of queryset ending with pk, None if it cannot be seeked by its values"""
+    ordering = list(queryset.query.order_by)
+    if not ordering or not all(isinstance(i, str) and "__" not in i and i != "?" for i in ordering):
+        return None
+    if ordering[-1].removeprefix("-") not in ("pk", "id"):
+        ordering.append("-pk" if ordering[-1].startswith("-") else "pk")
+    return ordering
+
+
+def get_keyset_q(ordering: list[str], values: list) -> Q:
+    """the rows after values in ordering, nulls are last in ascending and first in descending order (postgres)"""
+    q = Q()
+    for index, name in enumerate(ordering):
+        field = name.removeprefix("-")
+        if name.startswith("-"):
+            step_q = Q(**{f"{field}__lt": values[index]})
+        else:
+            step_q = Q(**{f"{field}__gt": values[index]}) | Q(**{f"{field}__isnull": True})
+        for prev_name, prev_value in zip(ordering[:index], values[:index]):
+            step_q &= Q(**{prev_name.removeprefix("-"): prev_value})
+        q |= step_q
+    return q
+
+
+def get_keyset_fields(queryset: QuerySet, ordering: list[str]) -> list[Field]:
+    """the model fields or the annotations output fields of ordering, to decode the cursor values by"""
+    opts = queryset.model._meta
+    res = []
+    for name in ordering:
+        name = name.removeprefix("-")
+        if name == "pk":
+            res.append(opts.pk)
+        elif name in queryset.query.annotations:
+            res.append(queryset.query.annotations[name].output_field)
+        else:
+            res.append(opts.get_field(name))
+    return res
+
+
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder cuts the datetimes to milliseconds, the keyset values must be the exact ones of the row"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime | datetime.time):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values, cls=CursorJSONEncoder).encode("utf-8")).decode()
+
+
+def decode_cursor(cursor: str, fields: list[Field]) -> list | None:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        return None
+    if not isinstance(values, list) or len(values) != len(fields):
+        return None
+    # the cursors are not made for the rows with nulls, see ListPageHandler.get_page
+    if None in values:
+        return None
+    try:
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except ValidationError:
+        return None
 
 
 class ListPageHandler(Generic[InputRecordT, OutputRecordT]):
+    """
+    keyset: seeks the next page by the values of the previous page last row instead of OFFSET,
+    the cursor is taken from <prefix>_cursor or is remembered from the previous page number
+    page_queryset_callback: gets the pks of the page and returns the queryset to render them from,
+    so the heavy annotations are computed only for the rows of the page
+    count_cache_timeout: the total count is cached for this many seconds
+    """
+
     def __init__(
         self,
         request,
@@ -76,6 +178,9 @@ class ListPageHandler(Generic[InputRecordT, OutputRecordT]):
         sortables: set[str] = None,
         prefix: str | None = None,
         default_per_page=25,
+        keyset: bool = False,
+        page_queryset_callback: page_queryset_callback_type | None = None,
+        count_cache_timeout: int | None = None,
     ):
         assert (sortables and sort_callback) or not (sortables or sort_callback)
         self.sortables = sortables
@@ -87,6 +192,9 @@ class ListPageHandler(Generic[InputRecordT, OutputRecordT]):
         self.prefix = prefix or ""
         self.render_record_callback = render_record_callback
         self.search_callback = search_callback
+        self.keyset = keyset
+        self.page_queryset_callback = page_queryset_callback
+        self.count_cache_timeout = count_cache_timeout
 
     @property
     def search_q(self) -> str | None:
@@ -124,20 +232,90 @@ class ListPageHandler(Generic[InputRecordT, OutputRecordT]):
 
     @property
     def per_page(self) -> int:
-        return self.request.GET.get(f"{self.prefix}_per_page", self.defualt_per_page)
+        try:
+            return max(int(self.request.GET.get(f"{self.prefix}_per_page", self.defualt_per_page)), 1)
+        except ValueError:
+            return self.defualt_per_page
+
+    @property
+    def page_number(self) -> int:
+        try:
+            return max(int(self.request.GET.get(f"{self.prefix}_page_number", self.request.GET.get("page", 1))), 1)
+        except ValueError:
+            return 1
 
-    async def paginator(self):
-        if not hasattr(self, "_paginator"):
-            setattr(self, "_paginator", Paginator(await self.sorted_queryset(), self.per_page))
-        return self._paginator
+    async def count(self) -> int:
+        queryset = await self.searched_queryset()
+        if isinstance(queryset, list):
+            return len(queryset)
+        cache_key = None
+        if self.count_cache_timeout and (digest := get_query_digest(queryset)):
+            cache_key = f"listpage_count_{digest}"
+            count = await cache.aget(cache_key)
+            if count is not None:
+                return count
+        count = await queryset.acount()
+        if cache_key:
+            await cache.aset(cache_key, count, timeout=self.count_cache_timeout)
+        return count
 
-    async def page(self):
+    def get_cursor_cache_key(self, queryset: QuerySet, page_number: int) -> str | None:
+        if digest := get_query_digest(queryset, self.per_page, page_number):
+            return f"listpage_cursor_{digest}"
+        return None
+
+    async def page(self) -> PageSlice:
         if not hasattr(self, "_page"):
-            page_number = self.request.GET.get(f"{self.prefix}_page_number", self.request.GET.get("page", 1))
-            paginator = await self.paginator()
-            setattr(self, "_page", await sync_to_async(paginator.get_page)(page_number))
+            setattr(self, "_page", await self.get_page())
         return self._page
 
+    async def get_page(self) -> PageSlice:
+        queryset = await self.sorted_queryset()
+        per_page = self.per_page
+        count = await self.count()
+        num_pages = max(-(-count // per_page), 1)
+        page_number = min(self.page_number, num_pages)
+
+        ordering = None
+        if self.keyset and not isinstance(queryset, list):
+            ordering = get_keyset_ordering(queryset)
+        values = None
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+            cursor = self.request.GET.get(f"{self.prefix}_cursor")
+            if not cursor and page_number > 1 and (cache_key := self.get_cursor_cache_key(queryset, page_number - 1)):
+                cursor = await cache.aget(cache_key)
+            if cursor:
+                values = decode_cursor(cursor, get_keyset_fields(queryset, ordering))
+        if values is not None:
+            records = queryset.filter(get_keyset_q(ordering, values))[:per_page]
+        else:
+            offset = (page_number - 1) * per_page
+            records = queryset[offset : offset + per_page]
+        records = await sync_to_async(list)(records)
+
+        next_cursor = None
+        if ordering and records:
+            last_values = [getattr(records[-1], i.removeprefix("-")) for i in ordering]
+            # nulls cannot be compared, the pages after them are fetched by OFFSET
+            if None not in last_values:
+                next_cursor = encode_cursor(last_values)
+                if cache_key := self.get_cursor_cache_key(queryset, page_number):
+                    await cache.aset(cache_key, next_cursor, timeout=self.count_cache_timeout or 60)
+
+        if self.page_queryset_callback and records:
+            page_records = await sync_to_async(list)(self.page_queryset_callback([i.pk for i in records]))
+            page_records_map = {i.pk: i for i in page_records}
+            records = [page_records_map[i.pk] for i in records if i.pk in page_records_map]
+        return PageSlice(
+            records=records,
+            number=page_number,
+            num_pages=num_pages,
+            count=count,
+            per_page=per_page,
+            next_cursor=next_cursor,
+        )
+
     async def to_response(self):
         page = await self.page()
         search = Search(query=self.search_q) if self.search_callback else None
@@ -152,12 +330,13 @@ class ListPageHandler(Generic[InputRecordT, OutputRecordT]):
         return ListPage[OutputRecordT](
             prefix=self.prefix,
             pagination=Pagination(
-                num_pages=page.paginator.num_pages,
+                num_pages=page.num_pages,
                 current_page_num=page.number,
-                num_per_page=page.paginator.per_page,
-                num_records=page.paginator.count,
+                num_per_page=page.per_page,
+                num_records=page.count,
+                next_cursor=page.next_cursor,
             ),
             search=search,
-            records=[await self.render_record_callback(i) for i in await sync_to_async(list)(page)],
+            records=[await self.render_record_callback(i) for i in page.records],
             columns=columns,
         )
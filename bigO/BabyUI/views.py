@@ -17,7 +17,7 @@ from django.contrib.auth import alogout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.humanize.templatetags.humanize import naturaltime
-from django.db.models import QuerySet
+from django.db.models import F, OuterRef, QuerySet, Subquery
 from django.db.models.functions import Coalesce
 from django.http import HttpResponseRedirect
 from django.shortcuts import redirect, render
@@ -235,15 +235,23 @@ async def users_sort_callback(
             order_bys.append(("" if is_asc else "-") + "user__username")
             order_bys.append(("" if is_asc else "-") + "title")
         elif key == "used_bytes":
+            # the join to the current period of the queryset is reused
             queryset = queryset.annotate(
-                used_bytes=Coalesce("current_download_bytes", 0) + Coalesce("current_upload_bytes", 0)
+                used_bytes=Coalesce("periods__current_download_bytes", 0)
+                + Coalesce("periods__current_upload_bytes", 0)
             )
             order_bys.append(("" if is_asc else "-") + "used_bytes")
         elif key == "last_sublink_at":
+            queryset = queryset.ann_last_sublink_at()
             order_bys.append(("" if is_asc else "-") + "last_sublink_at")
         elif key == "last_usage_at":
+            queryset = queryset.ann_last_usage_at()
             order_bys.append(("" if is_asc else "-") + "last_usage_at")
         elif key == "expires_at":
+            period_qs = proxy_manager_models.SubscriptionPeriod.objects.filter(
+                selected_as_current=True, profile_id=OuterRef("id")
+            ).ann_expires_at()
+            queryset = queryset.annotate(current_expires_at=Subquery(period_qs.values("expires_at")[:1]))
             order_bys.append(("" if is_asc else "-") + "current_expires_at")
         res_orderings.append((key, is_asc))
     if order_bys:
@@ -301,15 +309,23 @@ async def dashboard_users(request):
     # users
     users_qs = proxy_manager_services.get_agent_current_subscriptionprofiled_qs(agent=agent_obj)
 
+    # the profiles with a current period, the annotations are added only for the rows of the page
     users_qs = (
-        users_qs.ann_last_usage_at()
-        .ann_last_sublink_at()
-        .ann_current_period_fields()
-        .filter(current_created_at__isnull=False)
+        users_qs.filter(periods__selected_as_current=True)
+        .annotate(current_created_at=F("periods__created_at"))
         .select_related("user")
         .order_by("-current_created_at")
     )
 
+    def users_page_queryset_callback(profile_ids: list[int]):
+        return (
+            proxy_manager_models.SubscriptionProfile.objects.filter(id__in=profile_ids)
+            .ann_last_usage_at()
+            .ann_last_sublink_at()
+            .ann_current_period_fields()
+            .select_related("user")
+        )
+
     user_listpagehandler = utils.ListPageHandler[proxy_manager_models.SubscriptionProfile, utils.User](
         request,
         queryset=users_qs,
@@ -318,6 +334,9 @@ async def dashboard_users(request):
         sort_callback=users_sort_callback,
         sortables={"title", "used_bytes", "last_sublink_at", "last_usage_at", "expires_at"},
         prefix="users",
+        keyset=True,
+        page_queryset_callback=users_page_queryset_callback,
+        count_cache_timeout=30,
     )
     users_res = await user_listpagehandler.to_response()
     # end
@@ -298,13 +298,12 @@ class CertbotInfoModelAdmin(admin.ModelAdmin):
 
     @admin.action(description="Issue A Renew")
     def issue_renew(self, request, queryset: QuerySet[models.Domain]):
-        count = 0
-        for i in queryset:
-            certbot_renew_certificates = (
-                tasks.certbot_renew_certificates if settings.DEBUG else tasks.certbot_renew_certificates.delay
-            )
-            certbot_renew_certificates(certbotinfo_id=i.id)
-            count += 1
+        certbotinfo_ids = list(queryset.values_list("id", flat=True))
+        count = len(certbotinfo_ids)
+        certbot_renew_certificates_batch = (
+            tasks.certbot_renew_certificates_batch if settings.DEBUG else tasks.certbot_renew_certificates_batch.delay
+        )
+        certbot_renew_certificates_batch(certbotinfo_ids=certbotinfo_ids)
         self.message_user(
             request,
             gettext("issued for {0}").format(count),
@@ -339,17 +338,19 @@ class DomainModelAdmin(admin_extra_buttons.mixins.ExtraButtonsMixin, admin.Model
 
     @admin.action(description="Issue A valid Certificate")
     def issue_certificate(self, request, queryset: QuerySet[models.Domain]):
-        count = 0
+        domain_ids = []
         no_provider_count = 0
         for i in queryset:
             if i.get_dns_provider() is None:
                 no_provider_count += 1
                 continue
-            issue_certificate_for_domain = (
-                tasks.issue_certificate_for_domain if settings.DEBUG else tasks.issue_certificate_for_domain.delay
+            domain_ids.append(i.id)
+        count = len(domain_ids)
+        if domain_ids:
+            issue_certificates_for_domains = (
+                tasks.issue_certificates_for_domains if settings.DEBUG else tasks.issue_certificates_for_domains.delay
             )
-            issue_certificate_for_domain(domain_id=i.id)
-            count += 1
+            issue_certificates_for_domains(domain_ids=domain_ids)
         self.message_user(
             request,
             gettext("issued for {0}").format(count),
@@ -414,6 +415,7 @@ class DNSProviderModelAdmin(admin.ModelAdmin):
 @admin.register(models.CertificateTask)
 class CertificateTaskModelAdmin(admin.ModelAdmin):
     list_display = ("__str__", "certbot_info", "task_type", "is_closed", "is_success", "created_at", "updated_at")
+    readonly_fields = ("phase_timings",)
 
     @admin.display()
     def certbot_info(self, obj):
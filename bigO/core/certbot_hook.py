@@ -0,0 +1,58 @@
+"""
+the manual auth hook of the batched certbot runs (see certbot_orchestrator),
+it is run as a plain script so that no django is booted for each challenge,
+the challenges are handed to the orchestrator through the spool dir of the run
+"""
+import json
+import os
+import pathlib
+import sys
+import time
+import uuid
+
+PUBLISHED_FILE_NAME = "published"
+WAIT_TIMEOUT = 15 * 60  # seconds
+POLL_INTERVAL = 0.5  # seconds
+
+
+def auth(spool_dir: pathlib.Path) -> int:
+    challenge = {
+        "domain": os.environ["CERTBOT_DOMAIN"],
+        "validation": os.environ["CERTBOT_VALIDATION"],
+        "remaining": int(os.environ.get("CERTBOT_REMAINING_CHALLENGES") or 0),
+    }
+    name = uuid.uuid4().hex
+    tmp_path = spool_dir / f"{name}.tmp"
+    tmp_path.write_text(json.dumps(challenge))
+    tmp_path.rename(spool_dir / f"{name}.challenge")
+    if challenge["remaining"]:
+        # certbot answers the challenges only after the last hook, so only that one waits for the publish
+        return 0
+
+    published_path = spool_dir / PUBLISHED_FILE_NAME
+    t0 = time.monotonic()
+    while not published_path.exists():
+        if not spool_dir.exists():
+            # the run is already over
+            return 1
+        if time.monotonic() - t0 > WAIT_TIMEOUT:
+            print("timed out waiting for the challenges to be published", file=sys.stderr)
+            return 1
+        time.sleep(POLL_INTERVAL)
+    result = published_path.read_text()
+    if result != "ok":
+        print(result, file=sys.stderr)
+        return 1
+    return 0
+
+
+def main() -> int:
+    command, spool_dir = sys.argv[1], pathlib.Path(sys.argv[2])
+    if command == "auth":
+        return auth(spool_dir)
+    print(f"unknown command {command}", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,442 @@
+import asyncio
+import dataclasses
+import json
+import logging
+import pathlib
+import shlex
+import shutil
+import sys
+import time
+import uuid
+
+import dns.asyncresolver
+import dns.exception
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import certbot_hook
+from . import dns as dns_prs
+from . import metrics, models, services
+from .dns.base import BaseDNSProvider
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["CertbotOrchestrator", "CertbotJob"]
+
+CERTBOT_TIMEOUT = 800  # seconds
+# the runs that reach their challenges within this window are published together
+BATCH_WINDOW = 3  # seconds
+SPOOL_POLL_INTERVAL = 0.5  # seconds
+# a query before the records are on the authoritative servers would be negatively cached by the resolvers
+PROPAGATION_FIRST_CHECK_DELAY = 20  # seconds
+PROPAGATION_CHECK_INTERVAL = 2  # seconds
+PROPAGATION_TIMEOUT = 100  # seconds
+PROVIDER_CONCURRENCY = 8  # requests at once in the session of a dns provider
+
+
+@dataclasses.dataclass
+class ChallengeTarget:
+    dns_provider_id: int
+    base_domain_name: str
+
+
+@dataclasses.dataclass(eq=False)
+class Challenge:
+    domain: str
+    validation: str
+    record_id: str | None = None
+
+    @property
+    def txt_name(self) -> str:
+        return f"_acme-challenge.{self.domain}"
+
+
+@dataclasses.dataclass(eq=False)
+class CertbotJob:
+    certificatetask_obj: models.CertificateTask
+    cert_name: str
+    domains: list[models.Domain]
+    targets: dict[str, ChallengeTarget]
+    # None for the issues
+    certbotinfo_obj: models.CertbotInfo | None = None
+    challenges: list[Challenge] = dataclasses.field(default_factory=list)
+    phase_timings: dict[str, float] = dataclasses.field(default_factory=dict)
+    created_at: float = dataclasses.field(default_factory=time.monotonic)
+
+    @property
+    def run_dir(self) -> pathlib.Path:
+        return pathlib.Path(settings.CERTBOT_RUNS_DIR) / str(self.certificatetask_obj.id)
+
+    @property
+    def config_dir(self) -> pathlib.Path:
+        return self.run_dir / "config"
+
+    @property
+    def spool_dir(self) -> pathlib.Path:
+        return self.run_dir / "spool"
+
+    def add_timing(self, phase: str, seconds: float) -> None:
+        self.phase_timings[phase] = round(self.phase_timings.get(phase, 0) + seconds, 3)
+
+
+class CertbotOrchestrator:
+    """
+    runs certbot for many certificates at once, bounded by the concurrency,
+    the dns challenges of the runs are published in batches grouped per dns provider
+    and the propagation of each batch is waited for once
+    """
+
+    def __init__(self, concurrency: int | None = None, nameservers: list[str] | None = None):
+        self.concurrency = concurrency or settings.CERTBOT_CONCURRENCY
+        self.nameservers = nameservers or settings.CERTBOT_DNS_CHECK_NAMESERVERS
+        self.jobs: list[CertbotJob] = []
+        self.dns_providers: dict[int, BaseDNSProvider] = {}
+
+    def add_issue(self, domains: list[models.Domain]) -> CertbotJob | None:
+        certificatetask_obj = models.CertificateTask()
+        certificatetask_obj.certbot_info_uuid = uuid.uuid4()
+        certificatetask_obj.task_type = models.CertificateTask.TaskTypeChoices.ISSUE
+        certificatetask_obj.logs = f"init for {','.join([i.name for i in domains])}"
+        certificatetask_obj.is_closed = False
+        certificatetask_obj.save()
+        time_str = timezone.now().strftime("%Y%m%d_%H%M%S")
+        cert_name = "_".join([i.name for i in domains]) + f"_{time_str}"
+        return self._add_job(certificatetask_obj=certificatetask_obj, cert_name=cert_name, domains=domains)
+
+    def add_renewal(self, certbotinfo_obj: models.CertbotInfo) -> CertbotJob | None:
+        domains = [i.domain for i in certbotinfo_obj.certificates.first().certificate_domaincertificates.all()]
+        certificatetask_obj = models.CertificateTask()
+        certificatetask_obj.certbot_info_uuid = certbotinfo_obj.uuid
+        certificatetask_obj.task_type = models.CertificateTask.TaskTypeChoices.RENEWAL
+        certificatetask_obj.logs = f"init for {','.join([i.name for i in domains])}"
+        certificatetask_obj.is_closed = False
+        certificatetask_obj.save()
+        return self._add_job(
+            certificatetask_obj=certificatetask_obj,
+            cert_name=certbotinfo_obj.cert_name,
+            domains=domains,
+            certbotinfo_obj=certbotinfo_obj,
+        )
+
+    def _add_job(
+        self,
+        certificatetask_obj: models.CertificateTask,
+        cert_name: str,
+        domains: list[models.Domain],
+        certbotinfo_obj: models.CertbotInfo | None = None,
+    ) -> CertbotJob | None:
+        targets = {}
+        for i in domains:
+            dns_provider = i.get_dns_provider()
+            domain_root_obj = i.get_root()
+            if dns_provider is None or domain_root_obj is None:
+                certificatetask_obj.log("final", f"{i.name} does not have a dns provider or a root")
+                certificatetask_obj.is_closed = True
+                certificatetask_obj.is_success = False
+                certificatetask_obj.save()
+                return None
+            if dns_provider.id not in self.dns_providers:
+                self.dns_providers[dns_provider.id] = dns_provider.get_provider()
+            # certbot passes the wildcards without the *.
+            targets[i.name.removeprefix("*.")] = ChallengeTarget(
+                dns_provider_id=dns_provider.id, base_domain_name=domain_root_obj.name
+            )
+        job = CertbotJob(
+            certificatetask_obj=certificatetask_obj,
+            cert_name=cert_name,
+            domains=domains,
+            targets=targets,
+            certbotinfo_obj=certbotinfo_obj,
+        )
+        self.jobs.append(job)
+        return job
+
+    def run(self) -> list[CertbotJob]:
+        asyncio.run(self._run())
+        return self.jobs
+
+    async def _run(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        ready_jobs: asyncio.Queue[CertbotJob] = asyncio.Queue()
+        batcher = asyncio.create_task(self._batch_loop(ready_jobs))
+        try:
+            await asyncio.gather(*[self._run_job(job, semaphore, ready_jobs) for job in self.jobs])
+        finally:
+            batcher.cancel()
+            await sync_to_async(close_old_connections)()
+
+    def get_command_args(self, job: CertbotJob) -> list:
+        certbot_paths = services.get_certbot_paths()
+        auth_hook = " ".join(
+            [shlex.quote(sys.executable), shlex.quote(certbot_hook.__file__), "auth", shlex.quote(str(job.spool_dir))]
+        )
+        command_args = [
+            certbot_paths["exec_path"],
+            "certonly",
+            "--manual",
+            "--preferred-challenges",
+            "dns",
+            "--manual-auth-hook",
+            auth_hook,
+            "--agree-tos",
+            "--non-interactive",
+            "--logs-dir",
+            pathlib.Path(certbot_paths["logs_dir"]) / f"run_{job.certificatetask_obj.id}",
+            "--config-dir",
+            job.config_dir,
+            "--work-dir",
+            job.run_dir / "work",
+            "--cert-name",
+            job.cert_name,
+        ]
+        for i in job.domains:
+            command_args.extend(["-d", i.name])
+        if settings.DEBUG:
+            command_args.extend(["--dry-run", "--staging"])
+        return command_args
+
+    def prepare_run_dir(self, job: CertbotJob) -> None:
+        shutil.rmtree(job.run_dir, ignore_errors=True)
+        job.spool_dir.mkdir(parents=True)
+        # the runs share the acme account, the certificates are kept in the database anyway
+        accounts_dir = pathlib.Path(services.get_certbot_paths()["config_dir"]) / "accounts"
+        if accounts_dir.is_dir():
+            shutil.copytree(accounts_dir, job.config_dir / "accounts")
+        else:
+            job.config_dir.mkdir()
+
+    async def _run_job(self, job: CertbotJob, semaphore: asyncio.Semaphore, ready_jobs: asyncio.Queue):
+        async with semaphore:
+            job.add_timing("queued", time.monotonic() - job.created_at)
+            try:
+                self.prepare_run_dir(job)
+                t0 = time.monotonic()
+                process = await asyncio.create_subprocess_exec(
+                    *self.get_command_args(job), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+                )
+                watcher = asyncio.create_task(self._watch_spool(job, ready_jobs, started_at=t0))
+                try:
+                    stdout, stderr = await asyncio.wait_for(process.communicate(), CERTBOT_TIMEOUT)
+                except asyncio.TimeoutError:
+                    process.kill()
+                    stdout, stderr = await process.communicate()
+                    stderr += f"\ntimed out after {CERTBOT_TIMEOUT} seconds".encode()
+                finally:
+                    watcher.cancel()
+                job.add_timing("certbot", time.monotonic() - t0)
+
+                t0 = time.monotonic()
+                await self._cleanup(job)
+                job.add_timing("cleanup", time.monotonic() - t0)
+
+                await sync_to_async(self.finish_job)(
+                    job, process.returncode, stdout.decode("utf-8"), stderr.decode("utf-8")
+                )
+            except Exception as e:
+                logger.exception(f"certbot run of {job.cert_name} failed")
+                await sync_to_async(self.fail_job)(job, f"error: {e}")
+            finally:
+                shutil.rmtree(job.run_dir, ignore_errors=True)
+
+    async def _watch_spool(self, job: CertbotJob, ready_jobs: asyncio.Queue, started_at: float):
+        """waits for the last challenge of the run, the hooks of the others do not wait"""
+        while True:
+            challenges = []
+            for path in job.spool_dir.glob("*.challenge"):
+                challenges.append(json.loads(path.read_text()))
+            if any(i["remaining"] == 0 for i in challenges):
+                break
+            await asyncio.sleep(SPOOL_POLL_INTERVAL)
+        job.challenges = [Challenge(domain=i["domain"], validation=i["validation"]) for i in challenges]
+        job.add_timing("challenges", time.monotonic() - started_at)
+        ready_jobs.put_nowait(job)
+
+    async def _batch_loop(self, ready_jobs: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        batch_tasks = set()
+        try:
+            while True:
+                batch = [await ready_jobs.get()]
+                deadline = loop.time() + BATCH_WINDOW
+                while (timeout := deadline - loop.time()) > 0:
+                    try:
+                        batch.append(await asyncio.wait_for(ready_jobs.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                # the next batch is collected while this one waits for the propagation
+                task = asyncio.create_task(self._publish_batch(batch))
+                batch_tasks.add(task)
+                task.add_done_callback(batch_tasks.discard)
+        finally:
+            for i in batch_tasks:
+                i.cancel()
+
+    async def _publish_batch(self, batch: list[CertbotJob]):
+        failed_jobs: dict[CertbotJob, str] = {}
+        try:
+            t0 = time.monotonic()
+            provider_challenges: dict[int, list[tuple[CertbotJob, Challenge]]] = {}
+            for job in batch:
+                for challenge in job.challenges:
+                    target = job.targets.get(challenge.domain)
+                    if target is None:
+                        failed_jobs[job] = f"error: {challenge.domain} is not a domain of the certificate"
+                        continue
+                    provider_challenges.setdefault(target.dns_provider_id, []).append((job, challenge))
+
+            async def publish_provider(dns_provider_id: int, challenges: list[tuple[CertbotJob, Challenge]]):
+                dns_provider = self.dns_providers[dns_provider_id]
+                provider_semaphore = asyncio.Semaphore(PROVIDER_CONCURRENCY)
+
+                async def create_record(job: CertbotJob, challenge: Challenge):
+                    async with provider_semaphore:
+                        try:
+                            challenge.record_id = await dns_provider.create_record(
+                                base_domain_name=job.targets[challenge.domain].base_domain_name,
+                                name=challenge.txt_name,
+                                content=challenge.validation,
+                                type=dns_prs.RecordType.TXT,
+                                comment=f"certbot issue at {timezone.now()}",
+                            )
+                        except Exception as e:
+                            failed_jobs[job] = f"error: could not create {challenge.txt_name}: {e}"
+
+                await asyncio.gather(*[create_record(job, challenge) for job, challenge in challenges])
+
+            await asyncio.gather(*[publish_provider(k, v) for k, v in provider_challenges.items()])
+            publish_seconds = time.monotonic() - t0
+
+            t0 = time.monotonic()
+            expected_records = {
+                (challenge.txt_name, challenge.validation)
+                for job in batch
+                if job not in failed_jobs
+                for challenge in job.challenges
+            }
+            unverified_records = await self._wait_propagation(expected_records)
+            propagation_seconds = time.monotonic() - t0
+
+            for job in batch:
+                job.add_timing("publish", publish_seconds)
+                job.add_timing("propagation", propagation_seconds)
+                msg = (
+                    f"published {len(job.challenges)} challenges in a batch of {len(batch)} runs, "
+                    f"{publish_seconds:.1f}s publish, {propagation_seconds:.1f}s propagation"
+                )
+                job_records = {(challenge.txt_name, challenge.validation) for challenge in job.challenges}
+                unverified_names = sorted({name for name, value in unverified_records & job_records})
+                if unverified_names:
+                    msg += f", could not verify {','.join(unverified_names)}"
+                if job in failed_jobs:
+                    msg += f", {failed_jobs[job]}"
+                await sync_to_async(job.certificatetask_obj.log)("batch", msg)
+        except Exception as e:
+            logger.exception("publishing a certbot batch failed")
+            for job in batch:
+                failed_jobs.setdefault(job, f"error: {e}")
+        finally:
+            for job in batch:
+                self.write_published(job, failed_jobs.get(job, "ok"))
+
+    async def _wait_propagation(self, expected_records: set[tuple[str, str]]) -> set[tuple[str, str]]:
+        """waits until the resolvers answer all the records, returns the ones that did not show up in time"""
+        pending_records = set(expected_records)
+        if not pending_records:
+            return pending_records
+        await asyncio.sleep(PROPAGATION_FIRST_CHECK_DELAY)
+        resolver = dns.asyncresolver.Resolver(configure=False)
+        resolver.nameservers = list(self.nameservers)
+        t0 = time.monotonic()
+        while True:
+            names = list({name for name, value in pending_records})
+            results = await asyncio.gather(*[self._resolve_txt(resolver, name) for name in names])
+            pending_records -= {(name, value) for name, values in zip(names, results) for value in values}
+            if not pending_records or time.monotonic() - t0 > PROPAGATION_TIMEOUT:
+                return pending_records
+            await asyncio.sleep(PROPAGATION_CHECK_INTERVAL)
+
+    @staticmethod
+    async def _resolve_txt(resolver: dns.asyncresolver.Resolver, name: str) -> list[str]:
+        try:
+            answer = await resolver.resolve(name, "TXT")
+        except dns.exception.DNSException:
+            return []
+        return [txt_value.decode() for dns_result in answer for txt_value in dns_result.strings]
+
+    @staticmethod
+    def write_published(job: CertbotJob, result: str) -> None:
+        tmp_path = job.spool_dir / f"{certbot_hook.PUBLISHED_FILE_NAME}.tmp"
+        try:
+            tmp_path.write_text(result)
+            tmp_path.rename(job.spool_dir / certbot_hook.PUBLISHED_FILE_NAME)
+        except FileNotFoundError:
+            # the run is already over
+            pass
+
+    async def _cleanup(self, job: CertbotJob):
+        async def delete_record(challenge: Challenge):
+            target = job.targets[challenge.domain]
+            try:
+                await self.dns_providers[target.dns_provider_id].delete_record(
+                    base_domain_name=target.base_domain_name, record_id=challenge.record_id
+                )
+            except Exception as e:
+                await sync_to_async(job.certificatetask_obj.log)(
+                    "cleanup", f"could not delete {challenge.txt_name}: {e}"
+                )
+
+        await asyncio.gather(*[delete_record(i) for i in job.challenges if i.record_id])
+
+    def finish_job(self, job: CertbotJob, returncode: int, certbot_res: str, certbot_err: str) -> None:
+        certificatetask_obj = job.certificatetask_obj
+        certificatetask_obj.log("final", "certbot_res: " + certbot_res)
+        certificatetask_obj.log("final", "certbot_err: " + certbot_err)
+        if returncode != 0:
+            self.fail_job(job, f"certbot exited with {returncode}")
+            return
+        if settings.DEBUG:
+            certificatetask_obj.log("final", "dry run, nothing to save")
+            certificatetask_obj.is_success = True
+            certificatetask_obj.is_closed = True
+            self.save_timings(job)
+            return
+        certbot_cert_dir = services.get_certbot_cert_dir(job.cert_name, config_dir=job.config_dir)
+        if certbot_cert_dir is None:
+            self.fail_job(job, "certbot_cert_dir not found")
+            return
+
+        t0 = time.monotonic()
+        if job.certbotinfo_obj is None:
+            services.save_certbot_issue(
+                certificatetask_obj=certificatetask_obj,
+                certbotinfo_uuid=certificatetask_obj.certbot_info_uuid,
+                cert_name=job.cert_name,
+                domains=job.domains,
+                certbot_cert_dir=certbot_cert_dir,
+            )
+        else:
+            services.save_certbot_renewal(
+                certificatetask_obj=certificatetask_obj,
+                certbotinfo_obj=job.certbotinfo_obj,
+                domains=job.domains,
+                certbot_cert_dir=certbot_cert_dir,
+            )
+        job.add_timing("store", time.monotonic() - t0)
+        self.save_timings(job)
+
+    def fail_job(self, job: CertbotJob, msg: str) -> None:
+        certificatetask_obj = job.certificatetask_obj
+        certificatetask_obj.log("final", msg)
+        certificatetask_obj.is_success = False
+        certificatetask_obj.is_closed = True
+        self.save_timings(job)
+
+    @staticmethod
+    def save_timings(job: CertbotJob) -> None:
+        job.certificatetask_obj.phase_timings = job.phase_timings
+        job.certificatetask_obj.save()
+        for phase, seconds in job.phase_timings.items():
+            metrics.certbot_phase_duration.record(seconds, attributes={"phase": phase})
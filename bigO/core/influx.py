@@ -0,0 +1,189 @@
+import atexit
+import datetime
+import decimal
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import influxdb_client
+import sentry_sdk
+import urllib3
+from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client.domain.write_precision import WritePrecision
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+WRITER_BATCH_SIZE = 5_000
+WRITER_FLUSH_INTERVAL = 10  # seconds
+WRITER_MAX_QUEUE_LENGTH = 200_000
+WRITER_CLOSE_WAIT = 30  # seconds
+
+
+def _escape_key(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ").replace("\n", "\\n")
+
+
+def _escape_measurement(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace(" ", "\\ ").replace("\n", "\\n")
+
+
+def _escape_string_field(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+class InfluxPoint:
+    """
+    a light replacement of influxdb_client.Point with the same tag/field/time interface
+    that renders the line protocol directly
+    """
+
+    __slots__ = ("_measurement", "_tags", "_fields", "_time")
+
+    def __init__(self, measurement: str):
+        self._measurement = measurement
+        self._tags: dict[str, str] = {}
+        self._fields: dict[str, str] = {}
+        self._time: int | None = None
+
+    def tag(self, key: str, value) -> "InfluxPoint":
+        self._tags[key] = value
+        return self
+
+    def field(self, key: str, value) -> "InfluxPoint":
+        if value is None:
+            return self
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        elif isinstance(value, int):
+            value = f"{value}i"
+        elif isinstance(value, float):
+            value = repr(value)
+        elif isinstance(value, decimal.Decimal):
+            value = f"{value:f}"
+        else:
+            value = f'"{_escape_string_field(str(value))}"'
+        self._fields[key] = value
+        return self
+
+    def time(self, time_: datetime.datetime | int, write_precision=None) -> "InfluxPoint":
+        """the time is always written with seconds precision"""
+        if isinstance(time_, datetime.datetime):
+            time_ = int(time_.timestamp())
+        self._time = time_
+        return self
+
+    def to_line_protocol(self) -> str:
+        if not self._fields:
+            return ""
+        tags = "".join(
+            f",{_escape_key(k)}={_escape_key(str(v))}"
+            for k, v in sorted(self._tags.items())
+            if k and v is not None and v != ""
+        )
+        fields = ",".join(f"{_escape_key(k)}={v}" for k, v in self._fields.items())
+        line = f"{_escape_measurement(self._measurement)}{tags} {fields}"
+        if self._time is not None:
+            line = f"{line} {self._time}"
+        return line
+
+
+class InfluxWriter:
+    """
+    process wide buffer of line protocol records flushed by a background thread,
+    so batching spans task invocations and the http connections are reused
+    """
+
+    def __init__(self):
+        self._client = influxdb_client.InfluxDBClient(
+            url=settings.INFLUX_URL,
+            token=settings.INFLUX_TOKEN,
+            org=settings.INFLUX_ORG,
+            retries=urllib3.Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504]),
+            connection_pool_maxsize=4,
+        )
+        self._write_api = self._client.write_api(write_options=SYNCHRONOUS)
+        self._queue: deque[str] = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="influx-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, points: list[InfluxPoint | influxdb_client.Point]) -> int:
+        lines = [line for point in points if (line := point.to_line_protocol())]
+        with self._lock:
+            free = WRITER_MAX_QUEUE_LENGTH - len(self._queue)
+            if len(lines) > free:
+                dropped = len(lines) - max(free, 0)
+                lines = lines[: max(free, 0)]
+                logger.warning(f"influx writer buffer is full, dropping {dropped} lines")
+                metrics.influx_writer_dropped_counter.add(dropped, attributes={"reason": "full"})
+            self._queue.extend(lines)
+            queue_length = len(self._queue)
+        metrics.influx_writer_queue_depth.add(len(lines))
+        if queue_length >= WRITER_BATCH_SIZE:
+            self._wakeup.set()
+        return len(lines)
+
+    def _pop_batch(self) -> list[str]:
+        with self._lock:
+            batch = [self._queue.popleft() for _ in range(min(WRITER_BATCH_SIZE, len(self._queue)))]
+        metrics.influx_writer_queue_depth.add(-len(batch))
+        return batch
+
+    def flush(self) -> None:
+        while batch := self._pop_batch():
+            start = time.perf_counter()
+            try:
+                self._write_api.write(
+                    settings.INFLUX_BUCKET, settings.INFLUX_ORG, batch, write_precision=WritePrecision.S
+                )
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+                metrics.influx_writer_dropped_counter.add(len(batch), attributes={"reason": "failed"})
+            finally:
+                metrics.influx_writer_flush_duration.record(time.perf_counter() - start)
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(WRITER_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(WRITER_CLOSE_WAIT)
+        self.flush()
+        self._client.close()
+
+
+_writer: InfluxWriter | None = None
+_writer_pid: int | None = None
+_writer_lock = threading.Lock()
+
+
+def get_influx_writer() -> InfluxWriter:
+    """the writer of the current process, a forked child gets its own one"""
+    global _writer, _writer_pid
+    pid = os.getpid()
+    if _writer is None or _writer_pid != pid:
+        with _writer_lock:
+            if _writer is None or _writer_pid != pid:
+                _writer = InfluxWriter()
+                _writer_pid = pid
+    return _writer
+
+
+@atexit.register
+def close_influx_writer() -> None:
+    if _writer is not None and _writer_pid == os.getpid():
+        _writer.close()
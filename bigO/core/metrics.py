@@ -0,0 +1,24 @@
+from opentelemetry import metrics
+
+meter = metrics.get_meter("core")
+
+influx_writer_queue_depth = meter.create_up_down_counter(
+    name="influx.writer.queue_depth",
+    unit="1",
+    description="Number of influx lines waiting in the process wide writer buffer",
+)
+influx_writer_flush_duration = meter.create_histogram(
+    name="influx.writer.flush.duration",
+    unit="s",
+    description="Duration of writing one batch of lines to influx",
+)
+influx_writer_dropped_counter = meter.create_counter(
+    name="influx.writer.dropped",
+    unit="1",
+    description="Number of influx lines dropped since the buffer is full or the write failed",
+)
+certbot_phase_duration = meter.create_histogram(
+    name="certbot.phase.duration",
+    unit="s",
+    description="Duration of each phase of the batched certbot runs",
+)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_siteconfiguration_notif_telegram_bot"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="certificatetask",
+            name="phase_timings",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -205,6 +205,8 @@ class CertificateTask(TimeStampedModel, models.Model):
     logs = models.TextField(blank=True)
     is_closed = models.BooleanField()
     is_success = models.BooleanField(null=True, blank=True)
+    # seconds spent in each phase of a batched certbot run, like {"certbot": 52.1, "propagation": 21.3}
+    phase_timings = models.JSONField(null=True, blank=True)
 
     def log(self, name: str, msg: str):
         self.logs = self.logs or ""
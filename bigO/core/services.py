@@ -41,10 +41,13 @@ def get_certbot_paths() -> CertbotPaths:
     }
 
 
-def get_certbot_cert_dir(cert_name) -> pathlib.Path | None:
-    certbot_config_dir = get_certbot_paths()["config_dir"]
+def get_certbot_cert_dir(cert_name, config_dir: pathlib.Path | None = None) -> pathlib.Path | None:
+    certbot_config_dir = config_dir or get_certbot_paths()["config_dir"]
     certbot_cert_dir = None
-    for i in pathlib.Path(certbot_config_dir, "live").iterdir():
+    live_dir = pathlib.Path(certbot_config_dir, "live")
+    if not live_dir.is_dir():
+        return None
+    for i in live_dir.iterdir():
         if not i.is_dir() or i.name != cert_name:
             continue
         certbot_cert_dir = i
@@ -138,66 +141,13 @@ def certbot_init_new(domains: list[models.Domain]) -> tuple[bool, str]:
         certificatetask_obj.save()
         return False, certbot_res
 
-    private_key_content = certbot_cert_dir.joinpath("privkey.pem").read_bytes()
-    cert_content = certbot_cert_dir.joinpath("cert.pem").read_bytes()
-    parent_cert_content = certbot_cert_dir.joinpath("chain.pem").read_bytes()
-
-    private_key = serialization.load_pem_private_key(
-        private_key_content,
-        password=None,
+    save_certbot_issue(
+        certificatetask_obj=certificatetask_obj,
+        certbotinfo_uuid=future_certbotinfo_uuid,
+        cert_name=cert_name,
+        domains=domains,
+        certbot_cert_dir=certbot_cert_dir,
     )
-    cert = x509.load_pem_x509_certificate(cert_content)
-    parent_cert = x509.load_pem_x509_certificate(parent_cert_content)
-
-    if isinstance(private_key, rsa.RSAPrivateKey):
-        algorithm = models.AbstractCryptographicObject.AlgorithmChoices.RSA
-    elif isinstance(private_key, ec.EllipticCurvePrivateKey):
-        algorithm = models.AbstractCryptographicObject.AlgorithmChoices.ECDSA
-    else:
-        raise NotImplementedError
-
-    parent_certificate_obj = models.Certificate()
-    parent_certificate_obj.algorithm = algorithm
-    parent_certificate_obj.content = parent_cert_content.decode()
-    parent_certificate_obj.slug = slugify(cert_name + "_chain_cert" + f"_{certificatetask_obj.id}")
-    parent_certificate_obj.fingerprint = parent_cert.fingerprint(hashes.SHA256()).hex()
-    parent_certificate_obj.valid_from = parent_cert.not_valid_before_utc
-    parent_certificate_obj.valid_to = parent_cert.not_valid_after_utc
-
-    privatekey_obj = models.PrivateKey()
-    privatekey_obj.algorithm = algorithm
-    privatekey_obj.content = private_key_content.decode()
-    privatekey_obj.slug = slugify(cert_name + f"_{certificatetask_obj.id}")
-    privatekey_obj.key_length = private_key.key_size
-
-    certbotinfo_obj = models.CertbotInfo()
-    certbotinfo_obj.uuid = future_certbotinfo_uuid
-    certbotinfo_obj.cert_name = cert_name
-
-    certificate_obj = models.Certificate()
-    certificate_obj.private_key = privatekey_obj
-    certificate_obj.parent_certificate = parent_certificate_obj
-    certificate_obj.algorithm = algorithm
-    certificate_obj.content = cert_content.decode()
-    certificate_obj.slug = cert_name + "_cert" + f"_{certificatetask_obj.id}"
-    certificate_obj.fingerprint = cert.fingerprint(hashes.SHA256()).hex()
-    certificate_obj.valid_from = cert.not_valid_before_utc
-    certificate_obj.valid_to = cert.not_valid_after_utc
-    certificate_obj.certbot_info = certbotinfo_obj
-
-    with transaction.atomic(using="main"):
-        parent_certificate_obj.save()
-        privatekey_obj.save()
-        certbotinfo_obj.save()
-        certificate_obj.save()
-        for i in domains:
-            domaincertificate_obj = models.DomainCertificate()
-            domaincertificate_obj.domain = i
-            domaincertificate_obj.certificate = certificate_obj
-            domaincertificate_obj.save()
-        certificatetask_obj.is_success = True
-        certificatetask_obj.is_closed = True
-        certificatetask_obj.save()
     return True, certbot_res
 
 
@@ -291,6 +241,92 @@ def certbot_init_renew(certbotinfo_obj: models.CertbotInfo) -> tuple[bool, str]:
         certificatetask_obj.save()
         return False, certbot_res
 
+    save_certbot_renewal(
+        certificatetask_obj=certificatetask_obj,
+        certbotinfo_obj=certbotinfo_obj,
+        domains=domains,
+        certbot_cert_dir=certbot_cert_dir,
+    )
+    return True, certbot_res
+
+
+def save_certbot_issue(
+    certificatetask_obj: models.CertificateTask,
+    certbotinfo_uuid: uuid.UUID,
+    cert_name: str,
+    domains: list[models.Domain],
+    certbot_cert_dir: pathlib.Path,
+) -> models.Certificate:
+    private_key_content = certbot_cert_dir.joinpath("privkey.pem").read_bytes()
+    cert_content = certbot_cert_dir.joinpath("cert.pem").read_bytes()
+    parent_cert_content = certbot_cert_dir.joinpath("chain.pem").read_bytes()
+
+    private_key = serialization.load_pem_private_key(
+        private_key_content,
+        password=None,
+    )
+    cert = x509.load_pem_x509_certificate(cert_content)
+    parent_cert = x509.load_pem_x509_certificate(parent_cert_content)
+
+    if isinstance(private_key, rsa.RSAPrivateKey):
+        algorithm = models.AbstractCryptographicObject.AlgorithmChoices.RSA
+    elif isinstance(private_key, ec.EllipticCurvePrivateKey):
+        algorithm = models.AbstractCryptographicObject.AlgorithmChoices.ECDSA
+    else:
+        raise NotImplementedError
+
+    parent_certificate_obj = models.Certificate()
+    parent_certificate_obj.algorithm = algorithm
+    parent_certificate_obj.content = parent_cert_content.decode()
+    parent_certificate_obj.slug = slugify(cert_name + "_chain_cert" + f"_{certificatetask_obj.id}")
+    parent_certificate_obj.fingerprint = parent_cert.fingerprint(hashes.SHA256()).hex()
+    parent_certificate_obj.valid_from = parent_cert.not_valid_before_utc
+    parent_certificate_obj.valid_to = parent_cert.not_valid_after_utc
+
+    privatekey_obj = models.PrivateKey()
+    privatekey_obj.algorithm = algorithm
+    privatekey_obj.content = private_key_content.decode()
+    privatekey_obj.slug = slugify(cert_name + f"_{certificatetask_obj.id}")
+    privatekey_obj.key_length = private_key.key_size
+
+    certbotinfo_obj = models.CertbotInfo()
+    certbotinfo_obj.uuid = certbotinfo_uuid
+    certbotinfo_obj.cert_name = cert_name
+
+    certificate_obj = models.Certificate()
+    certificate_obj.private_key = privatekey_obj
+    certificate_obj.parent_certificate = parent_certificate_obj
+    certificate_obj.algorithm = algorithm
+    certificate_obj.content = cert_content.decode()
+    certificate_obj.slug = cert_name + "_cert" + f"_{certificatetask_obj.id}"
+    certificate_obj.fingerprint = cert.fingerprint(hashes.SHA256()).hex()
+    certificate_obj.valid_from = cert.not_valid_before_utc
+    certificate_obj.valid_to = cert.not_valid_after_utc
+    certificate_obj.certbot_info = certbotinfo_obj
+
+    with transaction.atomic(using="main"):
+        parent_certificate_obj.save()
+        privatekey_obj.save()
+        certbotinfo_obj.save()
+        certificate_obj.save()
+        for i in domains:
+            domaincertificate_obj = models.DomainCertificate()
+            domaincertificate_obj.domain = i
+            domaincertificate_obj.certificate = certificate_obj
+            domaincertificate_obj.save()
+        certificatetask_obj.is_success = True
+        certificatetask_obj.is_closed = True
+        certificatetask_obj.save()
+    return certificate_obj
+
+
+def save_certbot_renewal(
+    certificatetask_obj: models.CertificateTask,
+    certbotinfo_obj: models.CertbotInfo,
+    domains: list[models.Domain],
+    certbot_cert_dir: pathlib.Path,
+) -> models.Certificate:
+    cert_name = certbotinfo_obj.cert_name
     private_key_content = certbot_cert_dir.joinpath("privkey.pem").read_bytes()
     cert_content = certbot_cert_dir.joinpath("cert.pem").read_bytes()
     parent_cert_content = certbot_cert_dir.joinpath("chain.pem").read_bytes()
@@ -365,7 +401,7 @@ def certbot_init_renew(certbotinfo_obj: models.CertbotInfo) -> tuple[bool, str]:
         certificatetask_obj.is_success = True
         certificatetask_obj.is_closed = True
         certificatetask_obj.save()
-    return True, certbot_res
+    return certificate_obj
 
 
 def get_certbot_current_renew_task(certbotinfo_obj: models.CertbotInfo) -> models.CertificateTask | None:
@@ -1,6 +1,10 @@
+from datetime import timedelta
+
 from config.celery_app import app as celery_app
+from django.utils import timezone
 
 from . import models, services
+from .certbot_orchestrator import CertbotOrchestrator
 
 
 @celery_app.task(soft_time_limit=15 * 60, time_limit=16 * 60)
@@ -15,3 +19,27 @@ def certbot_renew_certificates(certbotinfo_id: int):
     certbotinfo_obj = models.CertbotInfo.objects.get(id=certbotinfo_id)
     is_success, certbot_res = services.certbot_init_renew(certbotinfo_obj=certbotinfo_obj)
     return is_success, certbot_res
+
+
+@celery_app.task(soft_time_limit=3 * 60 * 60, time_limit=3 * 60 * 60 + 60)
+def issue_certificates_for_domains(domain_ids: list[int]):
+    orchestrator = CertbotOrchestrator()
+    for domain_obj in models.Domain.objects.filter(id__in=domain_ids):
+        orchestrator.add_issue(domains=[domain_obj])
+    jobs = orchestrator.run()
+    return {i.cert_name: i.certificatetask_obj.is_success for i in jobs}
+
+
+@celery_app.task(soft_time_limit=3 * 60 * 60, time_limit=3 * 60 * 60 + 60)
+def certbot_renew_certificates_batch(certbotinfo_ids: list[int] | None = None, due_days: int = 30):
+    """renews the given ones, or the ones that expire in the next due_days"""
+    certbotinfo_qs = models.CertbotInfo.objects.ann_valid_to()
+    if certbotinfo_ids is None:
+        certbotinfo_qs = certbotinfo_qs.filter(valid_to__lt=timezone.now() + timedelta(days=due_days))
+    else:
+        certbotinfo_qs = certbotinfo_qs.filter(id__in=certbotinfo_ids)
+    orchestrator = CertbotOrchestrator()
+    for certbotinfo_obj in certbotinfo_qs:
+        orchestrator.add_renewal(certbotinfo_obj=certbotinfo_obj)
+    jobs = orchestrator.run()
+    return {i.cert_name: i.certificatetask_obj.is_success for i in jobs}
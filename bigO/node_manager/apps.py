@@ -0,0 +1,19 @@
+from django.apps import AppConfig
+
+
+class NodeManagerConfig(AppConfig):
+    name = "bigO.node_manager"
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+
+        from . import models, permissions, services
+
+        post_save.connect(services.template_owner_changed, dispatch_uid=f"template_owner_saved_{self.name}")
+        post_delete.connect(services.template_owner_changed, dispatch_uid=f"template_owner_deleted_{self.name}")
+        post_save.connect(
+            permissions.node_api_key_changed, sender=models.NodeAPIKey, dispatch_uid=f"api_key_saved_{self.name}"
+        )
+        post_delete.connect(
+            permissions.node_api_key_changed, sender=models.NodeAPIKey, dispatch_uid=f"api_key_deleted_{self.name}"
+        )
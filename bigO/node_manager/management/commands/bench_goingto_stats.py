@@ -0,0 +1,89 @@
+import json
+import pathlib
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from ... import stats_ingestion, typing
+
+USER_TRAFFIC_REGEX = r"user>>>period(\d+)\.profile(\d+)[^>]+>>>traffic>>>(downlink|uplink)"
+USER_WITH_ID_TRAFFIC_REGEX = r"user>>>period(\d+)\.profile(\d+).user(\d+)[^>]+>>>traffic>>>(downlink|uplink)"
+INTERNAL_USER_TRAFFIC_REGEX = r"user>>>rule(\d+)\.node(\d+)[^>]+>>>traffic>>>(downlink|uplink)"
+INBOUND_TRAFFIC_REGEX = r"inbound>>>([^>]+)>>>traffic>>>(downlink|uplink)"
+OUTBOUND_TRAFFIC_REGEX = r"outbound>>>([^>]+)>>>traffic>>>(downlink|uplink)"
+
+
+def findall_stat_name(name: str):
+    if len(matches := re.findall(USER_TRAFFIC_REGEX, name)) == 1:
+        return matches
+    elif len(matches := re.findall(USER_WITH_ID_TRAFFIC_REGEX, name)) == 1:
+        return matches
+    elif len(matches := re.findall(INTERNAL_USER_TRAFFIC_REGEX, name)) == 1:
+        return matches
+    elif len(matches := re.findall(INBOUND_TRAFFIC_REGEX, name)) == 1:
+        return matches
+    elif len(matches := re.findall(OUTBOUND_TRAFFIC_REGEX, name)) == 1:
+        return matches
+    return None
+
+
+def get_sample_stats(stats_count: int) -> list[dict]:
+    stats = []
+    for i in range(stats_count // 2):
+        if i % 50 == 0:
+            name = f"inbound>>>inbound{i}>>>traffic"
+        elif i % 50 == 1:
+            name = f"outbound>>>outbound{i}>>>traffic"
+        elif i % 50 == 2:
+            name = f"user>>>rule{i}.node{i}@love.com>>>traffic"
+        else:
+            name = f"user>>>period{i}.profile{i}@love.com>>>traffic"
+        stats.append({"name": f"{name}>>>downlink", "value": i + 1})
+        stats.append({"name": f"{name}>>>uplink", "value": i + 1})
+    return stats
+
+
+class Command(BaseCommand):
+    help = "compares the per stat regex scan of goingto traffic reports against the stats_ingestion tokenizer"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stats", type=int, default=50_000)
+        parser.add_argument(
+            "--payload", type=pathlib.Path, default=None, help="a recorded goingto stdout to use instead of samples"
+        )
+
+    def handle(self, *args, **options):
+        if options["payload"]:
+            messages = []
+            for line in options["payload"].read_text().split("\n"):
+                if not line:
+                    continue
+                res = json.loads(line)
+                if res["result_type"] == "xray_raw_traffic_v1":
+                    messages.append(res["msg"])
+        else:
+            messages = [json.dumps({"stats": get_sample_stats(options["stats"])})]
+
+        start = time.perf_counter()
+        stats_count = 0
+        for msg in messages:
+            traffic_res = typing.GoingtoXrayRawTrafficV1JsonOutPut(**json.loads(msg))
+            for stat in traffic_res.stats:
+                if stat.name and stat.value:
+                    findall_stat_name(stat.name)
+                    stats_count += 1
+        findall_duration = time.perf_counter() - start
+
+        stats_ingestion.parse_xray_traffic_stat_name.cache_clear()
+        start = time.perf_counter()
+        for msg in messages:
+            traffic_res = typing.GoingtoXrayRawTrafficV1JsonOutPut.model_validate_json(msg)
+            for stat in traffic_res.stats:
+                if stat.name and stat.value:
+                    stats_ingestion.parse_xray_traffic_stat_name(stat.name)
+        tokenizer_duration = time.perf_counter() - start
+
+        self.stdout.write(f"{stats_count} stats in {len(messages)} reports")
+        for name, duration in (("findall", findall_duration), ("tokenizer", tokenizer_duration)):
+            self.stdout.write(f"{name}: {duration:.3f}s ({duration / max(stats_count, 1) * 1e6:.2f}us/stat)")
@@ -0,0 +1,21 @@
+from opentelemetry import metrics
+
+meter = metrics.get_meter("node_manager")
+
+template_compile_total_counter = meter.create_counter(
+    name="template.compile.total",
+    unit="1",
+    description="Number of template lookups in the compiled template registry, by hit",
+)
+
+loki_spool_dropped_counter = meter.create_counter(
+    name="loki.spool.dropped",
+    unit="1",
+    description="Number of log blobs dropped since the loki spool is full or unavailable",
+)
+
+node_api_key_cache_counter = meter.create_counter(
+    name="node.api_key.cache",
+    unit="1",
+    description="Number of node api key verifications, by the verified key cache result",
+)
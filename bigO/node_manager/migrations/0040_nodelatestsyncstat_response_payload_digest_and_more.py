@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("node_manager", "0039_nodepublicip_is_nat"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="nodelatestsyncstat",
+            name="response_payload_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="nodelatestsyncstat",
+            name="response_payload_digest",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="nodelatestsyncstat",
+            name="response_payload_size",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -909,5 +909,8 @@ class NodeLatestSyncStat(TimeStampedModel, models.Model):
     config = models.JSONField(null=True, blank=True)
     respond_at = models.DateTimeField(null=True, blank=True)
     request_headers = models.JSONField(null=True, blank=True)
-    response_payload = models.JSONField(null=True, blank=True)
+    response_payload = models.JSONField(null=True, blank=True)  # a sampled copy, see response_payload_at
+    response_payload_digest = models.CharField(max_length=64, null=True, blank=True)
+    response_payload_size = models.PositiveIntegerField(null=True, blank=True)
+    response_payload_at = models.DateTimeField(null=True, blank=True)
     ip_a = models.TextField(null=True, blank=True)
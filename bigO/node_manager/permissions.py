@@ -1,10 +1,84 @@
+import datetime
+import hmac
+import threading
+import time
 import typing
+from hashlib import sha256
 
 from rest_framework_api_key.permissions import BaseHasAPIKey
 
+from django.core.cache import cache
+from django.db import transaction
 from django.http import HttpRequest
+from django.utils import timezone
 
-from .models import NodeAPIKey
+from . import metrics
+from .models import Node, NodeAPIKey
+
+VERIFIED_KEY_CACHE_TIMEOUT = 10 * 60
+# other processes only learn about a revoked key after this
+VERIFIED_KEY_LOCAL_CACHE_TIMEOUT = 30
+
+
+class VerifiedAPIKey(typing.NamedTuple):
+    fingerprint: str
+    api_key_id: str
+    node_id: int
+    expiry_date: datetime.datetime | None
+
+
+_local_verified_keys: dict[str, tuple[float, VerifiedAPIKey]] = {}
+_local_verified_keys_lock = threading.Lock()
+
+
+def get_verified_key_cache_key(prefix: str) -> str:
+    return f"node_api_key_verified_{prefix}"
+
+
+def get_verified_key(key: str) -> VerifiedAPIKey | None:
+    """
+    the slow password hash check of get_from_key is done once per key,
+    after that the key is only compared to the sha256 fingerprint of the verified one
+    """
+    prefix, _, _ = key.partition(".")
+    fingerprint = sha256(key.encode("utf-8")).hexdigest()
+    with _local_verified_keys_lock:
+        local = _local_verified_keys.get(prefix)
+    if local and local[0] > time.monotonic() and hmac.compare_digest(local[1].fingerprint, fingerprint):
+        metrics.node_api_key_cache_counter.add(1, attributes={"result": "local_hit"})
+        return local[1]
+
+    verified_key: VerifiedAPIKey | None = cache.get(get_verified_key_cache_key(prefix))
+    if verified_key is not None and hmac.compare_digest(verified_key.fingerprint, fingerprint):
+        metrics.node_api_key_cache_counter.add(1, attributes={"result": "hit"})
+    else:
+        metrics.node_api_key_cache_counter.add(1, attributes={"result": "miss"})
+        try:
+            api_key = NodeAPIKey.objects.get_from_key(key)
+        except NodeAPIKey.DoesNotExist:
+            return None
+        verified_key = VerifiedAPIKey(
+            fingerprint=fingerprint, api_key_id=api_key.id, node_id=api_key.node_id, expiry_date=api_key.expiry_date
+        )
+        cache.set(get_verified_key_cache_key(prefix), verified_key, VERIFIED_KEY_CACHE_TIMEOUT)
+    with _local_verified_keys_lock:
+        _local_verified_keys[prefix] = (time.monotonic() + VERIFIED_KEY_LOCAL_CACHE_TIMEOUT, verified_key)
+    return verified_key
+
+
+def invalidate_verified_key(prefix: str) -> None:
+    cache.delete(get_verified_key_cache_key(prefix))
+    with _local_verified_keys_lock:
+        _local_verified_keys.pop(prefix, None)
+
+
+def node_api_key_changed(sender, instance, using: str, **kwargs):
+    # revoked, expiry changed or deleted
+    if sender is NodeAPIKey:
+        prefix = instance.prefix
+        invalidate_verified_key(prefix)
+        # a concurrent request may cache the old row again until the change is committed
+        transaction.on_commit(lambda: invalidate_verified_key(prefix), using=using)
 
 
 class HasNodeAPIKey(BaseHasAPIKey):
@@ -12,20 +86,30 @@ class HasNodeAPIKey(BaseHasAPIKey):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.api_key: NodeAPIKey | None = None
+        self.verified_key: VerifiedAPIKey | None = None
+        self.node_id: int | None = None
         self.had_permission: bool | None = None
 
+    @property
+    def api_key(self) -> NodeAPIKey | None:
+        if self.verified_key is None:
+            return None
+        return self.model.objects.get(id=self.verified_key.api_key_id)
+
+    def get_node(self) -> Node:
+        return Node.objects.get(id=self.node_id)
+
     def has_permission(self, request: HttpRequest, view: typing.Any) -> bool:
         key = self.get_key(request)
         self.had_permission = False
         if not key:
             return False
-        try:
-            api_key = self.model.objects.get_from_key(key)
-        except self.model.DoesNotExist:
+        verified_key = get_verified_key(key)
+        if verified_key is None:
             return False
-        self.api_key = api_key
-        if api_key.has_expired:
+        self.verified_key = verified_key
+        self.node_id = verified_key.node_id
+        if verified_key.expiry_date is not None and verified_key.expiry_date < timezone.now():
             return False
         self.had_permission = True
         return True
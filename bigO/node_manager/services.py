@@ -1,23 +1,30 @@
 import datetime
+import gzip
 import ipaddress
 import json
 import logging
 import pathlib
 import random
 import re
+import threading
 import tomllib
 import zoneinfo
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from collections.abc import Callable, Iterator
 from datetime import timedelta
 from hashlib import sha256
 from typing import TypedDict
 
 import pydantic
+import redis.exceptions
 import sentry_sdk
 from asgiref.sync import sync_to_async
+from django_redis import get_redis_connection
 
+import bigO.utils.blobs
+import bigO.utils.dependency_versions
 import bigO.utils.py_helpers
+import django.db.models
 import django.template
 from bigO.core import models as core_models
 from bigO.core import services as core_services
@@ -30,7 +37,7 @@ from django.http import HttpHeaders
 from django.urls import reverse
 from django.utils import timezone
 
-from . import models, tasks, typing
+from . import metrics, models, tasks, typing
 from .typing import FileSchema
 
 logger = logging.getLogger(__name__)
@@ -92,12 +99,76 @@ class ProcessConf(metaclass=bigO.utils.py_helpers.Singleton):
 process_conf = ProcessConf()
 
 
+class TemplateRegistry(metaclass=bigO.utils.py_helpers.Singleton):
+    """compiled templates by (model label, pk, field, template hash), the ones of an object are dropped when saved"""
+
+    max_size = 4096
+
+    def __init__(self):
+        self._templates: OrderedDict[tuple, django.template.Template] = OrderedDict()
+        self._owner_keys: dict[tuple, set[tuple]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self, template: str, obj: django.db.models.Model | None = None, field: str | None = None
+    ) -> django.template.Template:
+        template_hash = sha256(template.encode("utf-8")).hexdigest()
+        owner = (obj._meta.label, obj.pk) if obj is not None else (None, None)
+        key = (*owner, field, template_hash)
+        with self._lock:
+            compiled = self._templates.get(key)
+            if compiled is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+        if compiled is not None:
+            metrics.template_compile_total_counter.add(1, attributes={"hit": True})
+            return compiled
+
+        compiled = django.template.Template(template)
+        with self._lock:
+            self._templates[key] = compiled
+            self._owner_keys[owner].add(key)
+            while len(self._templates) > self.max_size:
+                evicted_key, _ = self._templates.popitem(last=False)
+                self._discard_owner_key(evicted_key)
+            self.misses += 1
+        metrics.template_compile_total_counter.add(1, attributes={"hit": False})
+        return compiled
+
+    def _discard_owner_key(self, key: tuple) -> None:
+        owner = key[:2]
+        owner_keys = self._owner_keys.get(owner)
+        if owner_keys is not None:
+            owner_keys.discard(key)
+            if not owner_keys:
+                del self._owner_keys[owner]
+
+    def invalidate(self, label: str, pk) -> None:
+        with self._lock:
+            for key in self._owner_keys.pop((label, pk), set()):
+                self._templates.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._templates.clear()
+            self._owner_keys.clear()
+
+
+template_registry = TemplateRegistry()
+
+
+def template_owner_changed(sender, instance, **kwargs) -> None:
+    """post_save and post_delete receiver"""
+    template_registry.invalidate(label=sender._meta.label, pk=instance.pk)
+
+
 def node_spec_create(*, node: models.Node, node_sync_stat_obj: models.NodeLatestSyncStat, ip_a: str):
     """
     makes decisions based on the node current state(spec)
     """
-    node_sync_stat_obj.ip_a = ip_a
-    node_sync_stat_obj.save()
+    set_node_sync_stat_field(node_sync_stat_obj, "ip_a", ip_a)
     if container_spec := node.container_spec:
         if ipv4_extractor := node.container_spec.ip_a_container_ipv4_extractor:
             res = ipv4_extractor.extract(ip_a)
@@ -246,42 +317,54 @@ def node_process_stats(
             and i.stdout.bytes
             and getattr(settings, "INFLUX_URL", False)
         ):
-            tasks.telegraf_to_influx_send.delay(telegraf_json_lines=i.stdout.bytes, base_labels=base_labels)
+            bigO.utils.blobs.delay_with_blob(
+                tasks.telegraf_to_influx_send, "telegraf_json_lines", i.stdout.bytes, base_labels=base_labels
+            )
         elif service_name == "goingto_conf" and i.stdout.bytes and getattr(settings, "INFLUX_URL", False):
-            handle_goingto = tasks.handle_goingto if settings.DEBUG else tasks.handle_goingto.delay
-            handle_goingto(node_obj.id, goingto_json_lines=i.stdout.bytes, base_labels=base_labels)
+            if settings.DEBUG:
+                tasks.handle_goingto(node_obj.id, goingto_json_lines=i.stdout.bytes, base_labels=base_labels)
+            else:
+                bigO.utils.blobs.delay_with_blob(
+                    tasks.handle_goingto,
+                    "goingto_json_lines",
+                    i.stdout.bytes,
+                    node_id=node_obj.id,
+                    base_labels=base_labels,
+                )
         elif service_name == "netmanager_conf" and i.stdout.bytes:
-            handle_netmanager = tasks.handle_netmanager if settings.DEBUG else tasks.handle_netmanager.delay
-            handle_netmanager(node_obj.id, netmanager_lines=i.stdout.bytes)
+            if settings.DEBUG:
+                tasks.handle_netmanager(node_obj.id, netmanager_lines=i.stdout.bytes)
+            else:
+                bigO.utils.blobs.delay_with_blob(
+                    tasks.handle_netmanager, "netmanager_lines", i.stdout.bytes, node_id=node_obj.id
+                )
         elif service_name == "xray_conf" and i.stderr.bytes and getattr(settings, "INFLUX_URL", False):
-            handle_xray_conf = (
-                proxy_manager_tasks.handle_xray_conf if settings.DEBUG else proxy_manager_tasks.handle_xray_conf.delay
-            )
-            handle_xray_conf(node_obj.id, xray_lines=i.stderr.bytes, base_labels=base_labels)
+            if settings.DEBUG:
+                proxy_manager_tasks.handle_xray_conf(node_obj.id, xray_lines=i.stderr.bytes, base_labels=base_labels)
+            else:
+                bigO.utils.blobs.delay_with_blob(
+                    proxy_manager_tasks.handle_xray_conf,
+                    "xray_lines",
+                    i.stderr.bytes,
+                    node_id=node_obj.id,
+                    base_labels=base_labels,
+                )
         if node_obj.collect_logs and getattr(settings, "LOKI_BASE_ENDPOINT", False):
-            collected_at = i.time
+            collected_at = str(int(i.time.timestamp() * 1e9))
             if send_stderr and i.stderr.bytes:
-                stderr_lines = i.stderr.bytes.split("\n")
                 stream = {
                     **base_labels,
                     "config_name": i.supervisorprocessinfo.name,
                     "captured_at": "stderr",
                 }
-                values = []
-                for stderr_line in stderr_lines:
-                    values.append([str(int(collected_at.timestamp() * 1e9)), stderr_line])
-                streams.append({"stream": stream, "values": values})
+                streams.append({"stream": stream, "collected_at": collected_at, "raw": i.stderr.bytes, "values": None})
             if send_stdout and i.stdout.bytes:
-                stdout_lines = i.stdout.bytes.split("\n")
                 stream = {
                     **base_labels,
                     "config_name": i.supervisorprocessinfo.name,
                     "captured_at": "stdout",
                 }
-                values = []
-                for stdout_line in stdout_lines:
-                    values.append([str(int(collected_at.timestamp() * 1e9)), stdout_line])
-                streams.append({"stream": stream, "values": values})
+                streams.append({"stream": stream, "collected_at": collected_at, "raw": i.stdout.bytes, "values": None})
     if node_obj.collect_logs and getattr(settings, "LOKI_BASE_ENDPOINT", False):
         if smallo1_logs and smallo1_logs.bytes:
             logtime_pattern = r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}"
@@ -301,9 +384,29 @@ def node_process_stats(
                     logger.error(f"cannot match logtime from log line of smallo1 of {node_obj=}; {smallo1_log_line=}")
                     continue
                 values.append([str(int(logged_at.timestamp() * 1e9)), smallo1_log_line])
-            streams.append({"stream": stream, "values": values})
+            streams.append({"stream": stream, "collected_at": None, "raw": None, "values": values})
         if streams:
-            tasks.send_to_loki.delay(streams=streams)
+            spool_loki_streams(streams)
+
+
+def spool_loki_streams(streams: list[typing.LokiSpoolEntry]) -> None:
+    """appends the compressed blobs to the loki spool to be shipped by tasks.ship_loki_spool"""
+    try:
+        redis_conn = get_redis_connection("default")
+        if redis_conn.llen(tasks.LOKI_SPOOL_KEY) >= settings.LOKI_SPOOL_MAX_LENGTH:
+            # backpressure, the shipper is behind
+            logger.warning(f"loki spool is full, dropping {len(streams)} log blobs")
+            metrics.loki_spool_dropped_counter.add(len(streams), attributes={"reason": "full"})
+            return
+        redis_conn.rpush(
+            tasks.LOKI_SPOOL_KEY, *[gzip.compress(json.dumps(i).encode("utf-8"), compresslevel=1) for i in streams]
+        )
+    except redis.exceptions.RedisError as e:
+        sentry_sdk.capture_exception(e)
+        metrics.loki_spool_dropped_counter.add(len(streams), attributes={"reason": "unavailable"})
+        return
+    if cache.add("loki_spool_ship_kick", 1, timeout=5):
+        tasks.ship_loki_spool.delay()
 
 
 def get_easytier_to_node_ips(*, source_node: models.Node, dest_node_id: int) -> list[ipaddress.IPv4Address]:
@@ -323,23 +426,41 @@ def get_easytier_to_node_ips(*, source_node: models.Node, dest_node_id: int) ->
     return res
 
 
+# the full response payload is only kept when it changes or once in this interval
+NODE_SYNC_STAT_PAYLOAD_SAMPLE_INTERVAL = timedelta(minutes=10)
+
+
+def set_node_sync_stat_field(obj: models.NodeLatestSyncStat, name: str, value) -> None:
+    if obj.pk and getattr(obj, name) == value:
+        return
+    setattr(obj, name, value)
+    obj._changed_fields = getattr(obj, "_changed_fields", set()) | {name}
+
+
+def save_node_sync_stat(obj: models.NodeLatestSyncStat) -> None:
+    """the single write of a sync request, only the changed fields are updated"""
+    if obj.pk is None:
+        obj.save()
+    elif changed_fields := getattr(obj, "_changed_fields", None):
+        obj.save(update_fields=[*changed_fields, "updated_at"])
+    obj._changed_fields = set()
+
+
 def create_node_sync_stat(request_headers: HttpHeaders, node: models.Node) -> models.NodeLatestSyncStat:
+    """the changes are kept in memory until save_node_sync_stat"""
     try:
         obj = models.NodeLatestSyncStat.objects.get(node=node)
     except models.NodeLatestSyncStat.DoesNotExist:
         obj = models.NodeLatestSyncStat(node=node)
-    obj.request_headers = dict(request_headers)
-    obj.initiated_at = timezone.now()
-    obj.agent_spec = request_headers.get("user-agent", "")[:200]
-    obj.response_payload = None
-    obj.respond_at = None
+    set_node_sync_stat_field(obj, "request_headers", dict(request_headers))
+    set_node_sync_stat_field(obj, "initiated_at", timezone.now())
+    set_node_sync_stat_field(obj, "agent_spec", request_headers.get("user-agent", "")[:200])
+    set_node_sync_stat_field(obj, "respond_at", None)
     if obj.pk:
         count_up_to_now = obj.count_up_to_now + 1
     else:
         count_up_to_now = 1
-    obj.count_up_to_now = count_up_to_now
-
-    obj.save()
+    set_node_sync_stat_field(obj, "count_up_to_now", count_up_to_now)
     return obj
 
 
@@ -352,16 +473,77 @@ def node_sync_stat_config(obj: models.NodeLatestSyncStat, config: typing.ConfigS
             delete_node_config_to(obj.node)
         else:
             result = config_to
-    obj.config = json.loads(config.model_dump_json())
-    obj.save()
+    set_node_sync_stat_field(obj, "config", json.loads(config.model_dump_json()))
     return result
 
 
-def complete_node_sync_stat(obj: models.NodeLatestSyncStat, response_payload: dict) -> None:
-    obj.response_payload = response_payload
-    obj.respond_at = timezone.now()
+def complete_node_sync_stat(obj: models.NodeLatestSyncStat, response_payload: dict | str | None) -> None:
+    """response_payload can be the already serialized json, None is for a not modified response"""
+    now = timezone.now()
+    set_node_sync_stat_field(obj, "respond_at", now)
+    if response_payload is None:
+        return
+    if isinstance(response_payload, str):
+        response_data = response_payload
+    else:
+        response_data = json.dumps(response_payload, sort_keys=True)
+    digest = sha256(response_data.encode("utf-8")).hexdigest()
+    if (
+        digest != obj.response_payload_digest
+        or obj.response_payload_at is None
+        or obj.response_payload_at < now - NODE_SYNC_STAT_PAYLOAD_SAMPLE_INTERVAL
+    ):
+        if isinstance(response_payload, str):
+            response_payload = json.loads(response_payload)
+        set_node_sync_stat_field(obj, "response_payload", response_payload)
+        set_node_sync_stat_field(obj, "response_payload_at", now)
+    set_node_sync_stat_field(obj, "response_payload_digest", digest)
+    set_node_sync_stat_field(obj, "response_payload_size", len(response_data))
+
+
+# the cached bundle hash of a node is trusted until a dependent model changes or the timeout passes
+NODE_BUNDLE_CACHE_TIMEOUT = 60
+# the nodes are answered with 304 while their bundle and this version are unchanged
+node_bundle_version = bigO.utils.dependency_versions.DependencyVersion(
+    key="node_bundle_version",
+    dependent_apps={"core", "net_manager", "node_manager", "proxy_manager"},
+    # saved on every usage sync
+    created_dependent_models={"proxy_manager.SubscriptionPeriod"},
+)
+
+
+def get_bundle_hash(supervisor_config: str, files: list[FileSchema], config: typing.ConfigSchema) -> str:
+    h = sha256()
+    # comments carry timestamps, smallO2 ignores them as well
+    for line in supervisor_config.splitlines():
+        if line.strip().startswith(("#", ";")):
+            continue
+        h.update(line.encode("utf-8") + b"\n")
+    for file in files:
+        h.update(file.model_dump_json().encode("utf-8"))
+    h.update(config.model_dump_json().encode("utf-8"))
+    return h.hexdigest()
+
+
+def get_config_digest(config: typing.ConfigSchema) -> str:
+    return sha256(config.model_dump_json().encode("utf-8")).hexdigest()
+
+
+def set_node_bundle_hash(
+    node: models.Node, version: int, base_url: str, config: typing.ConfigSchema, bundle_hash: str
+) -> None:
+    cache.set(
+        f"node_bundle_{node.id}",
+        (version, base_url, get_config_digest(config), bundle_hash),
+        timeout=NODE_BUNDLE_CACHE_TIMEOUT,
+    )
+
 
-    obj.save()
+def is_node_bundle_unchanged(node: models.Node, base_url: str, config: typing.ConfigSchema, bundle_hash: str) -> bool:
+    cached = cache.get(f"node_bundle_{node.id}")
+    if cached is None:
+        return False
+    return cached == (node_bundle_version.get(), base_url, get_config_digest(config), bundle_hash)
 
 
 def create_default_cert_for_node(node: models.Node) -> core_models.Certificate:
@@ -501,7 +683,9 @@ def get_global_haproxy_conf_v2(
         base_url=base_url,
     )
     haproxy_config_template += "\n"  # fix haproxyerror: Missing LF on last line, file might have been truncated
-    haproxy_config_content = django.template.Template(haproxy_config_template).render(context=template_context)
+    haproxy_config_content = template_registry.get(
+        haproxy_config_template, obj=proxy_manager_config, field="haproxy_config_template"
+    ).render(context=template_context)
 
     haproxy_config_content_hash = sha256(haproxy_config_content.encode("utf-8")).hexdigest()
     haproxy_config_content_file = typing.FileSchema(
@@ -548,7 +732,7 @@ def get_global_nginx_conf_v1(node: models.Node) -> tuple[str, str, dict] | None:
     if not usage:
         return None
 
-    res = django.template.Template(
+    res = template_registry.get(
         """
 user root;
 include /etc/nginx/modules-enabled/*.conf;
@@ -572,7 +756,7 @@ http {
     """
     ).render(django.template.Context({"stream": stream_part, "http": http_part}))
 
-    run_opt = django.template.Template('-c *#path:main#* -g "daemon off;"').render(context=django.template.Context({}))
+    run_opt = template_registry.get('-c *#path:main#* -g "daemon off;"').render(context=django.template.Context({}))
     return run_opt, res, deps
 
 
@@ -644,7 +828,7 @@ def get_global_nginx_conf_v2(
     template_context = NodeTemplateContext(
         {"stream": stream_part, "http": http_part}, node_work_dir=node_work_dir, base_url=base_url
     )
-    config_content = django.template.Template(
+    config_content = template_registry.get(
         """
 user root;
 include /etc/nginx/modules-enabled/*.conf;
@@ -728,7 +912,7 @@ server {
     }
 }
     """
-    result = django.template.Template(cnfg).render(context=django.template.Context(context))
+    result = template_registry.get(cnfg).render(context=django.template.Context(context))
     return result, context.get("deps", {"globals": []})
 
 
@@ -776,7 +960,7 @@ server {
     }
 }
     """
-    cnfg_content = django.template.Template(cnfg).render(context=template_context)
+    cnfg_content = template_registry.get(cnfg).render(context=template_context)
     cnfg_content_hash = sha256(cnfg_content.encode("utf-8")).hexdigest()
 
     cnfg_content_file = typing.FileSchema(
@@ -820,8 +1004,8 @@ def get_telegraf_conf(node: models.Node) -> str | None:
 [[inputs.system]]
 [[inputs.net]]
     """
-    result = django.template.Template(cnfg).render(context=django.template.Context(context))
-    run_opt = django.template.Template("-config *#path:main#*").render(context=context)
+    result = template_registry.get(cnfg).render(context=django.template.Context(context))
+    run_opt = template_registry.get("-config *#path:main#*").render(context=context)
     return run_opt, result, context.get("deps", {"globals": []})
 
 
@@ -888,7 +1072,9 @@ async def get_custom(
     )
     async for dependantfile in customconfig.dependantfiles.all().select_related("file"):
         if dependantfile.template:
-            template = django.template.Template("{% load node_manager %}" + dependantfile.template)
+            template = template_registry.get(
+                "{% load node_manager %}" + dependantfile.template, obj=dependantfile, field="template"
+            )
             rendered_template = template.render(context=template_context)
             dependantfile.rendered_template = rendered_template
             unproccessed_dependantfiles_map[dependantfile.key] = dependantfile
@@ -941,7 +1127,9 @@ async def get_custom(
         )
         unproccessed_dependantfiles_map.pop(next_to_resolve_key)
 
-    run_opts_template = django.template.Template("{% load node_manager %}" + customconfig.run_opts_template)
+    run_opts_template = template_registry.get(
+        "{% load node_manager %}" + customconfig.run_opts_template, obj=customconfig, field="run_opts_template"
+    )
     run_opts_rendered_template = run_opts_template.render(context=template_context)
     run_opts_content = render_deps(
         run_opts_rendered_template, {i[1] for i in get_deps(run_opts_rendered_template)}, proccessed_dependantfiles_map
@@ -1085,7 +1273,7 @@ async def get_telegraf(
 [[inputs.system]]
 [[inputs.net]]
     """
-    telegraf_conf_content = django.template.Template(cnfg_template).render(
+    telegraf_conf_content = template_registry.get(cnfg_template).render(
         context=django.template.Context(template_context)
     )
     telegraf_conf_hash = sha256(telegraf_conf_content.encode("utf-8")).hexdigest()
@@ -1142,7 +1330,11 @@ async def get_goingto_conf(
     else:
         raise AssertionError
     files.append(goingto_program_file)
-    template_context = django.template.Context({})
+    # given by the xray getter when its users are to be synced by goingto
+    users_sync = {}
+    for i in kwargs_list:
+        users_sync.update(i)
+    template_context = {"users_sync": users_sync}
     cnfg_template = """
 [xray]
 api_port = 6582
@@ -1154,8 +1346,13 @@ interval = 15
 reset = true
 
 [xray.metric]
-"""
-    goingto_conf_content = django.template.Template(cnfg_template).render(
+{% if users_sync %}
+[xray.users]
+interval = 5
+url = "{{ users_sync.users_url }}"
+token = "{{ users_sync.users_token }}"
+{% endif %}"""
+    goingto_conf_content = template_registry.get(cnfg_template).render(
         context=django.template.Context(template_context)
     )
     goingto_conf_hash = sha256(goingto_conf_content.encode("utf-8")).hexdigest()
@@ -1263,7 +1460,7 @@ def get_netmanager_conf(
             "do_netplan": do_netplan,
         }
     )
-    netplan_content = django.template.Template(netplan_template).render(context)
+    netplan_content = template_registry.get(netplan_template).render(context)
     context["netplan_content"] = netplan_content
     # language: bash
     network_manager_template = """
@@ -1309,7 +1506,7 @@ while true; do
 done
 
 """
-    network_manager_bash_content = django.template.Template(network_manager_template).render(context)
+    network_manager_bash_content = template_registry.get(network_manager_template).render(context)
     netmanager_conf_hash = sha256(network_manager_bash_content.encode("utf-8")).hexdigest()
     network_manager_program_file = typing.FileSchema(
         dest_path=node_work_dir.joinpath("conf", f"netmanager_{netmanager_conf_hash[:6]}"),
@@ -0,0 +1,102 @@
+import functools
+import logging
+import re
+from typing import Literal, NamedTuple
+
+from bigO.proxy_manager import models as proxy_manager_models
+
+logger = logging.getLogger(__name__)
+
+# xray stat names are like:
+#   user>>>period12.profile34@love.com>>>traffic>>>downlink
+#   user>>>period12.profile34.user56@love.com>>>traffic>>>uplink
+#   user>>>rule7.node8@love.com>>>traffic>>>downlink
+#   inbound>>>some_tag>>>traffic>>>uplink
+#   outbound>>>some_tag>>>traffic>>>downlink
+XRAY_TRAFFIC_STAT_NAME_PATTERN = re.compile(
+    r"(?:user>>>(?:period(?P<period_id>\d+)\.profile(?P<profile_id>\d+)(?:\.user(?P<user_id>\d+))?"
+    r"|rule(?P<rule_id>\d+)\.node(?P<node_user_id>\d+))[^>]+"
+    r"|(?P<bound>inbound|outbound)>>>(?P<tag>[^>]+))"
+    r">>>traffic>>>(?P<direction>downlink|uplink)"
+)
+
+
+class XrayTrafficStatName(NamedTuple):
+    kind: Literal["user", "internal_user", "inbound", "outbound"]
+    direction: Literal["downlink", "uplink"]
+    period_id: str | None = None
+    profile_id: str | None = None
+    user_id: str | None = None
+    rule_id: str | None = None
+    node_user_id: str | None = None
+    tag: str | None = None
+
+    @property
+    def key(self) -> str:
+        if self.kind == "user":
+            return f"{self.profile_id}.{self.period_id}"
+        elif self.kind == "internal_user":
+            return f"{self.rule_id}.{self.node_user_id}"
+        return self.tag
+
+
+@functools.lru_cache(maxsize=2**16)
+def parse_xray_traffic_stat_name(name: str) -> XrayTrafficStatName | None:
+    """single pass over the stat name, names repeat in every report so the result is cached"""
+    match = XRAY_TRAFFIC_STAT_NAME_PATTERN.match(name)
+    if match is None:
+        return None
+    if match["period_id"] is not None:
+        return XrayTrafficStatName(
+            kind="user",
+            direction=match["direction"],
+            period_id=match["period_id"],
+            profile_id=match["profile_id"],
+            user_id=match["user_id"],
+        )
+    elif match["rule_id"] is not None:
+        return XrayTrafficStatName(
+            kind="internal_user",
+            direction=match["direction"],
+            rule_id=match["rule_id"],
+            node_user_id=match["node_user_id"],
+        )
+    return XrayTrafficStatName(kind=match["bound"], direction=match["direction"], tag=match["tag"])
+
+
+def prefetch_subscriptionperiods(
+    stat_names: list[XrayTrafficStatName],
+) -> dict[str, proxy_manager_models.SubscriptionPeriod | None]:
+    """one query for all the periods referenced in a payload, keyed by XrayTrafficStatName.key"""
+    keys = {(i.period_id, i.profile_id) for i in stat_names if i.kind == "user"}
+    if not keys:
+        return {}
+    qs = proxy_manager_models.SubscriptionPeriod.objects.filter(id__in={i[0] for i in keys}).select_related("plan")
+    found = {(str(i.id), str(i.profile_id)): i for i in qs}
+    res = {}
+    for period_id, profile_id in keys:
+        subscriptionperiod = found.get((period_id, profile_id))
+        if subscriptionperiod is None:
+            logger.critical(f"no SubscriptionPeriod found with {profile_id=} and {period_id=}")
+        res[f"{profile_id}.{period_id}"] = subscriptionperiod
+    return res
+
+
+def prefetch_internalusers(
+    stat_names: list[XrayTrafficStatName],
+) -> dict[str, proxy_manager_models.InternalUser | None]:
+    """one query for all the internal users referenced in a payload, keyed by XrayTrafficStatName.key"""
+    keys = {(i.rule_id, i.node_user_id) for i in stat_names if i.kind == "internal_user"}
+    if not keys:
+        return {}
+    qs = proxy_manager_models.InternalUser.objects.filter(
+        connection_rule_id__in={i[0] for i in keys}, node_id__in={i[1] for i in keys}
+    )
+    found = {(str(i.connection_rule_id), str(i.node_id)): i for i in qs}
+    res = {}
+    for rule_id, node_user_id in keys:
+        internaluser = found.get((rule_id, node_user_id))
+        if internaluser is None:
+            logger.critical(f"no InternalUser found with {rule_id=} and {node_user_id=}")
+        res[f"{rule_id}.{node_user_id}"] = internaluser
+    return res
@@ -1,5 +1,6 @@
 import asyncio
 import datetime
+import gzip
 import ipaddress
 import json
 import logging
@@ -18,14 +19,17 @@ import requests.adapters
 import requests.auth
 import sentry_sdk
 import tomli_w
-from asgiref.sync import async_to_sync
 from celery import current_task
+from django_redis import get_redis_connection
 
+import bigO.utils.blobs
 import bigO.utils.logging
 import django.template
 from bigO.core import models as core_models
+from bigO.core.influx import InfluxPoint, get_influx_writer
 from bigO.telegram_bot import models as telegram_bot_models
-from bigO.telegram_bot.settings import AiohttpSession
+from bigO.telegram_bot.broadcast import Broadcaster
+from bigO.telegram_bot.sessions import run_on_shared_loop
 from config.celery_app import app
 from django.conf import settings
 from django.core.cache import cache
@@ -40,6 +44,20 @@ from . import models, typing
 logger = logging.getLogger(__name__)
 
 
+def send_to_tusers(tusers: list[telegram_bot_models.TelegramUser], message: str) -> None:
+    async def inner():
+        broadcasters = {}
+        for tuser in tusers:
+            if tuser.bot.id not in broadcasters:
+                broadcasters[tuser.bot.id] = Broadcaster(tuser.bot.get_aiobot())
+            broadcasters[tuser.bot.id].add(chat_id=tuser.tid, text=message)
+        reports = await asyncio.gather(*[i.send() for i in broadcasters.values()])
+        for bot_id, report in zip(broadcasters, reports):
+            logger.info(f"sent to the users of bot {bot_id}: {report}")
+
+    run_on_shared_loop(inner)
+
+
 @app.task
 def check_node_latest_sync(
     *, limit_seconds: int, responsetime_miliseconds: int = 1_200, ignore_node_ids: list[int] | None = None
@@ -88,17 +106,7 @@ def check_node_latest_sync(
         },
     )
 
-    async def inner():
-        aiobots = {}
-        tasks = []
-        async with AiohttpSession() as session:
-            for superuser_tuser in superusers_tuser_list:
-                bot = aiobots.get(superuser_tuser.bot.id, superuser_tuser.bot.get_aiobot(session=session))
-                aiobots[superuser_tuser.bot.id] = bot
-                tasks.append(asyncio.create_task(bot.send_message(chat_id=superuser_tuser.tid, text=message)))
-            await asyncio.gather(*tasks)
-
-    async_to_sync(inner)()
+    send_to_tusers(superusers_tuser_list, message)
     cache.set("offline_nodes", json.dumps([i.id for i in all_problematic_qs]))
     return f"{str(reporting_problematic_qs.count())} are down and {str(back_onlines_qs.count())} are back"
 
@@ -152,22 +160,13 @@ def check_node_down_processes(*, ignore_node_ids: list[int] | None = None):
         },
     )
 
-    async def inner():
-        aiobots = {}
-        tasks = []
-        async with AiohttpSession() as session:
-            for superuser_tuser in superusers_tuser_list:
-                bot = aiobots.get(superuser_tuser.bot.id, superuser_tuser.bot.get_aiobot(session=session))
-                aiobots[superuser_tuser.bot.id] = bot
-                tasks.append(asyncio.create_task(bot.send_message(chat_id=superuser_tuser.tid, text=message)))
-            await asyncio.gather(*tasks)
-
-    async_to_sync(inner)()
+    send_to_tusers(superusers_tuser_list, message)
     cache.set("problematic_supervisorpeoccesses", json.dumps([i.id for i in problematic_supervisorprocessinfo_qs]))
     return f"{str(problematic_supervisorprocessinfo_qs.count())} are down and {str(resolved_problematic_supervisorprocessinfo_qs.count())} are back ok"
 
 
-@app.task(soft_time_limit=15 * 60, time_limit=16 * 60)
+@app.task(soft_time_limit=15 * 60, time_limit=16 * 60, ignore_result=True)
+@bigO.utils.blobs.resolve_blob_args("goingto_json_lines")
 def handle_goingto(node_id: int, goingto_json_lines: str, base_labels: dict[str, Any]):
     from bigO.proxy_manager.models import (
         ConnectionRuleOutbound,
@@ -175,13 +174,14 @@ def handle_goingto(node_id: int, goingto_json_lines: str, base_labels: dict[str,
         InternalUser,
         SubscriptionPeriod,
     )
-    from bigO.proxy_manager.services import XrayOutBound, set_outbound_tags
+    from bigO.proxy_manager.services import XrayOutBound, refresh_subscriptionperiods_stored_limits, set_outbound_tags
+
+    from . import stats_ingestion
 
     node_obj = models.Node.objects.get(id=node_id)
-    points: list[influxdb_client.Point] = []
-    subscriptionperiods_map = {}
-    internalusers_map = {}
+    points: list[InfluxPoint] = []
     outbound_store = {}
+    results: list[tuple[dict, list[tuple[stats_ingestion.XrayTrafficStatName, int]] | None]] = []
     for line in goingto_json_lines.split("\n"):
         if not line:
             continue
@@ -193,254 +193,233 @@ def handle_goingto(node_id: int, goingto_json_lines: str, base_labels: dict[str,
                 Exception(f"error in decoding goingto stdout line: err is {e} and line is {line}")
             )
             continue
+        if res["result_type"] == "xray_raw_traffic_v1":
+            traffic_res = typing.GoingtoXrayRawTrafficV1JsonOutPut.model_validate_json(res["msg"])
+            stats = [
+                (stat_name, stat.value)
+                for stat in traffic_res.stats
+                if stat.name
+                and stat.value
+                and (stat_name := stats_ingestion.parse_xray_traffic_stat_name(stat.name)) is not None
+            ]
+            results.append((res, stats))
         else:
-            if res["result_type"] == "xray_raw_traffic_v1":
-                collect_time = datetime.datetime.fromisoformat(res["timestamp"])
-                user_points: dict[str, influxdb_client.Point] = {}
-                internal_user_points: dict[str, influxdb_client.Point] = {}
-                inbound_points: dict[str, influxdb_client.Point] = {}
-                outbound_points: dict[str, influxdb_client.Point] = {}
-                outbound_bridge_portal_mapping: dict[str, str] = {}
-                traffic_res = typing.GoingtoXrayRawTrafficV1JsonOutPut(**json.loads(res["msg"]))
-                for stat in traffic_res.stats:
-                    if not stat.name or not stat.value:
-                        continue
-                    user_traffic_regex = r"user>>>period(\d+)\.profile(\d+)[^>]+>>>traffic>>>(downlink|uplink)"
-                    user_with_id_traffic_regex = (
-                        r"user>>>period(\d+)\.profile(\d+).user(\d+)[^>]+>>>traffic>>>(downlink|uplink)"
-                    )
-                    internal_user_traffic_regex = r"user>>>rule(\d+)\.node(\d+)[^>]+>>>traffic>>>(downlink|uplink)"
-                    inbound_traffic_regex = r"inbound>>>([^>]+)>>>traffic>>>(downlink|uplink)"
-                    outbound_traffic_regex = r"outbound>>>([^>]+)>>>traffic>>>(downlink|uplink)"
-                    if (
-                        len(user_matches := re.findall(user_traffic_regex, stat.name)) == 1
-                        or len(user_with_id_matches := re.findall(user_with_id_traffic_regex, stat.name)) == 1
-                    ):
-                        user_id = None
-                        if len(user_matches) == 1:
-                            period_id = str(user_matches[0][0])
-                            profile_id = str(user_matches[0][1])
-                            downlink_or_uplink = user_matches[0][2]
-                        elif len(user_with_id_matches) == 1:
-                            period_id = str(user_with_id_matches[0][0])
-                            profile_id = str(user_with_id_matches[0][1])
-                            user_id = str(user_with_id_matches[0][2])
-                            downlink_or_uplink = user_with_id_matches[0][3]
-                        else:
-                            raise AssertionError
-
-                        key = f"{profile_id}.{period_id}"
-                        try:
-                            subscriptionperiod = subscriptionperiods_map[key]
-                        except KeyError:
-                            subscriptionperiod = (
-                                SubscriptionPeriod.objects.filter(id=period_id, profile_id=profile_id)
-                                .select_related("plan")
-                                .first()
-                            )
-                            if subscriptionperiod is None:
-                                logger.critical(f"no SubscriptionPeriod found with {profile_id=} and {period_id=}")
-                            subscriptionperiods_map[key] = subscriptionperiod
-
+            results.append((res, None))
+
+    stat_names = [stat_name for _, stats in results if stats for stat_name, _ in stats]
+    subscriptionperiods_map = stats_ingestion.prefetch_subscriptionperiods(stat_names)
+    internalusers_map = stats_ingestion.prefetch_internalusers(stat_names)
+    started_subscriptionperiod_ids = []
+    for res, stats in results:
+        if res["result_type"] == "xray_raw_traffic_v1":
+            collect_time = datetime.datetime.fromisoformat(res["timestamp"])
+            user_points: dict[str, InfluxPoint] = {}
+            internal_user_points: dict[str, InfluxPoint] = {}
+            inbound_points: dict[str, InfluxPoint] = {}
+            outbound_points: dict[str, InfluxPoint] = {}
+            outbound_bridge_portal_mapping: dict[str, str] = {}
+            for stat_name, stat_value in stats:
+                downlink_or_uplink = stat_name.direction
+                if stat_name.kind == "user":
+                    period_id = stat_name.period_id
+                    profile_id = stat_name.profile_id
+                    user_id = stat_name.user_id
+
+                    key = stat_name.key
+                    subscriptionperiod = subscriptionperiods_map[key]
+
+                    if subscriptionperiod:
+                        if subscriptionperiod.first_usage_at is None:
+                            subscriptionperiod.first_usage_at = collect_time
+                            started_subscriptionperiod_ids.append(subscriptionperiod.id)
+                        if subscriptionperiod.first_usage_at > collect_time:
+                            subscriptionperiod.first_usage_at = collect_time
+
+                        if subscriptionperiod.last_usage_at is None:
+                            subscriptionperiod.last_usage_at = collect_time
+                        if subscriptionperiod.last_usage_at < collect_time:
+                            subscriptionperiod.last_usage_at = collect_time
+
+                    point = user_points.get(key)
+                    if point is None:
+                        point = InfluxPoint("xray_usage")
+                        point.time(
+                            collect_time,
+                            write_precision=influxdb_client.domain.write_precision.WritePrecision.S,
+                        )
+                        user_points[key] = point
+                        point.tag("usage_type", "user")
+                        if user_id:
+                            point.tag("user_id", user_id)
+                        point.tag("profile_id", profile_id)
+                        point.tag("period_id", period_id)
                         if subscriptionperiod:
-                            if subscriptionperiod.first_usage_at is None:
-                                subscriptionperiod.first_usage_at = collect_time
-                            if subscriptionperiod.first_usage_at > collect_time:
-                                subscriptionperiod.first_usage_at = collect_time
-
-                            if subscriptionperiod.last_usage_at is None:
-                                subscriptionperiod.last_usage_at = collect_time
-                            if subscriptionperiod.last_usage_at < collect_time:
-                                subscriptionperiod.last_usage_at = collect_time
-
-                        point = user_points.get(key)
-                        if point is None:
-                            point = influxdb_client.Point("xray_usage")
-                            point.time(
-                                collect_time,
-                                write_precision=influxdb_client.domain.write_precision.WritePrecision.S,
-                            )
-                            user_points[key] = point
-                            point.tag("usage_type", "user")
-                            if user_id:
-                                point.tag("user_id", user_id)
-                            point.tag("profile_id", profile_id)
-                            point.tag("period_id", period_id)
-                            if subscriptionperiod:
-                                point.tag("connection_rule_id", subscriptionperiod.plan.connection_rule_id)
-                            for tag_name, tag_value in base_labels.items():
-                                point.tag(tag_name, tag_value)
-                        if downlink_or_uplink == "downlink":
-                            point.field("dl_bytes", stat.value)
-                        elif downlink_or_uplink == "uplink":
-                            point.field("up_bytes", stat.value)
-                        else:
-                            raise AssertionError(f"{stat.value=} is not downlink or uplink")
-                    elif len(internal_user_matches := re.findall(internal_user_traffic_regex, stat.name)) == 1:
-                        rule_id = internal_user_matches[0][0]
-                        node_user_id = internal_user_matches[0][1]
-                        downlink_or_uplink = internal_user_matches[0][2]
-
-                        key = f"{rule_id}.{node_user_id}"
-                        try:
-                            internaluser = internalusers_map[key]
-                        except KeyError:
-                            internaluser = InternalUser.objects.filter(
-                                connection_rule_id=rule_id, node_id=node_user_id
-                            ).first()
-                            if internaluser is None:
-                                logger.critical(f"no InternalUser found with {rule_id=} and {node_user_id=}")
-                            internalusers_map[key] = internaluser
-
-                        if internaluser:
-                            if internaluser.first_usage_at is None:
-                                internaluser.first_usage_at = collect_time
-                            if internaluser.first_usage_at > collect_time:
-                                internaluser.first_usage_at = collect_time
-
-                            if internaluser.last_usage_at is None:
-                                internaluser.last_usage_at = collect_time
-                            if internaluser.last_usage_at < collect_time:
-                                internaluser.last_usage_at = collect_time
-
-                        point = internal_user_points.get(key)
-                        if point is None:
-                            point = influxdb_client.Point("xray_usage")
-                            point.time(
-                                collect_time,
-                                write_precision=influxdb_client.domain.write_precision.WritePrecision.S,
-                            )
-                            internal_user_points[key] = point
-                            point.tag("usage_type", "internal_user")
-                            point.tag("rule_id", rule_id)
-                            point.tag("node_user_id", node_user_id)
-
-                            for tag_name, tag_value in base_labels.items():
-                                point.tag(tag_name, tag_value)
-                        if downlink_or_uplink == "downlink":
-                            point.field("dl_bytes", stat.value)
-                        elif downlink_or_uplink == "uplink":
-                            point.field("up_bytes", stat.value)
-                        else:
-                            raise AssertionError(f"{stat.value=} is not downlink or uplink")
-                    elif len(inbound_matches := re.findall(inbound_traffic_regex, stat.name)) == 1:
-                        inbound_tag = inbound_matches[0][0]
-                        downlink_or_uplink = inbound_matches[0][1]
-                        point = inbound_points.get(inbound_tag)
-                        if point is None:
-                            point = influxdb_client.Point("xray_usage")
-                            point.time(
-                                collect_time,
-                                write_precision=influxdb_client.domain.write_precision.WritePrecision.S,
-                            )
-                            inbound_points[inbound_tag] = point
-                            point.tag("usage_type", "inbound")
-                            point.tag("inbound_tag", inbound_tag)
-                            for tag_name, tag_value in base_labels.items():
-                                point.tag(tag_name, tag_value)
-                        if downlink_or_uplink == "downlink":
-                            point.field("dl_bytes", stat.value)
-                        elif downlink_or_uplink == "uplink":
-                            point.field("up_bytes", stat.value)
-                        else:
-                            raise AssertionError(f"{stat.value=} is not downlink or uplink")
-                    elif len(outbound_matches := re.findall(outbound_traffic_regex, stat.name)) == 1:
-                        outbound_tag = outbound_matches[0][0]
-                        downlink_or_uplink = outbound_matches[0][1]
-                        reverse_outbound_tag = outbound_bridge_portal_mapping.get(outbound_tag)
-                        portal_point: influxdb_client | None = None
-                        if reverse_outbound_tag:
-                            portal_point = outbound_points.get(reverse_outbound_tag)
-                        point = outbound_points.get(outbound_tag)
-                        if point is None:
-                            point = influxdb_client.Point("connection_health")
-                            point.time(
+                            point.tag("connection_rule_id", subscriptionperiod.plan.connection_rule_id)
+                        for tag_name, tag_value in base_labels.items():
+                            point.tag(tag_name, tag_value)
+                    if downlink_or_uplink == "downlink":
+                        point.field("dl_bytes", stat_value)
+                    elif downlink_or_uplink == "uplink":
+                        point.field("up_bytes", stat_value)
+                    else:
+                        raise AssertionError(f"{stat_value=} is not downlink or uplink")
+                elif stat_name.kind == "internal_user":
+                    rule_id = stat_name.rule_id
+                    node_user_id = stat_name.node_user_id
+
+                    key = stat_name.key
+                    internaluser = internalusers_map[key]
+
+                    if internaluser:
+                        if internaluser.first_usage_at is None:
+                            internaluser.first_usage_at = collect_time
+                        if internaluser.first_usage_at > collect_time:
+                            internaluser.first_usage_at = collect_time
+
+                        if internaluser.last_usage_at is None:
+                            internaluser.last_usage_at = collect_time
+                        if internaluser.last_usage_at < collect_time:
+                            internaluser.last_usage_at = collect_time
+
+                    point = internal_user_points.get(key)
+                    if point is None:
+                        point = InfluxPoint("xray_usage")
+                        point.time(
+                            collect_time,
+                            write_precision=influxdb_client.domain.write_precision.WritePrecision.S,
+                        )
+                        internal_user_points[key] = point
+                        point.tag("usage_type", "internal_user")
+                        point.tag("rule_id", rule_id)
+                        point.tag("node_user_id", node_user_id)
+
+                        for tag_name, tag_value in base_labels.items():
+                            point.tag(tag_name, tag_value)
+                    if downlink_or_uplink == "downlink":
+                        point.field("dl_bytes", stat_value)
+                    elif downlink_or_uplink == "uplink":
+                        point.field("up_bytes", stat_value)
+                    else:
+                        raise AssertionError(f"{stat_value=} is not downlink or uplink")
+                elif stat_name.kind == "inbound":
+                    inbound_tag = stat_name.tag
+                    point = inbound_points.get(inbound_tag)
+                    if point is None:
+                        point = InfluxPoint("xray_usage")
+                        point.time(
+                            collect_time,
+                            write_precision=influxdb_client.domain.write_precision.WritePrecision.S,
+                        )
+                        inbound_points[inbound_tag] = point
+                        point.tag("usage_type", "inbound")
+                        point.tag("inbound_tag", inbound_tag)
+                        for tag_name, tag_value in base_labels.items():
+                            point.tag(tag_name, tag_value)
+                    if downlink_or_uplink == "downlink":
+                        point.field("dl_bytes", stat_value)
+                    elif downlink_or_uplink == "uplink":
+                        point.field("up_bytes", stat_value)
+                    else:
+                        raise AssertionError(f"{stat_value=} is not downlink or uplink")
+                elif stat_name.kind == "outbound":
+                    outbound_tag = stat_name.tag
+                    reverse_outbound_tag = outbound_bridge_portal_mapping.get(outbound_tag)
+                    portal_point: InfluxPoint | None = None
+                    if reverse_outbound_tag:
+                        portal_point = outbound_points.get(reverse_outbound_tag)
+                    point = outbound_points.get(outbound_tag)
+                    if point is None:
+                        point = InfluxPoint("connection_health")
+                        point.time(
+                            collect_time,
+                            write_precision=influxdb_client.domain.write_precision.WritePrecision.S,
+                        )
+                        # for tag_name, tag_value in base_labels.items():
+                        #     point.tag(tag_name, tag_value)  todo bring this back
+                        ot = set_outbound_tags(
+                            point=point, node=node_obj, outbound_name=outbound_tag, store=outbound_store
+                        )
+                        outbound_points[outbound_tag] = point
+                        if ot and ot.is_reverse:
+                            # this monkey patch is because xray does not provide traffic info about portal tag
+                            # at the time, so we just assume it is equal to bridge
+                            if isinstance(ot, ConnectionRuleOutbound):
+                                portal_outbound_tag = XrayOutBound.get_portal_outbound_name(
+                                    connection_rule=ot.rule,
+                                    portal_nodeoutbound=ot,
+                                    balancer_allocation_idf=XrayOutBound.get_node_outbound_balancer_allocation_idf(
+                                        outbound_tag
+                                    ),
+                                )
+                            elif isinstance(ot, ConnectionTunnelOutbound):
+                                portal_outbound_tag = XrayOutBound.get_tunn_portal_outbound_name(
+                                    connectiontunnel=ot.tunnel, portal_reverse=ot
+                                )
+                            else:
+                                raise NotImplementedError
+                            outbound_bridge_portal_mapping[outbound_tag] = portal_outbound_tag
+                            portal_point = InfluxPoint("connection_health")
+                            portal_point.time(
                                 collect_time,
                                 write_precision=influxdb_client.domain.write_precision.WritePrecision.S,
                             )
-                            # for tag_name, tag_value in base_labels.items():
-                            #     point.tag(tag_name, tag_value)  todo bring this back
-                            ot = set_outbound_tags(
-                                point=point, node=node_obj, outbound_name=outbound_tag, store=outbound_store
+                            set_outbound_tags(
+                                point=portal_point,
+                                node=ot.get_portal_node(),
+                                outbound_name=portal_outbound_tag,
+                                store=outbound_store,
                             )
-                            outbound_points[outbound_tag] = point
-                            if ot and ot.is_reverse:
-                                # this monkey patch is because xray does not provide traffic info about portal tag
-                                # at the time, so we just assume it is equal to bridge
-                                if isinstance(ot, ConnectionRuleOutbound):
-                                    portal_outbound_tag = XrayOutBound.get_portal_outbound_name(
-                                        connection_rule=ot.rule,
-                                        portal_nodeoutbound=ot,
-                                        balancer_allocation_idf=XrayOutBound.get_node_outbound_balancer_allocation_idf(
-                                            outbound_tag
-                                        ),
-                                    )
-                                elif isinstance(ot, ConnectionTunnelOutbound):
-                                    portal_outbound_tag = XrayOutBound.get_tunn_portal_outbound_name(
-                                        connectiontunnel=ot.tunnel, portal_reverse=ot
-                                    )
-                                else:
-                                    raise NotImplementedError
-                                outbound_bridge_portal_mapping[outbound_tag] = portal_outbound_tag
-                                portal_point = influxdb_client.Point("connection_health")
-                                portal_point.time(
-                                    collect_time,
-                                    write_precision=influxdb_client.domain.write_precision.WritePrecision.S,
-                                )
-                                set_outbound_tags(
-                                    point=portal_point,
-                                    node=ot.get_portal_node(),
-                                    outbound_name=portal_outbound_tag,
-                                    store=outbound_store,
-                                )
-                                outbound_points[portal_outbound_tag] = portal_point
-                        if downlink_or_uplink == "downlink":
-                            point.field("dl_bytes", stat.value)
-                            if portal_point:
-                                portal_point.field("up_bytes", stat.value)
-                        elif downlink_or_uplink == "uplink":
-                            point.field("up_bytes", stat.value)
-                            if portal_point:
-                                portal_point.field("dl_bytes", stat.value)
-                        else:
-                            raise AssertionError(f"{stat.value=} is not downlink or uplink")
+                            outbound_points[portal_outbound_tag] = portal_point
+                    if downlink_or_uplink == "downlink":
+                        point.field("dl_bytes", stat_value)
+                        if portal_point:
+                            portal_point.field("up_bytes", stat_value)
+                    elif downlink_or_uplink == "uplink":
+                        point.field("up_bytes", stat_value)
+                        if portal_point:
+                            portal_point.field("dl_bytes", stat_value)
                     else:
-                        continue
-                        # raise NotImplementedError
-                points.extend(
-                    [
-                        *user_points.values(),
-                        *internal_user_points.values(),
-                        *inbound_points.values(),
-                        *outbound_points.values(),
-                    ]
+                        raise AssertionError(f"{stat_value=} is not downlink or uplink")
+                else:
+                    continue
+                    # raise NotImplementedError
+            points.extend(
+                [
+                    *user_points.values(),
+                    *internal_user_points.values(),
+                    *inbound_points.values(),
+                    *outbound_points.values(),
+                ]
+            )
+        elif res["result_type"] == "xray_raw_metrics_v1":
+            metrics_res = typing.GoingtoXrayRawMetricsV1JsonOutPut.model_validate_json(res["msg"])
+            for outbound_tag, observatory_result in metrics_res.observatory.items():
+                point = InfluxPoint("connection_health")
+                time_ = datetime.datetime.fromtimestamp(observatory_result.last_try_time, ZoneInfo("UTC"))
+                point.time(
+                    time_,
+                    write_precision=influxdb_client.domain.write_precision.WritePrecision.S,
                 )
-            elif res["result_type"] == "xray_raw_metrics_v1":
-                metrics_res = typing.GoingtoXrayRawMetricsV1JsonOutPut(**json.loads(res["msg"]))
-                for outbound_tag, observatory_result in metrics_res.observatory.items():
-                    point = influxdb_client.Point("connection_health")
-                    time_ = datetime.datetime.fromtimestamp(observatory_result.last_try_time, ZoneInfo("UTC"))
-                    point.time(
-                        time_,
-                        write_precision=influxdb_client.domain.write_precision.WritePrecision.S,
-                    )
-                    # for tag_name, tag_value in base_labels.items():
-                    #     point.tag(tag_name, tag_value)  todo bring this
-                    set_outbound_tags(point=point, node=node_obj, outbound_name=outbound_tag, store=outbound_store)
-                    if observatory_result.delay == 99999999 or observatory_result.alive is None:
-                        point.field("status", "timeout")
-                        point.tag("status", "timeout")
-                    else:
-                        point.field("status", "ok")
-                        point.tag("status", "ok")
-                        point.field(
-                            "delay", float(observatory_result.delay)
-                        )  # float because already exists as type float
-                    points.append(point)
+                # for tag_name, tag_value in base_labels.items():
+                #     point.tag(tag_name, tag_value)  todo bring this
+                set_outbound_tags(point=point, node=node_obj, outbound_name=outbound_tag, store=outbound_store)
+                if observatory_result.delay == 99999999 or observatory_result.alive is None:
+                    point.field("status", "timeout")
+                    point.tag("status", "timeout")
+                else:
+                    point.field("status", "ok")
+                    point.tag("status", "ok")
+                    point.field("delay", float(observatory_result.delay))  # float because already exists as type float
+                points.append(point)
 
     subscriptionperiods = [v for k, v in subscriptionperiods_map.items() if v]
     if subscriptionperiods:
         SubscriptionPeriod.objects.bulk_update(subscriptionperiods, fields=["first_usage_at", "last_usage_at"])
+    if started_subscriptionperiod_ids:
+        # their expiry is known from now on
+        refresh_subscriptionperiods_stored_limits(
+            SubscriptionPeriod.objects.filter(id__in=started_subscriptionperiod_ids)
+        )
 
     internalusers = [v for k, v in internalusers_map.items() if v]
     if internalusers:
@@ -448,25 +427,12 @@ def handle_goingto(node_id: int, goingto_json_lines: str, base_labels: dict[str,
 
     if not points:
         return "no points!!!"
-    with influxdb_client.InfluxDBClient(
-        url=settings.INFLUX_URL, token=settings.INFLUX_TOKEN, org=settings.INFLUX_ORG
-    ) as _client:
-        with _client.write_api(
-            write_options=influxdb_client.WriteOptions(
-                batch_size=500,
-                flush_interval=10_000,
-                jitter_interval=2_000,
-                retry_interval=5_000,
-                max_retries=3,
-                max_retry_delay=30_000,
-                max_close_wait=300_000,
-                exponential_base=2,
-            )
-        ) as _write_client:
-            _write_client.write(settings.INFLUX_BUCKET, settings.INFLUX_ORG, points)
+    written_count = get_influx_writer().write(points)
+    return f"{written_count} points queued"
 
 
-@app.task
+@app.task(ignore_result=True)
+@bigO.utils.blobs.resolve_blob_args("netmanager_lines")
 def handle_netmanager(node_id: int, netmanager_lines: str):
     latest_states = {}
     pattern = r"^(?P<timestamp_part>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) (?P<status>Successful|Unsuccessful)[ ]ping[ ]using[ ](?P<ip>[0-9a-fA-F:.]+)$"
@@ -509,9 +475,10 @@ def handle_netmanager(node_id: int, netmanager_lines: str):
     models.NodePublicIP.objects.bulk_update(updating_records, fields=["last_status_check", "status"])
 
 
-@app.task
+@app.task(ignore_result=True)
+@bigO.utils.blobs.resolve_blob_args("telegraf_json_lines")
 def telegraf_to_influx_send(telegraf_json_lines: str, base_labels: dict[str, Any]):
-    points: list[influxdb_client.Point] = []
+    points: list[InfluxPoint] = []
     for line in telegraf_json_lines.split("\n"):
         try:
             res = json.loads(line)
@@ -520,7 +487,7 @@ def telegraf_to_influx_send(telegraf_json_lines: str, base_labels: dict[str, Any
         else:
             res = typing.TelegrafJsonOutPut(**res)
             for metric in res.metrics:
-                point = influxdb_client.Point(metric.name)
+                point = InfluxPoint(metric.name)
                 for tag_name, tag_value in {**metric.tags, **base_labels}.items():
                     point = point.tag(tag_name, tag_value)
                 for field_name, field_value in metric.fields.items():
@@ -534,25 +501,11 @@ def telegraf_to_influx_send(telegraf_json_lines: str, base_labels: dict[str, Any
                 points.append(point)
     if not points:
         return "no points!!!"
-    with influxdb_client.InfluxDBClient(
-        url=settings.INFLUX_URL, token=settings.INFLUX_TOKEN, org=settings.INFLUX_ORG
-    ) as _client:
-        with _client.write_api(
-            write_options=influxdb_client.WriteOptions(
-                batch_size=500,
-                flush_interval=10_000,
-                jitter_interval=2_000,
-                retry_interval=5_000,
-                max_retries=3,
-                max_retry_delay=30_000,
-                max_close_wait=300_000,
-                exponential_base=2,
-            )
-        ) as _write_client:
-            _write_client.write(settings.INFLUX_BUCKET, settings.INFLUX_ORG, points)
+    written_count = get_influx_writer().write(points)
+    return f"{written_count} points queued"
 
 
-@app.task
+@app.task(ignore_result=True)
 def send_to_loki(streams: list[typing.LokiStram]):
     requests_session = requests.Session()
     retries = requests.adapters.Retry(total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504, 598])
@@ -573,6 +526,67 @@ def send_to_loki(streams: list[typing.LokiStram]):
     return f"sent in {len(streams_list)} chunks"
 
 
+LOKI_SPOOL_KEY = "loki_spool"
+LOKI_SPOOL_READ_CHUNK = 200
+
+
+def loki_spool_entry_to_stream(entry: typing.LokiSpoolEntry) -> typing.LokiStram:
+    if entry.get("values") is not None:
+        return {"stream": entry["stream"], "values": entry["values"]}
+    return {"stream": entry["stream"], "values": [[entry["collected_at"], i] for i in entry["raw"].split("\n")]}
+
+
+@app.task(soft_time_limit=5 * 60, time_limit=6 * 60, ignore_result=True)
+def ship_loki_spool():
+    """
+    drains the spool filled by services.spool_loki_streams, one gzipped push per loki_batch_size,
+    the pushed blobs are trimmed only after loki accepted them
+    """
+    lock_key = "loki_spool_shipper_lock"
+    if not cache.add(lock_key, current_task.request.id or "1", timeout=6 * 60):
+        return "another shipper is running"
+    try:
+        redis_conn = get_redis_connection("default")
+        requests_session = requests.Session()
+        retries = requests.adapters.Retry(total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504, 598])
+        requests_session.mount("https://", requests.adapters.HTTPAdapter(max_retries=retries))
+        site_config = core_models.SiteConfiguration.objects.get()
+        batches_count = 0
+        while True:
+            blobs = redis_conn.lrange(LOKI_SPOOL_KEY, 0, LOKI_SPOOL_READ_CHUNK - 1)
+            if not blobs:
+                break
+            streams = []
+            batch_length = 0
+            consumed_count = 0
+            for blob in blobs:
+                consumed_count += 1
+                try:
+                    stream = loki_spool_entry_to_stream(json.loads(gzip.decompress(blob)))
+                except (OSError, ValueError, KeyError) as e:
+                    logger.error(f"dropping corrupted loki spool entry: {e}")
+                    continue
+                streams.append(stream)
+                batch_length += len(blob)
+                if batch_length >= site_config.loki_batch_size:
+                    break
+            if streams:
+                body = gzip.compress(json.dumps({"streams": streams}).encode("utf-8"), compresslevel=1)
+                res = requests_session.post(
+                    f"{settings.LOKI_BASE_ENDPOINT}/loki/api/v1/push",
+                    headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+                    data=body,
+                    auth=requests.auth.HTTPBasicAuth(settings.LOKI_USERNAME, settings.LOKI_PASSWORD),
+                )
+                if not res.ok:
+                    raise Exception(f"faild send to Loki, {res.text=}")
+                batches_count += 1
+            redis_conn.ltrim(LOKI_SPOOL_KEY, consumed_count, -1)
+    finally:
+        cache.delete(lock_key)
+    return f"sent in {batches_count} batches"
+
+
 @app.task(soft_time_limit=15 * 60, time_limit=16 * 60)
 def ansible_deploy_node(node_id: int):
     celery_task_id = current_task.request.id
@@ -0,0 +1,28 @@
+import pytest
+
+from bigO.proxy_manager import models as proxy_manager_models
+from bigO.utils import dependency_versions
+
+from .. import services
+
+
+@pytest.mark.parametrize(
+    ("sender", "created", "bumped"),
+    [
+        (proxy_manager_models.MemberCredit, True, False),
+        (proxy_manager_models.MemberCreditBalance, True, False),
+        (proxy_manager_models.SubscriptionPlan, False, True),
+        (proxy_manager_models.SubscriptionPeriod, True, True),
+        (proxy_manager_models.SubscriptionPeriod, False, False),
+    ],
+)
+def test_bundle_dependency_changed(monkeypatch, sender, created, bumped):
+    """the wallet changes and the usage syncs do not make the nodes sync their whole bundle"""
+    on_commit_calls = []
+    monkeypatch.setattr(
+        dependency_versions.transaction, "on_commit", lambda func, using=None: on_commit_calls.append(func)
+    )
+
+    dependency_versions.dependency_changed(sender=sender, using="default", created=created)
+
+    assert (services.node_bundle_version.bump in on_commit_calls) == bumped
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from .. import models, tasks
+
+pytestmark = pytest.mark.django_db
+
+
+class FakeInfluxWriter:
+    def __init__(self):
+        self.points = []
+
+    def write(self, points) -> int:
+        self.points.extend(points)
+        return len(points)
+
+
+def test_handle_goingto_traffic(monkeypatch):
+    """a goingto traffic line ends up as influx points"""
+    node_obj = models.Node.objects.create(name="node1", architecture=models.SystemArchitectureTextChoices.AMD64)
+    influx_writer = FakeInfluxWriter()
+    monkeypatch.setattr(tasks, "get_influx_writer", lambda: influx_writer)
+    traffic = {
+        "stats": [
+            {"name": "inbound>>>vless_in>>>traffic>>>downlink", "value": 100},
+            {"name": "inbound>>>vless_in>>>traffic>>>uplink", "value": 20},
+            {"name": "inbound>>>api>>>traffic>>>uplink", "value": 0},
+        ]
+    }
+    line = json.dumps(
+        {"result_type": "xray_raw_traffic_v1", "timestamp": "2026-10-18T10:00:00+00:00", "msg": json.dumps(traffic)}
+    )
+
+    res = tasks.handle_goingto(node_id=node_obj.id, goingto_json_lines=line + "\n", base_labels={"node_id": "1"})
+
+    assert res == "1 points queued"
+    (point,) = influx_writer.points
+    assert point._tags["inbound_tag"] == "vless_in"
+    assert point._fields == {"dl_bytes": "100i", "up_bytes": "20i"}
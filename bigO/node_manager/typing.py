@@ -46,6 +46,13 @@ class LokiStram(TypedDict):
     values: list[list[str, str]]
 
 
+class LokiSpoolEntry(TypedDict):
+    stream: dict[str, str]
+    collected_at: str | None  # ns timestamp of all the lines of raw
+    raw: str | None
+    values: list[list[str, str]] | None
+
+
 class MetricSchema(pydantic.BaseModel):
     ip_a: Annotated[
         str,
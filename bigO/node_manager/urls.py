@@ -6,6 +6,7 @@ app_name = "node_manager"
 urlpatterns = [
     path("node/base-sync/", views.NodeBaseSyncAPIView.as_view(), name="node_base_sync"),
     path("node/base-sync/v2/", views.node_base_sync_v2, name="node_base_sync_v2"),
+    path("node/base-sync/v2/changes/", views.node_base_sync_v2_changes, name="node_base_sync_v2_changes"),
     path(
         "node/program-binary/hash/<str:hash>/content/",
         views.NodeProgramBinaryContentByHashAPIView.as_view(),
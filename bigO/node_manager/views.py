@@ -1,7 +1,9 @@
+import asyncio
 import json
 import logging
 import socket
 import ssl
+import time
 import tomllib
 from collections import defaultdict
 from hashlib import sha256
@@ -25,6 +27,7 @@ from django.urls import reverse
 from django.utils import timezone
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
 from rest_framework import serializers, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -84,6 +87,7 @@ class NodeBaseSyncAPIView(APIView):
         global_deps = ConfigDependantFileSerializer(many=True)
 
     permission_classes = [HasNodeAPIKey]
+    parser_classes = [bigO.utils.http.GzipJSONParser]
 
     def get_permissions(self):
         if getattr(self, "_permissions", None) is None:
@@ -94,12 +98,17 @@ class NodeBaseSyncAPIView(APIView):
     def post(self, request):
         for i in self.get_permissions():
             if isinstance(i, HasNodeAPIKey) and i.had_permission:
-                node_obj = i.api_key.node
+                node_obj = i.get_node()
                 break
         else:
             raise NotImplementedError
         node_sync_stat_obj = services.create_node_sync_stat(request_headers=request._request.headers, node=node_obj)
+        try:
+            return self.sync(request, node_obj=node_obj, node_sync_stat_obj=node_sync_stat_obj)
+        finally:
+            services.save_node_sync_stat(node_sync_stat_obj)
 
+    def sync(self, request, node_obj: models.Node, node_sync_stat_obj: models.NodeLatestSyncStat) -> Response:
         try:
             input_data = self.InputSchema(**request.data)
         except pydantic.ValidationError as e:
@@ -300,12 +309,13 @@ class NodeBaseSyncV2InputSchema(pydantic.BaseModel):
 
 
 @csrf_exempt
+@gzip_page
 async def node_base_sync_v2(request: HttpRequest):
     perm = HasNodeAPIKey()
     has_perm = await sync_to_async(perm.has_permission)(request=request, view=None)
     if not has_perm:
         return JsonResponse({"error_info": "invalid api key"}, status=403)
-    node_obj = await sync_to_async(lambda: perm.api_key.node)()
+    node_obj = await sync_to_async(perm.get_node)()
 
     site_config: core_models.SiteConfiguration = await core_models.SiteConfiguration.objects.aget()
     if site_config.sync_brake:
@@ -314,9 +324,18 @@ async def node_base_sync_v2(request: HttpRequest):
     node_sync_stat_obj = await sync_to_async(services.create_node_sync_stat)(
         request_headers=request.headers, node=node_obj
     )
+    try:
+        return await node_base_sync_v2_respond(request, node_obj=node_obj, node_sync_stat_obj=node_sync_stat_obj)
+    finally:
+        await sync_to_async(services.save_node_sync_stat)(node_sync_stat_obj)
 
+
+async def node_base_sync_v2_respond(
+    request: HttpRequest, node_obj: models.Node, node_sync_stat_obj: models.NodeLatestSyncStat
+) -> HttpResponse:
     try:
         body = bigO.utils.http.get_body_from_request(request, 100 * 1024 * 1024)
+        body = bigO.utils.http.decompress_body(body, request.headers.get("Content-Encoding"), 100 * 1024 * 1024)
         input_json = json.loads(body)
         input_data = NodeBaseSyncV2InputSchema(**input_json)
     except pydantic.ValidationError as e:
@@ -333,11 +352,24 @@ async def node_base_sync_v2(request: HttpRequest):
         node=node_obj, node_sync_stat_obj=node_sync_stat_obj, ip_a=input_data.metrics.ip_a
     )
 
+    next_base_url = ("https" if request.is_secure() else "http") + "://" + request.get_host()
+
+    bundle_version = await services.node_bundle_version.aget()
+    if if_none_match := request.headers.get("If-None-Match"):
+        # the etag is weakened by the compression, older agents send it back within quotes
+        bundle_hash = if_none_match.strip('"').removeprefix("W/").strip('"')
+        is_unchanged = await sync_to_async(services.is_node_bundle_unchanged)(
+            node=node_obj, base_url=next_base_url, config=node_config, bundle_hash=bundle_hash
+        )
+        if is_unchanged:
+            await sync_to_async(services.complete_node_sync_stat)(obj=node_sync_stat_obj, response_payload=None)
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response["ETag"] = f'"{bundle_hash}"'
+            return response
+
     supervisor_config = ""
     files = []
 
-    next_base_url = ("https" if request.is_secure() else "http") + "://" + request.get_host()
-
     async for node_customconfig in node_obj.node_customconfigs.all().select_related("custom_config"):
         try:
             supervisor_part, part_files = await services.get_custom(
@@ -399,10 +431,43 @@ async def node_base_sync_v2(request: HttpRequest):
         runtime=RuntimeSchema(node_id=str(node_obj.id), node_name=node_obj.name),
     )
     response_data = output_schema.model_dump_json()
-    await sync_to_async(services.complete_node_sync_stat)(
-        obj=node_sync_stat_obj, response_payload=json.loads(response_data)
+    bundle_hash = services.get_bundle_hash(
+        supervisor_config=supervisor_config, files=output_schema.files, config=output_schema.config
+    )
+    await sync_to_async(services.set_node_bundle_hash)(
+        node=node_obj, version=bundle_version, base_url=next_base_url, config=node_config, bundle_hash=bundle_hash
     )
-    return HttpResponse(response_data, content_type="application/json", status=status.HTTP_200_OK)
+    await sync_to_async(services.complete_node_sync_stat)(obj=node_sync_stat_obj, response_payload=response_data)
+    response = HttpResponse(response_data, content_type="application/json", status=status.HTTP_200_OK)
+    response["ETag"] = f'"{bundle_hash}"'
+    return response
+
+
+# smallO2 waits on its sync client, so the wait is kept below its response header timeout (15s)
+NODE_BUNDLE_CHANGES_WAIT = 10
+NODE_BUNDLE_CHANGES_POLL_INTERVAL = 0.5
+
+
+async def node_base_sync_v2_changes(request: HttpRequest):
+    """
+    long poll that answers when the bundle version differs from the given one (or the wait is over),
+    so the nodes sync right after a change instead of on their next interval
+    """
+    perm = HasNodeAPIKey()
+    has_perm = await sync_to_async(perm.has_permission)(request=request, view=None)
+    if not has_perm:
+        return JsonResponse({"error_info": "invalid api key"}, status=403)
+    try:
+        version = int(request.GET["version"])
+    except (KeyError, ValueError):
+        version = None
+
+    current_version = await services.node_bundle_version.aget()
+    deadline = time.monotonic() + NODE_BUNDLE_CHANGES_WAIT
+    while version is not None and current_version == version and time.monotonic() < deadline:
+        await asyncio.sleep(NODE_BUNDLE_CHANGES_POLL_INTERVAL)
+        current_version = await services.node_bundle_version.aget()
+    return JsonResponse({"version": current_version})
 
 
 class NodeProgramBinaryContentByHashAPIView(UserPassesTestMixin, View):
@@ -411,7 +476,7 @@ class NodeProgramBinaryContentByHashAPIView(UserPassesTestMixin, View):
         has_perm = perm.has_permission(request=self.request, view=None)
         if not has_perm:
             return False
-        self.node = perm.api_key.node
+        self.node_id = perm.node_id
         return True
 
     def handle_no_permission(self):
@@ -421,7 +486,31 @@ class NodeProgramBinaryContentByHashAPIView(UserPassesTestMixin, View):
         obj = models.ProgramBinary.objects.filter(hash=hash).first()
         if obj is None:
             return JsonResponse({}, status=status.HTTP_404_NOT_FOUND)
-        return FileResponse(obj.file)
+        size = obj.file.size
+        byte_range = None
+        range_header = request.headers.get("Range")
+        if range_header and request.headers.get("If-Range", f'"{hash}"') == f'"{hash}"':
+            byte_range = bigO.utils.http.parse_range_header(range_header, size)
+        if byte_range is None:
+            response = FileResponse(obj.file)
+        elif byte_range[0] >= size:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response["Content-Range"] = f"bytes */{size}"
+        else:
+            start, end = byte_range
+            file = obj.file.open("rb")
+            file.seek(start)
+            response = StreamingHttpResponse(
+                bigO.utils.http.iter_file_range(file, end - start + 1),
+                status=status.HTTP_206_PARTIAL_CONTENT,
+                content_type="application/octet-stream",
+            )
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response["Content-Length"] = str(end - start + 1)
+        # the content of a hash never changes
+        response["Accept-Ranges"] = "bytes"
+        response["ETag"] = f'"{hash}"'
+        return response
 
 
 class CustomResolver(aiohttp.DefaultResolver):
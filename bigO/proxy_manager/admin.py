@@ -811,6 +811,18 @@ class MemberCreditModelAdmin(admin.ModelAdmin):
     autocomplete_fields = ("agency_user", "created_by")
 
 
+@admin.register(models.MemberCreditBalance)
+class MemberCreditBalanceModelAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "agency_user",
+        "balance",
+        "updated_at",
+    )
+    search_fields = ("agency_user__user__name", "agency_user__user__username")
+    readonly_fields = ("agency_user", "balance", "balance_currency")
+
+
 @admin.register(models.AgencyPaymentType)
 class AgencyPaymentTypeModelAdmin(admin.ModelAdmin):
     list_display = (
@@ -0,0 +1,28 @@
+from django.apps import AppConfig
+
+
+class ProxyManagerConfig(AppConfig):
+    name = "bigO.proxy_manager"
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+
+        from . import models, services
+
+        # before the limits receivers, their on commit refresh reads the rebuilt balance
+        post_delete.connect(
+            services.membercredit_deleted,
+            sender=models.MemberCredit,
+            dispatch_uid=f"membercredit_deleted_{models.MemberCredit._meta.label}",
+        )
+        for limits_dependency in (models.SubscriptionPeriod, models.SubscriptionPlan, models.MemberCredit):
+            post_save.connect(
+                services.subscriptionperiod_limits_dependency_changed,
+                sender=limits_dependency,
+                dispatch_uid=f"limits_dependency_saved_{limits_dependency._meta.label}",
+            )
+        post_delete.connect(
+            services.subscriptionperiod_limits_dependency_changed,
+            sender=models.MemberCredit,
+            dispatch_uid=f"limits_dependency_deleted_{models.MemberCredit._meta.label}",
+        )
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ... import services
+
+
+class Command(BaseCommand):
+    help = "compares the connectable periods lookup on the stored limits against the plan providers annotations"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--connection-rule-id", type=int, default=None)
+
+    def handle(self, *args, **options):
+        results = {}
+        for name, get_qs in (
+            ("annotated", services.get_annotated_connectable_subscriptionperiod_qs),
+            ("stored", services.get_connectable_subscriptionperiod_qs),
+        ):
+            qs = get_qs()
+            if options["connection_rule_id"]:
+                qs = qs.filter(plan__connection_rule_id=options["connection_rule_id"])
+            start = time.perf_counter()
+            for _ in range(options["repeat"]):
+                ids = set(qs.values_list("id", flat=True))
+            results[name] = (ids, (time.perf_counter() - start) / options["repeat"])
+
+        for name, (ids, duration) in results.items():
+            self.stdout.write(f"{name}: {len(ids)} periods in {duration * 1000:.1f}ms")
+        mismatched = results["annotated"][0] ^ results["stored"][0]
+        if mismatched:
+            self.stdout.write(
+                f"{len(mismatched)} periods differ, the stored limits may be behind: {sorted(mismatched)[:20]}"
+            )
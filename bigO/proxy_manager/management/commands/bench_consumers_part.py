@@ -0,0 +1,60 @@
+import pathlib
+import time
+import uuid
+from types import SimpleNamespace
+
+from bigO.node_manager import services as node_manager_services
+from django.core.management.base import BaseCommand
+
+from ... import typing
+from ...services import node_config
+
+CONSUMER_OBJ_TEMPLATE = (
+    '{"id": "{{ subscriptionperiod_obj.xray_uuid }}", '
+    '"email": "{{ subscriptionperiod_obj.xray_email }}", '
+    '"flow": "xtls-rprx-vision"}'
+)
+CONSUMER_OBJ_SCHEMA = {"fields": {"id": "xray_uuid", "email": "xray_email"}, "constants": {"flow": "xtls-rprx-vision"}}
+
+
+class Command(BaseCommand):
+    help = "compares the per user template rendering of consumers_part against the bulk consumer_obj_schema one"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=5000)
+        parser.add_argument("--inbounds", type=int, default=10)
+
+    def handle(self, *args, **options):
+        users_count = options["users"]
+        inbounds_count = options["inbounds"]
+        proxyusers = []
+        for i in range(users_count):
+            email = f"period{i}.profile{i}@love.com"
+            proxyusers.append(SimpleNamespace(xray_uuid=uuid.uuid4(), xray_email=lambda email=email: email))
+
+        start = time.perf_counter()
+        for _ in range(inbounds_count):
+            template = node_manager_services.template_registry.get(
+                "{% load node_manager proxy_manager %}" + CONSUMER_OBJ_TEMPLATE
+            )
+            ",\n".join(
+                template.render(
+                    context=node_manager_services.NodeTemplateContext(
+                        {"subscriptionperiod_obj": proxyuser}, node_work_dir=pathlib.Path("/tmp"), base_url=""
+                    )
+                )
+                for proxyuser in proxyusers
+            )
+        template_duration = time.perf_counter() - start
+
+        start = time.perf_counter()
+        consumer_obj_schema = typing.ConsumerObjSchema(**CONSUMER_OBJ_SCHEMA)
+        proxyuser_values = [{"xray_uuid": str(i.xray_uuid), "xray_email": i.xray_email()} for i in proxyusers]
+        for _ in range(inbounds_count):
+            node_config.get_bulk_consumers_part(consumer_obj_schema, proxyuser_values=proxyuser_values)
+        bulk_duration = time.perf_counter() - start
+
+        consumers_count = users_count * inbounds_count
+        self.stdout.write(f"{users_count} users x {inbounds_count} inbounds")
+        for name, duration in (("template", template_duration), ("bulk", bulk_duration)):
+            self.stdout.write(f"{name}: {duration:.3f}s ({duration / consumers_count * 1e6:.2f}us/consumer)")
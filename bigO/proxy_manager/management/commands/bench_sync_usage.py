@@ -0,0 +1,53 @@
+import time
+from datetime import timedelta
+
+import influxdb_client
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ... import models
+from ...services import stats
+
+
+class Command(BaseCommand):
+    help = "measures periods/second of summing the usage of periods one query each against one query per batch"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--periods", type=int, default=500)
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--hours", type=int, default=1, help="the range to sum the usage over")
+
+    def handle(self, *args, **options):
+        start_at = timezone.now() - timedelta(hours=options["hours"])
+        period_ids = list(
+            models.SubscriptionPeriod.objects.filter(last_usage_at__gt=start_at)
+            .order_by("-last_usage_at")
+            .values_list("id", flat=True)[: options["periods"]]
+        )
+        if not period_ids:
+            self.stdout.write("no period with usage in the range")
+            return
+        batch_size = options["batch_size"]
+
+        with influxdb_client.InfluxDBClient(
+            url=settings.INFLUX_URL, token=settings.INFLUX_TOKEN, org=settings.INFLUX_ORG
+        ) as influx_client:
+            query_api = influx_client.query_api()
+
+            start = time.perf_counter()
+            for period_id in period_ids:
+                stats.get_periods_flow_bytes({period_id: start_at}, query_api=query_api)
+            single_duration = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for i in range(0, len(period_ids), batch_size):
+                stats.get_periods_flow_bytes(
+                    {period_id: start_at for period_id in period_ids[i : i + batch_size]}, query_api=query_api
+                )
+            batched_duration = time.perf_counter() - start
+
+        self.stdout.write(f"{len(period_ids)} periods, batch size {batch_size}")
+        for name, duration in (("one by one", single_duration), ("batched", batched_duration)):
+            self.stdout.write(f"{name}: {duration:.3f}s ({len(period_ids) / duration:.1f} periods/s)")
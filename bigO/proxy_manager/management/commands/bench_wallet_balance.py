@@ -0,0 +1,71 @@
+import time
+
+from moneyed import Money
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from ... import models, services
+
+
+class Command(BaseCommand):
+    help = "compares reading the wallet balance from the ledger against the balance rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--agency-users", type=int, default=20, help="the ones with the most ledger rows")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--fake-entries",
+            type=int,
+            default=0,
+            help="ledger rows added to the first agency user for the run, they are rolled back at the end",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using="main"):
+            agency_user_rows = list(
+                models.MemberCredit.objects.order_by()
+                .values("agency_user")
+                .annotate(entries=Count("id"))
+                .order_by("-entries")[: options["agency_users"]]
+            )
+            if not agency_user_rows:
+                self.stdout.write("no agency user with ledger rows")
+                return
+            if options["fake_entries"]:
+                self.add_fake_entries(agency_user_rows[0], options["fake_entries"])
+
+            for row in agency_user_rows:
+                durations = {}
+                for name, qs in (
+                    ("ledger", models.MemberCredit.objects.filter(agency_user_id=row["agency_user"])),
+                    ("balance row", models.MemberCreditBalance.objects.filter(agency_user_id=row["agency_user"])),
+                ):
+                    start = time.perf_counter()
+                    for _ in range(options["repeat"]):
+                        list(qs.balance())
+                    durations[name] = (time.perf_counter() - start) / options["repeat"]
+                self.stdout.write(
+                    f"agency user {row['agency_user']} with {row['entries']} entries: "
+                    + ", ".join(f"{name} {duration * 1000:.2f}ms" for name, duration in durations.items())
+                )
+            transaction.set_rollback(True, using="main")
+
+    def add_fake_entries(self, row: dict, count: int) -> None:
+        agency_user = models.AgencyUser.objects.get(id=row["agency_user"])
+        models.MemberCredit.objects.bulk_create(
+            [
+                models.MemberCredit(
+                    agency_user=agency_user,
+                    credit=Money(1, "USD") if i % 2 else None,
+                    debt=None if i % 2 else Money(1, "USD"),
+                    created_by_id=agency_user.user_id,
+                    description="bench_wallet_balance",
+                )
+                for i in range(count)
+            ],
+            batch_size=1000,
+        )
+        services.rebuild_membercredit_balances(agency_user_ids=[agency_user.id])
+        row["entries"] += count
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from ... import models, services
+
+
+class Command(BaseCommand):
+    help = "rebuilds the wallet balance rows from the MemberCredit ledger"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--agency-user-id", type=int, action="append", dest="agency_user_ids")
+        parser.add_argument("--batch-size", type=int, default=services.MEMBERCREDIT_BALANCES_REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        agency_user_ids = options["agency_user_ids"]
+        if agency_user_ids is None:
+            agency_user_ids = sorted(
+                set(models.MemberCredit.objects.values_list("agency_user_id", flat=True).distinct())
+                | set(models.MemberCreditBalance.objects.values_list("agency_user_id", flat=True))
+            )
+        batch_size = options["batch_size"]
+        fixed_count = 0
+        for i in range(0, len(agency_user_ids), batch_size):
+            fixed_count += services.rebuild_membercredit_balances(agency_user_ids=agency_user_ids[i : i + batch_size])
+        self.stdout.write(f"{len(agency_user_ids)} agency users checked, {fixed_count} balances fixed")
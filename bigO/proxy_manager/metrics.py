@@ -7,3 +7,9 @@ sublink_request_total_counter = meter.create_counter(
     unit="1",
     description="Number of sublink requests",
 )
+
+xray_users_delta_counter = meter.create_counter(
+    name="xray.users.delta",
+    unit="1",
+    description="Number of xray users deltas given to the nodes",
+)
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:12
+
+import django_jsonform.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("proxy_manager", "0038_connectionrule_client_json_template_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="historicalinboundtype",
+            name="consumer_obj_schema",
+            field=django_jsonform.models.fields.JSONField(
+                blank=True,
+                help_text="consumer objects are generated from this in bulk instead of consumer_obj_template",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="inboundtype",
+            name="consumer_obj_schema",
+            field=django_jsonform.models.fields.JSONField(
+                blank=True,
+                help_text="consumer objects are generated from this in bulk instead of consumer_obj_template",
+                null=True,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="historicalinboundtype",
+            name="consumer_obj_template",
+            field=models.TextField(blank=True, help_text="{{ subscriptionperiod_obj }}"),
+        ),
+        migrations.AlterField(
+            model_name="inboundtype",
+            name="consumer_obj_template",
+            field=models.TextField(blank=True, help_text="{{ subscriptionperiod_obj }}"),
+        ),
+    ]
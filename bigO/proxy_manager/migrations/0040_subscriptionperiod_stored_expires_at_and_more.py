@@ -0,0 +1,134 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:40
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import ROUND_FLOOR, Decimal
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+
+BATCH_SIZE = 500
+STORED_LIMITS_FIELDS = [
+    "stored_expires_at",
+    "stored_total_limit_bytes",
+    "stored_limit_passed_type",
+    "stored_limits_at",
+]
+
+
+def get_stored_limits(period, balances, now):
+    """
+    a frozen copy of the plan providers annotations (ann_expires_at, ann_total_limit_bytes and ann_limit_passed_type)
+    as they are at this migration, the historical models do not have the provider querysets so it is done in python
+    """
+    plan = period.plan
+    provider_args = plan.plan_provider_args or {}
+    plan_args = period.plan_args or {}
+    if plan.plan_provider_key in ("type_simple_strict1", "type_simple_dynamic1"):
+        args = provider_args if plan.plan_provider_key == "type_simple_strict1" else plan_args
+        total_limit_bytes = int(args["total_usage_limit_bytes"])
+        expires_at = (period.first_usage_at or now) + timedelta(seconds=int(args["expiry_seconds"]))
+    elif plan.plan_provider_key == "type_simple_as_you_go1":
+        balance = balances.get((period.profile.user_id, period.profile.initial_agency_id, plan.base_currency), 0)
+        per_gb_price = Decimal(str(provider_args["per_gb_price"]))
+        paid_gb = (Decimal(balance) / per_gb_price).to_integral_value(ROUND_FLOOR) if per_gb_price > 0 else 0
+        # the debts may pass the credits, the column is positive
+        total_limit_bytes = max(int(plan_args["paid_bytes"]) + int(paid_gb) * 1_000_000_000, 0)
+        expires_at = None
+    else:
+        return None, None, None
+    if total_limit_bytes - period.current_download_bytes - period.current_upload_bytes <= 0:
+        limit_passed_type = "traffic_limit"
+    elif expires_at is not None and expires_at < now:
+        limit_passed_type = "expired"
+    else:
+        limit_passed_type = None
+    # the expiry of the not started periods is not known yet
+    stored_expires_at = expires_at if period.first_usage_at is not None else None
+    return stored_expires_at, total_limit_bytes, limit_passed_type
+
+
+def populate(apps, schema_editor):
+    """refresh_subscriptionperiods_stored_limits keeps them fresh from now on"""
+    db_alias = schema_editor.connection.alias
+    MemberCredit = apps.get_model("proxy_manager", "MemberCredit")
+    SubscriptionPeriod = apps.get_model("proxy_manager", "SubscriptionPeriod")
+    now = timezone.now()
+
+    balances = defaultdict(Decimal)
+    for field, sign in (("credit", 1), ("debt", -1)):
+        rows = (
+            MemberCredit.objects.using(db_alias)
+            .filter(**{f"{field}__isnull": False})
+            .order_by()
+            .values("agency_user__user_id", "agency_user__agency_id", f"{field}_currency")
+            .annotate(amount=Sum(field))
+        )
+        for row in rows:
+            key = (row["agency_user__user_id"], row["agency_user__agency_id"], row[f"{field}_currency"])
+            balances[key] += sign * Decimal(getattr(row["amount"], "amount", row["amount"]))
+
+    subscriptionperiod_qs = (
+        SubscriptionPeriod.objects.using(db_alias)
+        .filter(selected_as_current=True)
+        .select_related("plan", "profile")
+        .order_by("id")
+    )
+    batch = []
+    for period in subscriptionperiod_qs.iterator(chunk_size=BATCH_SIZE):
+        (
+            period.stored_expires_at,
+            period.stored_total_limit_bytes,
+            period.stored_limit_passed_type,
+        ) = get_stored_limits(period, balances, now)
+        period.stored_limits_at = now
+        batch.append(period)
+        if len(batch) >= BATCH_SIZE:
+            SubscriptionPeriod.objects.using(db_alias).bulk_update(batch, fields=STORED_LIMITS_FIELDS)
+            batch = []
+    if batch:
+        SubscriptionPeriod.objects.using(db_alias).bulk_update(batch, fields=STORED_LIMITS_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("proxy_manager", "0039_inboundtype_consumer_obj_schema_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="subscriptionperiod",
+            name="stored_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="subscriptionperiod",
+            name="stored_limit_passed_type",
+            field=models.CharField(blank=True, max_length=31, null=True),
+        ),
+        migrations.AddField(
+            model_name="subscriptionperiod",
+            name="stored_limits_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="subscriptionperiod",
+            name="stored_total_limit_bytes",
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="subscriptionperiod",
+            index=models.Index(
+                condition=models.Q(("selected_as_current", True)),
+                fields=["stored_limit_passed_type", "stored_expires_at"],
+                name="subscriptionperiod_connectable",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="subscriptionperiod",
+            index=models.Index(fields=["stored_limits_at"], name="subscriptionperiod_limits_at"),
+        ),
+        migrations.RunPython(populate, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:05
+from decimal import Decimal
+
+import djmoney.models.fields
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, F, Sum, When
+from django.db.models.functions import Coalesce
+
+
+def build_membercreditbalances(apps, schema_editor):
+    MemberCredit = apps.get_model("proxy_manager", "MemberCredit")
+    MemberCreditBalance = apps.get_model("proxy_manager", "MemberCreditBalance")
+    db_alias = schema_editor.connection.alias
+    ledger_balances = (
+        MemberCredit.objects.using(db_alias)
+        .annotate(
+            currency=Case(
+                When(credit__isnull=False, then=F("credit_currency")),
+                When(debt__isnull=False, then=F("debt_currency")),
+            )
+        )
+        .order_by()
+        .values("agency_user", "currency")
+        .annotate(balance=Coalesce(Sum("credit"), Decimal(0)) - Coalesce(Sum("debt"), Decimal(0)))
+    )
+    MemberCreditBalance.objects.using(db_alias).bulk_create(
+        [
+            MemberCreditBalance(agency_user_id=i["agency_user"], balance=i["balance"], balance_currency=i["currency"])
+            for i in ledger_balances
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("proxy_manager", "0040_subscriptionperiod_stored_expires_at_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MemberCreditBalance",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "balance_currency",
+                    djmoney.models.fields.CurrencyField(
+                        choices=[("EUR", "Euro"), ("IRR", "Iranian Rial"), ("USD", "US Dollar")],
+                        default="USD",
+                        editable=False,
+                        max_length=3,
+                    ),
+                ),
+                ("balance", djmoney.models.fields.MoneyField(decimal_places=2, default_currency="USD", max_digits=14)),
+                (
+                    "agency_user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="+", to="proxy_manager.agencyuser"
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-created_at"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("agency_user", "balance_currency"),
+                        name="unique_agency_user_currency_membercreditbalance",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(build_membercreditbalances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("proxy_manager", "0041_membercreditbalance"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="config",
+            name="xray_hot_users",
+            field=models.BooleanField(
+                default=False,
+                help_text="users of the inbounds with consumer_obj_schema are added and removed by goingto through xray api instead of restarting xray, the nodes goingto should support it",
+            ),
+        ),
+        migrations.AddField(
+            model_name="historicalconfig",
+            name="xray_hot_users",
+            field=models.BooleanField(
+                default=False,
+                help_text="users of the inbounds with consumer_obj_schema are added and removed by goingto through xray api instead of restarting xray, the nodes goingto should support it",
+            ),
+        ),
+    ]
@@ -46,6 +46,11 @@ class Config(TimeStampedModel, SingletonModel):
     )
     admin_panel_influx_delays = models.BooleanField(default=True)
     usage_correction_factor = models.DecimalField(max_digits=4, decimal_places=2, null=True, blank=True)
+    xray_hot_users = models.BooleanField(
+        default=False,
+        help_text="users of the inbounds with consumer_obj_schema are added and removed by goingto through xray api "
+        "instead of restarting xray, the nodes goingto should support it",
+    )
     history = HistoricalRecords()
 
 
@@ -271,7 +276,14 @@ class InboundType(TimeStampedModel, models.Model):
     inbound_template = models.TextField(
         help_text="{{ config, node_obj, inbound_tag, consumers_part, combo_stat: {'address', 'port', 'sni', 'domainhostheader'} }}"
     )
-    consumer_obj_template = models.TextField(help_text="{{ subscriptionperiod_obj }}")
+    consumer_obj_template = models.TextField(blank=True, help_text="{{ subscriptionperiod_obj }}")
+    CONSUMER_OBJ_SCHEMA = typing.ConsumerObjSchema.model_json_schema()
+    consumer_obj_schema = django_jsonform.models.fields.JSONField(
+        schema=CONSUMER_OBJ_SCHEMA,
+        null=True,
+        blank=True,
+        help_text="consumer objects are generated from this in bulk instead of consumer_obj_template",
+    )
     link_template = models.TextField(
         blank=True,
         null=True,
@@ -303,6 +315,15 @@ class InboundType(TimeStampedModel, models.Model):
     def __str__(self):
         return f"{self.pk}-{self.name}"
 
+    def clean(self):
+        if self.consumer_obj_schema:
+            try:
+                typing.ConsumerObjSchema(**self.consumer_obj_schema)
+            except Exception as e:
+                raise ValidationError(f"consumer_obj_schema is not valid, {str(e)}")
+        elif not self.consumer_obj_template:
+            raise ValidationError("either consumer_obj_template or consumer_obj_schema")
+
 
 class SubscriptionNodeUsage(TimeStampedModel, models.Model):
     # to stats db
@@ -8,8 +8,9 @@ from bigO.finance import models as finance_models
 from bigO.users.models import User
 from bigO.utils.models import TimeStampedModel
 from django.db import models, transaction
-from django.db.models import Case, CheckConstraint, ExpressionWrapper, F, Q, Sum, When
+from django.db.models import Case, CheckConstraint, ExpressionWrapper, F, Q, Sum, UniqueConstraint, When
 from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 
 class SubscriptionPlanInvoiceItem(finance_models.InvoiceItem):
@@ -173,6 +174,76 @@ class MemberCredit(TimeStampedModel, models.Model):
             )
         ]
 
+    @property
+    def balance_change(self) -> Money:
+        """what this row adds to the balance, in the currency that ann_currency gives it"""
+        currency = self.credit_currency if self.credit is not None else self.debt_currency
+        amount = (self.credit.amount if self.credit is not None else 0) - (
+            self.debt.amount if self.debt is not None else 0
+        )
+        return Money(amount=amount, currency=currency)
+
+    @transaction.atomic(using="main")
+    def save(self, *args, **kwargs):
+        from .. import services
+
+        if self._state.adding:
+            super().save(*args, **kwargs)
+            MemberCreditBalance.objects.add(agency_user_id=self.agency_user_id, amount=self.balance_change)
+            return
+        # the previous amounts are not known here, so the balances are rebuilt from the ledger
+        prev_agency_user_id = MemberCredit.objects.filter(pk=self.pk).values_list("agency_user_id", flat=True).first()
+        super().save(*args, **kwargs)
+        services.rebuild_membercredit_balances(agency_user_ids={self.agency_user_id, prev_agency_user_id} - {None})
+
+
+class MemberCreditBalance(TimeStampedModel, models.Model):
+    """
+    the running balance of the MemberCredit rows of an agency user in a currency,
+    changed in the same transaction that adds the rows
+    """
+
+    class MemberCreditBalanceQuerySet(models.QuerySet):
+        @understands_money
+        def balance(self, currency: str = None):
+            """same results as MemberCredit.objects.balance without going through the ledger"""
+            if currency:
+                obj = self.filter(balance_currency=str(currency)).first()
+                return obj.balance if obj else Money(amount=0, currency=currency)
+            return self.order_by("balance_currency").values("agency_user", "balance", currency=F("balance_currency"))
+
+        def get_locked(self, agency_user_id: int, currency: str) -> "MemberCreditBalance | None":
+            """the row is locked until the end of the current transaction"""
+            qs = self.select_for_update().filter(agency_user_id=agency_user_id, balance_currency=str(currency))
+            return qs.first()
+
+        def add(self, agency_user_id: int, amount: Money) -> None:
+            currency = str(amount.currency)
+            lookup = {"agency_user_id": agency_user_id, "balance_currency": currency}
+            # the update locks the row as well
+            updated = self.filter(**lookup).update(balance=F("balance") + amount.amount, updated_at=timezone.now())
+            if updated:
+                return
+            obj, created = self.get_or_create(**lookup, defaults={"balance": amount})
+            if not created:
+                self.filter(pk=obj.pk).update(balance=F("balance") + amount.amount, updated_at=timezone.now())
+
+    agency_user = models.ForeignKey("AgencyUser", on_delete=models.CASCADE, related_name="+")
+    balance = MoneyField(max_digits=14, decimal_places=2, default_currency="USD")
+
+    objects = money_manager(MemberCreditBalanceQuerySet.as_manager())
+
+    class Meta:
+        ordering = ["-created_at"]
+        constraints = [
+            UniqueConstraint(
+                fields=("agency_user", "balance_currency"), name="unique_agency_user_currency_membercreditbalance"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.pk}-{self.agency_user_id}({self.balance})"
+
 
 class AgencyPaymentType(TimeStampedModel, models.Model):
     agencyusergroup = models.ForeignKey("AgencyUserGroup", on_delete=models.CASCADE, related_name="+")
@@ -209,6 +209,12 @@ class SubscriptionPeriod(TimeStampedModel, models.Model):
     flow_point_at = models.DateTimeField(null=True, blank=True)
     last_flow_sync_at = models.DateTimeField(null=True, blank=True)
 
+    # materialized annotations of the plan provider, see services.refresh_subscriptionperiods_stored_limits
+    stored_expires_at = models.DateTimeField(null=True, blank=True)
+    stored_total_limit_bytes = models.PositiveBigIntegerField(null=True, blank=True)
+    stored_limit_passed_type = models.CharField(max_length=31, null=True, blank=True)
+    stored_limits_at = models.DateTimeField(null=True, blank=True)
+
     objects = SubscriptionPeriodQuerySet.as_manager()
 
     class Meta:
@@ -218,6 +224,14 @@ class SubscriptionPeriod(TimeStampedModel, models.Model):
                 fields=("profile",), condition=Q(selected_as_current=True), name="one_selected_as_current_each_profile"
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["stored_limit_passed_type", "stored_expires_at"],
+                condition=Q(selected_as_current=True),
+                name="subscriptionperiod_connectable",
+            ),
+            models.Index(fields=["stored_limits_at"], name="subscriptionperiod_limits_at"),
+        ]
 
     def __str__(self):
         return f"{self.pk}-|{self.profile}|{self.plan}"
@@ -1,13 +1,21 @@
+import datetime
 import logging
 import random
 from collections import defaultdict
+from hashlib import sha256
 from types import SimpleNamespace
 
+import redis.exceptions
 import sentry_sdk
 from asgiref.sync import sync_to_async
+from django_redis import get_redis_connection
 
 import django.template
+from bigO.utils.dependency_versions import DependencyVersion
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models import Q
+from django.utils import timezone
 
 from .. import models, typing
 
@@ -15,11 +23,75 @@ logger = logging.getLogger(__name__)
 
 
 def get_connectable_subscriptionperiod_qs():
+    """uses the stored limits, the expiry is checked again as it may be passed since they are stored"""
+    return models.SubscriptionPeriod.objects.filter(
+        Q(stored_limit_passed_type__isnull=True, selected_as_current=True, profile__is_active=True)
+        & Q(Q(stored_expires_at__isnull=True) | Q(stored_expires_at__gte=timezone.now()))
+    )
+
+
+def get_annotated_connectable_subscriptionperiod_qs():
+    """the same as get_connectable_subscriptionperiod_qs computed by the plan providers annotations"""
     return models.SubscriptionPeriod.objects.ann_limit_passed_type().filter(
         Q(limit_passed_type__isnull=True, selected_as_current=True, profile__is_active=True)
     )
 
 
+SUBSCRIPTIONPERIOD_STORED_LIMITS_BATCH_SIZE = 500
+
+
+def refresh_subscriptionperiods_stored_limits(subscriptionperiod_qs) -> int:
+    """
+    materializes expires_at, total_limit_bytes and limit_passed_type of the plan providers on the periods,
+    the expiry of the not started periods is not known yet so it is stored as null
+    """
+    now = timezone.now()
+    subscriptionperiods = list(
+        subscriptionperiod_qs.ann_limit_passed_type().ann_total_limit_bytes().only("id", "first_usage_at")
+    )
+    for subscriptionperiod in subscriptionperiods:
+        if subscriptionperiod.first_usage_at is None:
+            subscriptionperiod.stored_expires_at = None
+        else:
+            subscriptionperiod.stored_expires_at = subscriptionperiod.expires_at
+        subscriptionperiod.stored_total_limit_bytes = subscriptionperiod.total_limit_bytes
+        subscriptionperiod.stored_limit_passed_type = subscriptionperiod.limit_passed_type
+        subscriptionperiod.stored_limits_at = now
+    models.SubscriptionPeriod.objects.using(subscriptionperiod_qs.db).bulk_update(
+        subscriptionperiods,
+        fields=["stored_expires_at", "stored_total_limit_bytes", "stored_limit_passed_type", "stored_limits_at"],
+        batch_size=SUBSCRIPTIONPERIOD_STORED_LIMITS_BATCH_SIZE,
+    )
+    return len(subscriptionperiods)
+
+
+def subscriptionperiod_limits_dependency_changed(sender, instance, using: str, **kwargs) -> None:
+    """post_save and post_delete receiver of the models the plan providers annotations depend on"""
+    if sender is models.SubscriptionPeriod:
+        subscriptionperiod_qs = models.SubscriptionPeriod.objects.filter(id=instance.id)
+    elif sender is models.SubscriptionPlan:
+        subscriptionperiod_qs = models.SubscriptionPeriod.objects.filter(plan=instance, selected_as_current=True)
+    elif sender is models.MemberCredit:
+        from ..subscription.planproviders import TypeSimpleAsYouGO1
+
+        try:
+            agency_user = instance.agency_user
+        except models.AgencyUser.DoesNotExist:
+            # deleted along with its agency user
+            return
+        subscriptionperiod_qs = models.SubscriptionPeriod.objects.filter(
+            profile__user_id=agency_user.user_id,
+            profile__initial_agency_id=agency_user.agency_id,
+            plan__plan_provider_key=TypeSimpleAsYouGO1.TYPE_IDENTIFIER,
+            selected_as_current=True,
+        )
+    else:
+        return
+    transaction.on_commit(
+        lambda: refresh_subscriptionperiods_stored_limits(subscriptionperiod_qs.using(using)), using=using
+    )
+
+
 def get_agent_current_subscriptionperiods_qs(agent: models.Agent):
     return models.SubscriptionPeriod.objects.filter(
         profile__initial_agency_id=agent.agency_id, selected_as_current=True
@@ -30,6 +102,63 @@ def get_agent_current_subscriptionprofiled_qs(agent: models.Agent):
     return models.SubscriptionProfile.objects.filter(initial_agency_id=agent.agency_id)
 
 
+SUBLINK_CACHE_TIMEOUT = 10 * 60
+sublink_version = DependencyVersion(
+    key="sublink_version",
+    dependent_apps={"core", "node_manager", "proxy_manager"},
+    # part of the cache key by their updated_at
+    independent_models={
+        "proxy_manager.ConnectionRule",
+        "proxy_manager.SubscriptionPeriod",
+        "proxy_manager.SubscriptionPlan",
+        "proxy_manager.SubscriptionProfile",
+    },
+)
+
+
+async def get_sublink_cache_key(
+    subscriptionprofile_obj: models.SubscriptionProfile,
+    subscriptionperiod_obj: models.SubscriptionPeriod,
+    style_type: str,
+    fingerprint_bucket: str | None,
+) -> str:
+    """
+    the cached part of a sublink is dropped whenever the profile, the period, its plan or connection rule is saved,
+    the other models it is rendered from (inbound specs, reality specs, domains, ...) bump the sublink version
+    """
+    plan = subscriptionperiod_obj.plan
+    parts = (
+        await sublink_version.aget(),
+        subscriptionprofile_obj.id,
+        subscriptionprofile_obj.updated_at.timestamp(),
+        subscriptionperiod_obj.id,
+        subscriptionperiod_obj.updated_at.timestamp(),
+        plan.updated_at.timestamp(),
+        plan.connection_rule.updated_at.timestamp(),
+        style_type,
+        fingerprint_bucket,
+    )
+    return "sublink_" + sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+SUBLINK_ACCESS_KEY = "sublink_access"
+SUBLINK_ACCESS_FLUSH_DELAY = 60
+
+
+def record_sublink_access(subscriptionperiod_id: int, at: datetime.datetime) -> None:
+    """keeps only the latest access time of each period, tasks.flush_sublink_accesses writes them in batches"""
+    try:
+        redis_conn = get_redis_connection("default")
+        redis_conn.hset(SUBLINK_ACCESS_KEY, str(subscriptionperiod_id), at.timestamp())
+    except redis.exceptions.RedisError as e:
+        sentry_sdk.capture_exception(e)
+        return
+    if cache.add("sublink_access_flush_kick", 1, timeout=SUBLINK_ACCESS_FLUSH_DELAY):
+        from .. import tasks
+
+        tasks.flush_sublink_accesses.apply_async(countdown=SUBLINK_ACCESS_FLUSH_DELAY)
+
+
 async def get_profile_proxies(subscriptionperiod_obj: models.SubscriptionPeriod) -> list[str]:
     res_lines = []
     connection_rule = subscriptionperiod_obj.plan.connection_rule
@@ -3,19 +3,24 @@ import logging
 import pathlib
 import random
 import re
+import time
 from collections import defaultdict
 from decimal import ROUND_HALF_DOWN, Decimal
 from hashlib import sha256
 from typing import Protocol
 
+import pydantic
 import sentry_sdk
 
+import django.db.models
 import django.template
 from bigO.core import models as core_models
 from bigO.node_manager import models as node_manager_models
 from bigO.node_manager import services as node_manager_services
 from bigO.node_manager import typing as node_manager_typing
-from django.db.models import Prefetch, Q
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Count, Max, Prefetch, Q
 from django.urls import reverse
 from django.utils import timezone
 
@@ -30,9 +35,13 @@ def get_proxy_manager_nginx_conf_v1(node_obj) -> tuple[str, str, dict] | None:
     proxy_manager_config = models.Config.objects.get()
     context = django.template.Context({"node_obj": node_obj})
     nginx_config_http_template = "{% load node_manager %}" + proxy_manager_config.nginx_config_http_template
-    nginx_config_http_result = django.template.Template(nginx_config_http_template).render(context=context)
+    nginx_config_http_result = node_manager_services.template_registry.get(
+        nginx_config_http_template, obj=proxy_manager_config, field="nginx_config_http_template"
+    ).render(context=context)
     nginx_config_stream_template = "{% load node_manager %}" + proxy_manager_config.nginx_config_stream_template
-    nginx_config_stream_result = django.template.Template(nginx_config_stream_template).render(context=context)
+    nginx_config_stream_result = node_manager_services.template_registry.get(
+        nginx_config_stream_template, obj=proxy_manager_config, field="nginx_config_stream_template"
+    ).render(context=context)
     return nginx_config_http_result, nginx_config_stream_result, context.get("deps", {"globals": []})
 
 
@@ -48,11 +57,13 @@ def get_proxy_manager_nginx_conf_v2(
         base_url=base_url,
     )
     nginx_config_http_template = "{% load node_manager %}" + proxy_manager_config.nginx_config_http_template
-    nginx_config_http_result = django.template.Template(nginx_config_http_template).render(context=template_context)
+    nginx_config_http_result = node_manager_services.template_registry.get(
+        nginx_config_http_template, obj=proxy_manager_config, field="nginx_config_http_template"
+    ).render(context=template_context)
     nginx_config_stream_template = "{% load node_manager %}" + proxy_manager_config.nginx_config_stream_template
-    nginx_config_stream_result = django.template.Template(nginx_config_stream_template).render(
-        context=template_context
-    )
+    nginx_config_stream_result = node_manager_services.template_registry.get(
+        nginx_config_stream_template, obj=proxy_manager_config, field="nginx_config_stream_template"
+    ).render(context=template_context)
     new_files = node_manager_services.get_configdependentcontents_from_context(template_context)
     return nginx_config_http_result, nginx_config_stream_result, new_files
 
@@ -153,7 +164,7 @@ def get_connection_tunnel(node_obj: node_manager_models.Node):
                     continue
             else:
                 dest_addr = "127.0.0.1"
-            inbound_part = django.template.Template(dokodemo_template).render(
+            inbound_part = node_manager_services.template_registry.get(dokodemo_template).render(
                 django.template.Context(
                     {
                         "local_port": localtunnelport.local_port,
@@ -168,7 +179,7 @@ def get_connection_tunnel(node_obj: node_manager_models.Node):
             else:
                 inbound_parts = inbound_part
 
-        rule_part = django.template.Template(rule_template).render(
+        rule_part = node_manager_services.template_registry.get(rule_template).render(
             django.template.Context(
                 {"balancer_tag": balancer_tag, "inbounds": ", ".join([f'"{i}"' for i in inbound_tags])}
             )
@@ -193,8 +204,10 @@ def get_connection_tunnel(node_obj: node_manager_models.Node):
                 combo_stat = direct_tunnel_outbound.connector.inbound_spec.get_combo_stat()
             else:
                 combo_stat = None
-            xray_outbounds[outbound_tag] = django.template.Template(
-                direct_tunnel_outbound.connector.outbound_type.xray_outbound_template
+            xray_outbounds[outbound_tag] = node_manager_services.template_registry.get(
+                direct_tunnel_outbound.connector.outbound_type.xray_outbound_template,
+                obj=direct_tunnel_outbound.connector.outbound_type,
+                field="xray_outbound_template",
             ).render(
                 django.template.Context(
                     {
@@ -273,8 +286,10 @@ def get_connection_tunnel(node_obj: node_manager_models.Node):
                 combo_stat = bridge_reverse.connector.inbound_spec.get_combo_stat()
             else:
                 combo_stat = None
-            xray_outbounds[interconn_outbound_tag] = django.template.Template(
-                bridge_reverse.connector.outbound_type.xray_outbound_template
+            xray_outbounds[interconn_outbound_tag] = node_manager_services.template_registry.get(
+                bridge_reverse.connector.outbound_type.xray_outbound_template,
+                obj=bridge_reverse.connector.outbound_type,
+                field="xray_outbound_template",
             ).render(
                 django.template.Context(
                     {
@@ -326,11 +341,254 @@ def get_connection_tunnel(node_obj: node_manager_models.Node):
 
 
 XRAY_KEY = "xray"
+# fingerprints cover what the templates are expected to use, the timeouts bound the rest (time, untracked fields)
+XRAY_CONF_CACHE_TIMEOUT = 5 * 60
+XRAY_FRAGMENT_CACHE_TIMEOUT = 60 * 60
+XRAY_MODELS_VERSION_CACHE_TIMEOUT = 10
+xray_conf_versioned_models = [
+    core_models.Certificate,
+    core_models.Domain,
+    node_manager_models.PublicIP,
+    node_manager_models.NodePublicIP,
+    node_manager_models.ProgramVersion,
+    node_manager_models.ProgramBinary,
+    node_manager_models.NodeInnerProgram,
+    models.ConnectionRule,
+    models.ConnectionRuleOutbound,
+    models.ConnectionRuleBalancer,
+    models.Balancer,
+    models.OutboundConnector,
+    models.OutboundType,
+    models.InboundType,
+    models.InboundSpec,
+    models.RealitySpec,
+    models.InternalUser,
+    models.ConnectionTunnel,
+    models.ConnectionTunnelOutbound,
+    models.LocalTunnelPort,
+]
+
+
+def get_fingerprint(*parts) -> str:
+    h = sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def get_proxyuser_fingerprint(proxyuser: typing.ProxyUserProtocol) -> str:
+    return f"{proxyuser.xray_email()}|{proxyuser.xray_uuid}"
+
+
+def get_xray_models_version() -> list:
+    """(label, max updated_at, count) of each model that xray config is built from, shared between nodes"""
+
+    def _get():
+        return [
+            (
+                model._meta.label,
+                *model.objects.order_by().aggregate(max_updated_at=Max("updated_at"), count=Count("pk")).values(),
+            )
+            for model in xray_conf_versioned_models
+        ]
+
+    return cache.get_or_set("xray_conf_models_version", _get, XRAY_MODELS_VERSION_CACHE_TIMEOUT)
+
+
+def get_xray_conf_fingerprint(node_obj, node_work_dir: pathlib.Path, base_url: str) -> str:
+    site_config: core_models.SiteConfiguration = core_models.SiteConfiguration.objects.get()
+    proxy_manager_config = models.Config.objects.get()
+    connection_rule_ids = list(
+        models.ConnectionRule.objects.filter(
+            Q(rule_outbounds__apply_node=node_obj) | Q(rule_outbounds__connector__dest_node=node_obj)
+        )
+        .order_by("id")
+        .values_list("id", flat=True)
+        .distinct()
+    )
+    subscriptionperiods = list(
+        services.get_connectable_subscriptionperiod_qs()
+        .filter(plan__connection_rule_id__in=connection_rule_ids)
+        .order_by("id")
+        .values_list("id", "plan__connection_rule_id", "profile__xray_uuid")
+    )
+    return get_fingerprint(
+        node_obj.id,
+        node_obj.updated_at,
+        node_work_dir,
+        base_url,
+        site_config.main_xray_id,
+        sha256(site_config.htpasswd_content.encode()).hexdigest() if site_config.htpasswd_content else None,
+        proxy_manager_config.updated_at,
+        get_xray_models_version(),
+        connection_rule_ids,
+        subscriptionperiods,
+    )
+
+
+def render_fragment(
+    kind: str,
+    fingerprint: str,
+    template: str,
+    context: django.template.Context,
+    obj: django.db.models.Model | None = None,
+    field: str | None = None,
+) -> tuple[str, list[node_manager_typing.FileSchema]]:
+    cache_key = f"xray_fragment_{kind}_{fingerprint}"
+    if (res := cache.get(cache_key)) is not None:
+        return res
+    content = node_manager_services.template_registry.get(template, obj=obj, field=field).render(context=context)
+    res = (content, node_manager_services.get_configdependentcontents_from_context(context))
+    cache.set(cache_key, res, XRAY_FRAGMENT_CACHE_TIMEOUT)
+    return res
+
+
+def get_consumer_obj_schema(inbound: models.InboundType) -> typing.ConsumerObjSchema | None:
+    if not inbound.consumer_obj_schema:
+        return None
+    try:
+        return typing.ConsumerObjSchema(**inbound.consumer_obj_schema)
+    except pydantic.ValidationError as e:
+        sentry_sdk.capture_exception(e)
+        logger.critical(f"invalid consumer_obj_schema of {inbound=}, falling back to consumer_obj_template")
+        return None
+
+
+def get_consumer_objs(consumer_obj_schema: typing.ConsumerObjSchema, proxyuser_values: list[dict]) -> list[dict]:
+    fields = consumer_obj_schema.fields.items()
+    return [{**consumer_obj_schema.constants, **{key: i[source] for key, source in fields}} for i in proxyuser_values]
 
 
-@node_manager_services.process_conf.register_getter(key=XRAY_KEY, satisfies={node_manager_services.HAPROXY_KEY})
+def get_bulk_consumers_part(consumer_obj_schema: typing.ConsumerObjSchema, proxyuser_values: list[dict]) -> str:
+    consumer_objs = get_consumer_objs(consumer_obj_schema, proxyuser_values=proxyuser_values)
+    # one encoder pass for all, then the list brackets are dropped since consumers_part is embedded in a list
+    return json.dumps(consumer_objs, separators=(",", ":"))[1:-1]
+
+
+# the protocols that goingto can add users to
+XRAY_HOT_USERS_PROTOCOLS = ("vmess", "vless", "trojan", "shadowsocks")
+XRAY_USERS_SNAPSHOT_TIMEOUT = 24 * 60 * 60
+XRAY_USERS_TOKEN_SALT = "proxy_manager.xray_users"
+XRAY_USERS_TOKEN_STABLE_SECONDS = 24 * 60 * 60
+# the config of the node is synced far more often, so the token is renewed long before
+XRAY_USERS_TOKEN_MAX_AGE = 3 * XRAY_USERS_TOKEN_STABLE_SECONDS
+
+
+def get_hot_inbound(xray_inbound: str) -> dict | None:
+    """the parsed inbound if goingto can alter its users, the ones with comments or more than one object are not"""
+    try:
+        inbound = json.loads(xray_inbound)
+    except ValueError:
+        return None
+    if not isinstance(inbound, dict) or not inbound.get("tag"):
+        return None
+    if inbound.get("protocol") not in XRAY_HOT_USERS_PROTOCOLS:
+        return None
+    return inbound
+
+
+class XrayUsersTokenSigner(signing.TimestampSigner):
+    def timestamp(self):
+        # stable for a while so that the rendered goingto config does not change on every sync
+        now = int(time.time())
+        return signing.b62_encode(now - now % XRAY_USERS_TOKEN_STABLE_SECONDS)
+
+
+def get_xray_users_token(node_obj) -> str | None:
+    """tied to a usable api key of the node, so it stops working once that key is revoked or expired"""
+    api_key = node_obj.apikeys.get_usable_keys().order_by("-created").first()
+    if api_key is None:
+        return None
+    return XrayUsersTokenSigner(salt=XRAY_USERS_TOKEN_SALT).sign(f"{node_obj.id}:{api_key.prefix}")
+
+
+def get_xray_users_token_node_id(token: str) -> int | None:
+    try:
+        value = XrayUsersTokenSigner(salt=XRAY_USERS_TOKEN_SALT).unsign(token, max_age=XRAY_USERS_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    node_id, _, prefix = value.partition(":")
+    if not node_manager_models.NodeAPIKey.objects.get_usable_keys().filter(node_id=node_id, prefix=prefix).exists():
+        return None
+    return int(node_id)
+
+
+def set_xray_users_snapshot(node_id: int, snapshot: dict[str, dict]) -> int:
+    """
+    keeps the users of the hot inbounds ({tag: {protocol, users: {email: consumer_obj}}}) under a new revision
+    if they have changed, returns the current revision
+    """
+    current_key = f"xray_users_current_{node_id}"
+    digest = sha256(json.dumps(snapshot, sort_keys=True).encode("utf-8")).hexdigest()
+    current = cache.get(current_key)
+    if current is not None and current[1] == digest:
+        if cache.touch(f"xray_users_{node_id}_{current[0]}", XRAY_USERS_SNAPSHOT_TIMEOUT):
+            return current[0]
+    # time based, so a lost current key does not hand out a revision that a node has already acknowledged
+    revision = time.time_ns() // 1_000_000
+    if current is not None:
+        revision = max(revision, current[0] + 1)
+    cache.set(f"xray_users_{node_id}_{revision}", snapshot, XRAY_USERS_SNAPSHOT_TIMEOUT)
+    cache.set(current_key, (revision, digest), None)
+    return revision
+
+
+def get_xray_users_delta(node_id: int, since: int) -> dict | None:
+    """
+    the users to remove and add on each hot inbound to get from the since revision to the current one,
+    when since is 0 or expired all the users are given (full), goingto asks for it when xray has restarted
+    """
+    current = cache.get(f"xray_users_current_{node_id}")
+    if current is None:
+        return None
+    revision = current[0]
+    snapshot = cache.get(f"xray_users_{node_id}_{revision}")
+    if snapshot is None:
+        return None
+    acked_key = f"xray_users_acked_{node_id}"
+    base = cache.get(f"xray_users_{node_id}_{since}") if since else None
+    full = base is None
+    if full:
+        # xray may have been kept running, so the users of the last acknowledged revision are the ones to remove
+        acked = cache.get(acked_key)
+        base = (acked and cache.get(f"xray_users_{node_id}_{acked}")) or {}
+    else:
+        cache.set(acked_key, since, None)
+
+    inbounds = {}
+    for tag in snapshot.keys() | base.keys():
+        users = snapshot[tag]["users"] if tag in snapshot else {}
+        base_users = base[tag]["users"] if tag in base else {}
+        removed = [email for email, consumer_obj in base_users.items() if users.get(email) != consumer_obj]
+        if full:
+            added = list(users.values())
+        else:
+            added = [consumer_obj for email, consumer_obj in users.items() if base_users.get(email) != consumer_obj]
+        if added or removed:
+            protocol = (snapshot.get(tag) or base[tag])["protocol"]
+            inbounds[tag] = {"protocol": protocol, "added": added, "removed": removed}
+    return {"revision": revision, "full": full, "inbounds": inbounds}
+
+
+@node_manager_services.process_conf.register_getter(
+    key=XRAY_KEY, satisfies={node_manager_services.HAPROXY_KEY, node_manager_services.GOINGTO_KEY}
+)
 def get_xray_conf_v2(
     node_obj, node_work_dir: pathlib.Path, base_url: str, kwargs_list: list[dict]
+) -> tuple[str, list[node_manager_typing.FileSchema], dict[str, dict]] | None:
+    fingerprint = get_xray_conf_fingerprint(node_obj=node_obj, node_work_dir=node_work_dir, base_url=base_url)
+    cache_key = f"xray_conf_v2_{node_obj.id}"
+    cached = cache.get(cache_key)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    res = render_xray_conf_v2(node_obj=node_obj, node_work_dir=node_work_dir, base_url=base_url)
+    cache.set(cache_key, (fingerprint, res), XRAY_CONF_CACHE_TIMEOUT)
+    return res
+
+
+def render_xray_conf_v2(
+    node_obj, node_work_dir: pathlib.Path, base_url: str
 ) -> tuple[str, list[node_manager_typing.FileSchema], dict[str, dict]] | None:
     site_config: core_models.SiteConfiguration = core_models.SiteConfiguration.objects.get()
     if not node_obj.tmp_xray:
@@ -470,7 +728,7 @@ def get_xray_conf_v2(
     all_subscriptionperiods_obj_list = (
         services.get_connectable_subscriptionperiod_qs()
         .filter(plan__connection_rule_id__in=[i.id for i in connectionrule_qs])
-        .select_related("plan")
+        .select_related("plan", "profile")
     )
     all_nodeinternaluser_ob_list = models.InternalUser.objects.filter(
         is_active=True, connection_rule_id__in=[i.id for i in connectionrule_qs]
@@ -514,17 +772,29 @@ def get_xray_conf_v2(
                 combo_stat = connection_outbound.connector.inbound_spec.get_combo_stat()
             else:
                 combo_stat = None
-            xray_outbounds[outbound_tag] = django.template.Template(
-                connection_outbound.connector.outbound_type.xray_outbound_template
-            ).render(
-                django.template.Context(
+            outbound_type = connection_outbound.connector.outbound_type
+            xray_outbounds[outbound_tag], _ = render_fragment(
+                kind="outbound",
+                fingerprint=get_fingerprint(
+                    outbound_type.id,
+                    outbound_type.updated_at,
+                    outbound_tag,
+                    node_obj.id,
+                    node_obj.updated_at,
+                    nodeinternaluser and get_proxyuser_fingerprint(nodeinternaluser),
+                    combo_stat and combo_stat.model_dump(),
+                ),
+                template=outbound_type.xray_outbound_template,
+                obj=outbound_type,
+                field="xray_outbound_template",
+                context=django.template.Context(
                     {
                         "tag": outbound_tag,
                         "node": node_obj,
                         "nodeinternaluser": nodeinternaluser,
                         "combo_stat": combo_stat,
                     }
-                )
+                ),
             )
 
         for portal_connection_outbound in connection_rule.portal_connection_outbounds:
@@ -579,17 +849,29 @@ def get_xray_conf_v2(
                     combo_stat = bridge_connection_outbound.connector.inbound_spec.get_combo_stat()
                 else:
                     combo_stat = None
-                xray_outbounds[interconn_outbound_tag] = django.template.Template(
-                    bridge_connection_outbound.connector.outbound_type.xray_outbound_template
-                ).render(
-                    django.template.Context(
+                outbound_type = bridge_connection_outbound.connector.outbound_type
+                xray_outbounds[interconn_outbound_tag], _ = render_fragment(
+                    kind="outbound",
+                    fingerprint=get_fingerprint(
+                        outbound_type.id,
+                        outbound_type.updated_at,
+                        interconn_outbound_tag,
+                        node_obj.id,
+                        node_obj.updated_at,
+                        get_proxyuser_fingerprint(reverse_proxyuser),
+                        combo_stat and combo_stat.model_dump(),
+                    ),
+                    template=outbound_type.xray_outbound_template,
+                    obj=outbound_type,
+                    field="xray_outbound_template",
+                    context=django.template.Context(
                         {
                             "tag": interconn_outbound_tag,
                             "node": node_obj,
                             "nodeinternaluser": reverse_proxyuser,
                             "combo_stat": combo_stat,
                         }
-                    )
+                    ),
                 )
                 bridge_first_rules_parts.append(
                     {
@@ -645,10 +927,25 @@ def get_xray_conf_v2(
             node_work_dir=node_work_dir,
             base_url=base_url,
         )
-        xray_rules = django.template.Template(
-            "{% load node_manager proxy_manager %}" + connection_rule.xray_rules_template
-        ).render(context=template_context)
-        new_files = node_manager_services.get_configdependentcontents_from_context(template_context)
+        xray_rules, new_files = render_fragment(
+            kind="rules",
+            fingerprint=get_fingerprint(
+                connection_rule.id,
+                connection_rule.updated_at,
+                node_obj.id,
+                node_obj.updated_at,
+                node_work_dir,
+                base_url,
+                sorted(get_proxyuser_fingerprint(i) for i in proxyusers_obj_list),
+                list(xray_outbounds.keys()),
+                json.dumps(xray_balancers, sort_keys=True, default=str),
+                get_xray_models_version(),
+            ),
+            template="{% load node_manager proxy_manager %}" + connection_rule.xray_rules_template,
+            obj=connection_rule,
+            field="xray_rules_template",
+            context=template_context,
+        )
         files.extend(new_files)
         if rule_parts:
             rule_parts += ", \n"
@@ -673,26 +970,20 @@ def get_xray_conf_v2(
         inbounds.append((realityspec.inbound_type, f"{realityspec.inbound_type.name}_rp{realityspec.id}", extra_ctx))
     for inboundtype in models.InboundType.objects.filter(is_active=True, is_template=True):
         inbounds.append((inboundtype, f"{inboundtype.name}", {"combo_stat": None}))
-    for inbound, inbound_tag, extra_ctx in inbounds:
-        consumers_part = ""
-        for proxyuser in [
-            *all_subscriptionperiods_obj_list,
-            *all_nodeinternaluser_ob_list,
-            *reverse_proxyusers,
-            *tunn_all_users,
-        ]:
-            template_context = node_manager_services.NodeTemplateContext(
-                {"subscriptionperiod_obj": proxyuser}, node_work_dir=node_work_dir, base_url=base_url
-            )
-            consumer_obj = django.template.Template(
-                "{% load node_manager proxy_manager %}" + inbound.consumer_obj_template
-            ).render(context=template_context)
-            new_files = node_manager_services.get_configdependentcontents_from_context(template_context)
-            files.extend(new_files)
-            if consumers_part:
-                consumers_part += ",\n"
-            consumers_part += consumer_obj
-
+    proxyusers = [
+        *all_subscriptionperiods_obj_list,
+        *all_nodeinternaluser_ob_list,
+        *reverse_proxyusers,
+        *tunn_all_users,
+    ]
+    # the subscription periods come first, they are the ones that goingto can add and remove on the running xray
+    subscriptionperiods_count = len(all_subscriptionperiods_obj_list)
+    proxyusers_fingerprints = [get_proxyuser_fingerprint(i) for i in proxyusers]
+    proxyuser_values = None
+    models_version = get_xray_models_version()
+    xray_users_snapshot: dict[str, dict] = {}
+
+    def render_inbound(inbound, inbound_tag, extra_ctx, consumers_part):
         template_context = node_manager_services.NodeTemplateContext(
             {
                 "config": proxy_manager_config,
@@ -704,10 +995,86 @@ def get_xray_conf_v2(
             node_work_dir=node_work_dir,
             base_url=base_url,
         )
-        xray_inbound = django.template.Template(
-            "{% load node_manager proxy_manager %}" + inbound.inbound_template
-        ).render(context=template_context)
-        new_files = node_manager_services.get_configdependentcontents_from_context(template_context)
+        xray_inbound, new_files = render_fragment(
+            kind="inbound",
+            fingerprint=get_fingerprint(
+                inbound.id,
+                inbound.updated_at,
+                proxy_manager_config.updated_at,
+                node_obj.id,
+                node_obj.updated_at,
+                node_work_dir,
+                base_url,
+                inbound_tag,
+                sha256(consumers_part.encode("utf-8")).hexdigest(),
+                extra_ctx["combo_stat"] and extra_ctx["combo_stat"].model_dump(),
+                models_version,
+            ),
+            template="{% load node_manager proxy_manager %}" + inbound.inbound_template,
+            obj=inbound,
+            field="inbound_template",
+            context=template_context,
+        )
+        return xray_inbound, new_files, template_context
+
+    for inbound, inbound_tag, extra_ctx in inbounds:
+        hot_consumer_objs = None
+        if consumer_obj_schema := get_consumer_obj_schema(inbound):
+            if proxyuser_values is None:
+                proxyuser_values = [{"xray_uuid": str(i.xray_uuid), "xray_email": i.xray_email()} for i in proxyusers]
+            if proxy_manager_config.xray_hot_users and consumer_obj_schema.fields.get("email") == "xray_email":
+                hot_consumer_objs = get_consumer_objs(
+                    consumer_obj_schema, proxyuser_values=proxyuser_values[:subscriptionperiods_count]
+                )
+                consumers_part = get_bulk_consumers_part(
+                    consumer_obj_schema, proxyuser_values=proxyuser_values[subscriptionperiods_count:]
+                )
+            else:
+                consumers_part = get_bulk_consumers_part(consumer_obj_schema, proxyuser_values=proxyuser_values)
+        else:
+            consumer_obj_template = "{% load node_manager proxy_manager %}" + inbound.consumer_obj_template
+            consumer_obj_template_hash = sha256(consumer_obj_template.encode("utf-8")).hexdigest()
+            consumer_cache_keys = [
+                "xray_fragment_consumer_"
+                + get_fingerprint(consumer_obj_template_hash, node_work_dir, base_url, models_version, i)
+                for i in proxyusers_fingerprints
+            ]
+            cached_consumers = cache.get_many(consumer_cache_keys)
+            new_consumers = {}
+            consumers_part = ""
+            for proxyuser, consumer_cache_key in zip(proxyusers, consumer_cache_keys):
+                if (consumer := cached_consumers.get(consumer_cache_key)) is None:
+                    template_context = node_manager_services.NodeTemplateContext(
+                        {"subscriptionperiod_obj": proxyuser}, node_work_dir=node_work_dir, base_url=base_url
+                    )
+                    consumer = (
+                        node_manager_services.template_registry.get(
+                            consumer_obj_template, obj=inbound, field="consumer_obj_template"
+                        ).render(context=template_context),
+                        node_manager_services.get_configdependentcontents_from_context(template_context),
+                    )
+                    new_consumers[consumer_cache_key] = consumer
+                consumer_obj, new_files = consumer
+                files.extend(new_files)
+                if consumers_part:
+                    consumers_part += ",\n"
+                consumers_part += consumer_obj
+            if new_consumers:
+                cache.set_many(new_consumers, XRAY_FRAGMENT_CACHE_TIMEOUT)
+
+        xray_inbound, new_files, template_context = render_inbound(inbound, inbound_tag, extra_ctx, consumers_part)
+        if hot_consumer_objs is not None and xray_inbound.strip():
+            if hot_inbound := get_hot_inbound(xray_inbound):
+                xray_users_snapshot[hot_inbound["tag"]] = {
+                    "protocol": hot_inbound["protocol"],
+                    "users": {i["email"]: i for i in hot_consumer_objs},
+                }
+            else:
+                logger.warning(f"users of {inbound=} are kept in the xray config since it is not a plain json inbound")
+                consumers_part = get_bulk_consumers_part(consumer_obj_schema, proxyuser_values=proxyuser_values)
+                xray_inbound, new_files, template_context = render_inbound(
+                    inbound, inbound_tag, extra_ctx, consumers_part
+                )
         files.extend(new_files)
         inbound_tags.append(inbound_tag)
         if xray_inbound.strip():
@@ -717,19 +1084,27 @@ def get_xray_conf_v2(
 
         if inbound.haproxy_backend:
             haproxy_backends_parts.append(
-                django.template.Template(inbound.haproxy_backend).render(context=template_context)
+                node_manager_services.template_registry.get(
+                    inbound.haproxy_backend, obj=inbound, field="haproxy_backend"
+                ).render(context=template_context)
             )
         if inbound.haproxy_matcher_80:
             haproxy_80_matchers_parts.append(
-                django.template.Template(inbound.haproxy_matcher_80).render(context=template_context)
+                node_manager_services.template_registry.get(
+                    inbound.haproxy_matcher_80, obj=inbound, field="haproxy_matcher_80"
+                ).render(context=template_context)
             )
         if inbound.haproxy_matcher_443:
             haproxy_443_matchers_parts.append(
-                django.template.Template(inbound.haproxy_matcher_443).render(context=template_context)
+                node_manager_services.template_registry.get(
+                    inbound.haproxy_matcher_443, obj=inbound, field="haproxy_matcher_443"
+                ).render(context=template_context)
             )
         if inbound.nginx_path_config:
             nginx_path_matchers_parts.append(
-                django.template.Template(inbound.nginx_path_config).render(context=template_context)
+                node_manager_services.template_registry.get(
+                    inbound.nginx_path_config, obj=inbound, field="nginx_path_config"
+                ).render(context=template_context)
             )
 
     template_context = node_manager_services.NodeTemplateContext(
@@ -747,7 +1122,9 @@ def get_xray_conf_v2(
         base_url=base_url,
     )
     xray_config_template = "{% load node_manager proxy_manager %}" + proxy_manager_config.xray_config_template
-    xray_config_content = django.template.Template(xray_config_template).render(context=template_context)
+    xray_config_content = node_manager_services.template_registry.get(
+        xray_config_template, obj=proxy_manager_config, field="xray_config_template"
+    ).render(context=template_context)
     xray_config_content_hash = sha256(xray_config_content.encode("utf-8")).hexdigest()
     xray_config_content_file = node_manager_typing.FileSchema(
         dest_path=node_work_dir.joinpath("conf", f"xray_{xray_config_content_hash[:6]}.json"),
@@ -796,6 +1173,24 @@ def get_xray_conf_v2(
         )
 
     files.extend(new_files)
+
+    argument_registry = {
+        node_manager_services.HAPROXY_KEY: {
+            "backends_parts": haproxy_backends_parts,
+            "80_matchers_parts": haproxy_80_matchers_parts,
+            "443_matchers_parts": haproxy_443_matchers_parts,
+        },
+        node_manager_services.NGINX_KEY: {"path_matchers_parts": nginx_path_matchers_parts},
+    }
+    if proxy_manager_config.xray_hot_users:
+        # the config file only has the structural users, so it (and xray) is only changed by the structural changes
+        set_xray_users_snapshot(node_obj.id, xray_users_snapshot)
+        xray_users_token = get_xray_users_token(node_obj)
+        if xray_users_token:
+            argument_registry[node_manager_services.GOINGTO_KEY] = {
+                "users_url": base_url + reverse("xray_users_delta"),
+                "users_token": xray_users_token,
+            }
     supervisor_config = f"""
 # config={timezone.now()}
 [program:xray_conf]
@@ -805,18 +1200,7 @@ autostart=true
 autorestart=true
 priority=10
 """
-    return (
-        supervisor_config,
-        files,
-        {
-            node_manager_services.HAPROXY_KEY: {
-                "backends_parts": haproxy_backends_parts,
-                "80_matchers_parts": haproxy_80_matchers_parts,
-                "443_matchers_parts": haproxy_443_matchers_parts,
-            },
-            node_manager_services.NGINX_KEY: {"path_matchers_parts": nginx_path_matchers_parts},
-        },
-    )
+    return supervisor_config, files, argument_registry
 
 
 class Balancer(Protocol):
@@ -851,7 +1235,7 @@ def get_strategy_part(
             for balancer_member in balancer_members
         ]
     )
-    strategy_part = django.template.Template(strategy_template).render(
+    strategy_part = node_manager_services.template_registry.get(strategy_template).render(
         django.template.Context(
             {
                 "costs_part": costs_part,
@@ -236,10 +236,12 @@ def pay_payment_with_wallet(
     wallet_paymentprovider: finance_models.PaymentProvider,
     actor: User,
 ):
-    wallet_balances = models.MemberCredit.objects.filter(agency_user=useragency).balance(
-        currency=payment.amount.currency
+    # locked so the concurrent payments of the user are checked against the balance one after another
+    wallet_balance_obj = models.MemberCreditBalance.objects.get_locked(
+        agency_user_id=useragency.id, currency=str(payment.amount.currency)
     )
-    if wallet_balances >= payment.amount:
+    wallet_balance = wallet_balance_obj.balance if wallet_balance_obj else Money(0, payment.amount.currency)
+    if wallet_balance >= payment.amount:
         credit = models.MemberCredit()
         credit.agency_user = useragency
         credit.debt = payment.amount
@@ -255,3 +257,49 @@ def pay_payment_with_wallet(
         payment.complete(actor=actor)
     else:
         raise ProxyManagerWalletCredit.NotSufficientCredit()
+
+
+MEMBERCREDIT_BALANCES_REBUILD_BATCH_SIZE = 500
+
+
+@transaction.atomic(using="main")
+def rebuild_membercredit_balances(agency_user_ids: set[int] | list[int]) -> int:
+    """
+    sets the MemberCreditBalance rows of the agency users to what their MemberCredit ledger sums to,
+    returns the number of the fixed rows
+    """
+    # new ledger rows of the agency users wait for this since inserting them needs a key share lock on them
+    agency_user_ids = list(
+        models.AgencyUser.objects.select_for_update().filter(id__in=agency_user_ids).values_list("id", flat=True)
+    )
+    ledger_balances = {
+        (i["agency_user"], i["currency"]): i["balance"]
+        for i in models.MemberCredit.objects.filter(agency_user_id__in=agency_user_ids).balance()
+    }
+    fixed_count = 0
+    balance_objs = []
+    for balance_obj in models.MemberCreditBalance.objects.select_for_update().filter(
+        agency_user_id__in=agency_user_ids
+    ):
+        amount = ledger_balances.pop((balance_obj.agency_user_id, str(balance_obj.balance_currency)), None)
+        if amount is None:
+            balance_obj.delete()
+            fixed_count += 1
+        elif amount != balance_obj.balance.amount:
+            balance_obj.balance = Money(amount, balance_obj.balance_currency)
+            balance_obj.updated_at = timezone.now()
+            balance_objs.append(balance_obj)
+    models.MemberCreditBalance.objects.bulk_update(balance_objs, fields=["balance", "updated_at"])
+    models.MemberCreditBalance.objects.bulk_create(
+        [
+            models.MemberCreditBalance(agency_user_id=agency_user_id, balance=Money(amount, currency))
+            for (agency_user_id, currency), amount in ledger_balances.items()
+        ]
+    )
+    return fixed_count + len(balance_objs) + len(ledger_balances)
+
+
+def membercredit_deleted(sender, instance, using: str, **kwargs) -> None:
+    """post_delete receiver, the balance is rebuilt after the commit since the agency user may be deleted too"""
+    agency_user_id = instance.agency_user_id
+    transaction.on_commit(lambda: rebuild_membercredit_balances(agency_user_ids=[agency_user_id]), using=using)
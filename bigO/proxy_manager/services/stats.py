@@ -6,6 +6,7 @@ from typing import TypedDict
 import influxdb_client
 import sentry_sdk
 
+from bigO.core.influx import InfluxPoint
 from bigO.node_manager import models as node_manager_models
 from django.conf import settings
 from django.core.cache import cache
@@ -19,7 +20,7 @@ logger = logging.getLogger(__name__)
 
 def set_outbound_tags(
     *,
-    point: influxdb_client.Point,
+    point: InfluxPoint | influxdb_client.Point,
     node: node_manager_models.Node,
     outbound_name: str,
     store: dict[str, models.ConnectionRuleOutbound | models.ConnectionTunnelOutbound | None] | None = None,
@@ -159,3 +160,47 @@ from(bucket: "{settings.INFLUX_BUCKET}")
         }
     cache.set(cache_key, json.dumps(res), 20)
     return res
+
+
+def get_periods_flow_bytes(
+    starts: dict[int, datetime.datetime],
+    stop: datetime.datetime | None = None,
+    *,
+    query_api: influxdb_client.QueryApi,
+) -> dict[int, dict[str, int]]:
+    """
+    sums dl_bytes and up_bytes of each period from its own start, all in one flux query
+    returns {period_id: {"dl_bytes": ..., "up_bytes": ...}}, periods with no data are absent
+    query_api belongs to a client the caller opens once per task and closes
+    """
+    if not starts:
+        return {}
+    time_format = "%Y-%m-%dT%H:%M:%SZ"
+    starts_dict = ",\n".join(f'  "{period_id}": {start.strftime(time_format)}' for period_id, start in starts.items())
+    range_stop = f", stop: {stop.strftime(time_format)}" if stop else ""
+    # a plain equality chain is pushed down to the storage, unlike the dict lookup of the _time filter
+    period_ids_filter = " or ".join(f'r["period_id"] == "{period_id}"' for period_id in starts)
+    query = f"""
+import "dict"
+
+starts = [
+{starts_dict}
+]
+
+from(bucket: "{settings.INFLUX_BUCKET}")
+|> range(start: {min(starts.values()).strftime(time_format)}{range_stop})
+|> filter(fn: (r) => r["_measurement"] == "xray_usage")
+|> filter(fn: (r) => r["_field"] == "dl_bytes" or r["_field"] == "up_bytes")
+|> filter(fn: (r) => r["usage_type"] == "user")
+|> filter(fn: (r) => {period_ids_filter})
+|> filter(fn: (r) => r._time >= dict.get(dict: starts, key: r["period_id"], default: 2200-01-01T00:00:00Z))
+|> group(columns: ["period_id", "_field"])  // sum each field of each period separately
+|> sum()
+"""
+    tables = query_api.query(query)
+    res = {}
+    for table in tables:
+        for record in table.records:
+            period_res = res.setdefault(int(record.values["period_id"]), {"dl_bytes": 0, "up_bytes": 0})
+            period_res[record.get_field()] = int(record.get_value() or 0)
+    return res
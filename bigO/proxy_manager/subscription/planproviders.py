@@ -17,9 +17,7 @@ from django.db.models import (
     F,
     OuterRef,
     PositiveBigIntegerField,
-    Q,
     Subquery,
-    Sum,
     Value,
     When,
 )
@@ -193,21 +191,16 @@ class TypeSimpleAsYouGO1(BaseSubscriptionPlanProvider):
     def remained_xpr(cls):
         from .. import models
 
-        qs = (
-            models.MemberCredit.objects.filter(
-                Q(agency_user__user=OuterRef("profile__user"), agency_user__agency=OuterRef("profile__initial_agency"))
-            )
-            .ann_currency()
-            .filter(currency=OuterRef("plan__base_currency"))
-            .order_by()
-            .values("agency_user")
-            .annotate(balance=Coalesce(Sum("credit"), Decimal(0)) - Coalesce(Sum("debt"), Decimal(0)))
+        qs = models.MemberCreditBalance.objects.filter(
+            agency_user__user=OuterRef("profile__user"),
+            agency_user__agency=OuterRef("profile__initial_agency"),
+            balance_currency=OuterRef("plan__base_currency"),
         )
         return (
             Cast("plan_args__paid_bytes", PositiveBigIntegerField())
             + (
                 Floor(
-                    Coalesce(Subquery(qs.values("balance")), Value(0))
+                    Coalesce(Subquery(qs.values("balance")[:1]), Value(0))
                     / Cast("plan__plan_provider_args__per_gb_price", DecimalField(max_digits=10, decimal_places=2))
                 )
                 * Value(1000_000_000)
@@ -228,19 +221,14 @@ class TypeSimpleAsYouGO1(BaseSubscriptionPlanProvider):
     def get_total_limit_bytes_expr(cls):
         from .. import models
 
-        qs = (
-            models.MemberCredit.objects.filter(
-                Q(agency_user__user=OuterRef("profile__user"), agency_user__agency=OuterRef("profile__initial_agency"))
-            )
-            .ann_currency()
-            .filter(currency=OuterRef("plan__base_currency"))
-            .order_by()
-            .values("agency_user")
-            .annotate(balance=Coalesce(Sum("credit"), Decimal(0)) - Coalesce(Sum("debt"), Decimal(0)))
+        qs = models.MemberCreditBalance.objects.filter(
+            agency_user__user=OuterRef("profile__user"),
+            agency_user__agency=OuterRef("profile__initial_agency"),
+            balance_currency=OuterRef("plan__base_currency"),
         )
         return Cast("plan_args__paid_bytes", PositiveBigIntegerField()) + (
             Floor(
-                Coalesce(Subquery(qs.values("balance")), Value(0))
+                Coalesce(Subquery(qs.values("balance")[:1]), Value(0))
                 / Cast("plan__plan_provider_args__per_gb_price", DecimalField(max_digits=10, decimal_places=2))
             )
             * Value(1000_000_000)
@@ -274,13 +262,6 @@ class TypeSimpleAsYouGO1(BaseSubscriptionPlanProvider):
                 sentry_sdk.capture_message(f"check_use_credit: no agency user found for {subscriptionperiod.profile}")
                 continue
 
-            balance = models.MemberCredit.objects.filter(
-                Q(
-                    agency_user__user=subscriptionperiod.profile.user,
-                    agency_user__agency=subscriptionperiod.profile.initial_agency,
-                )
-            ).balance(currency=subscriptionperiod.plan.base_currency)
-
             providerarg = cls.ProviderArgsModel(**subscriptionperiod.plan.plan_provider_args)
             not_paid_credit = Decimal(subscriptionperiod.not_paid_bytes) * providerarg.per_gb_price / 1000_000_000
             if not_paid_credit != subscriptionperiod.not_paid_credit:
@@ -307,11 +288,15 @@ class TypeSimpleAsYouGO1(BaseSubscriptionPlanProvider):
             plan_arg = cls.PlanArgsModel(**subscriptionperiod.plan_args)
             plan_arg.paid_bytes += charging_bytes
             subscriptionperiod.plan_args = plan_arg.model_dump()
-            if balance - charging_credit <= Money(amount=0, currency=subscriptionperiod.plan.base_currency):
-                subscriptionperiod.limited_at = timezone.now()
-            else:
-                subscriptionperiod.limited_at = None
-            with transaction.atomic():
+            with transaction.atomic(using="main"):
+                balance_obj = models.MemberCreditBalance.objects.get_locked(
+                    agency_user_id=agency_user.id, currency=subscriptionperiod.plan.base_currency
+                )
+                balance = balance_obj.balance if balance_obj else Money(0, subscriptionperiod.plan.base_currency)
+                if balance - charging_credit <= Money(amount=0, currency=subscriptionperiod.plan.base_currency):
+                    subscriptionperiod.limited_at = timezone.now()
+                else:
+                    subscriptionperiod.limited_at = None
                 membercredit.save()
                 subscriptionperiodcreditusage.save()
                 subscriptionperiod.save()
@@ -1,6 +1,7 @@
 import datetime
 import re
 import secrets
+import time
 import zoneinfo
 from datetime import timedelta
 from decimal import Decimal
@@ -8,8 +9,12 @@ from typing import Any
 from zoneinfo import ZoneInfo
 
 import influxdb_client
+import redis.exceptions
 import sentry_sdk
+from django_redis import get_redis_connection
 
+import bigO.utils.blobs
+from bigO.core.influx import InfluxPoint, get_influx_writer
 from bigO.node_manager import models as node_manager_models
 from config.celery_app import app
 from django.conf import settings
@@ -19,56 +24,43 @@ from django.utils import timezone
 
 from . import models, services, subscription, typing
 
+SYNC_USAGE_MIN_BATCH_SIZE = 10
+SYNC_USAGE_MAX_BATCH_SIZE = 500
+SYNC_USAGE_MAX_BATCHES = 4
+SYNC_USAGE_TIME_BUDGET = 45  # seconds
+SUBLINK_ACCESS_FLUSH_BATCH_SIZE = 1_000
 
-@app.task
-def sync_usage(regulate_seconds: int = 1 * 60 * 60):
-    if not getattr(settings, "INFLUX_URL", False):
-        return "no INFLUX_URL"
-    # todo transaction.atomic(using="main") and select_for_update() had bug
-    count = 0
-    subscriptionperiod_qs = (
-        models.SubscriptionPeriod.objects.using("main")
-        .filter(
-            Q(last_usage_at__gt=F("last_flow_sync_at") + timedelta(minutes=1))
-            | Q(last_usage_at__isnull=False, last_flow_sync_at__isnull=True)
-        )
-        .order_by("last_flow_sync_at")[:10]
-    )
-    if not subscriptionperiod_qs.exists():
-        return "nothing to do"
-    config = models.Config.get_solo()
-    for subscriptionperiod in subscriptionperiod_qs:
-        now = timezone.now()
+
+def get_sync_usage_batch_size(backlog_count: int) -> int:
+    # drain the backlog in SYNC_USAGE_MAX_BATCHES batches if possible
+    return max(SYNC_USAGE_MIN_BATCH_SIZE, min(SYNC_USAGE_MAX_BATCH_SIZE, -(-backlog_count // SYNC_USAGE_MAX_BATCHES)))
+
+
+def sync_usage_batch(
+    subscriptionperiods: list[models.SubscriptionPeriod],
+    config: models.Config,
+    regulate_seconds: int,
+    query_api: influxdb_client.QueryApi,
+) -> int:
+    now = timezone.now()
+    for subscriptionperiod in subscriptionperiods:
         if subscriptionperiod.flow_point_at is None:
             subscriptionperiod.flow_point_at = now - timedelta(seconds=regulate_seconds)
-        query = f"""
-from(bucket: "{settings.INFLUX_BUCKET}")
-|> range(start: {subscriptionperiod.flow_point_at.strftime('%Y-%m-%dT%H:%M:%SZ')})
-|> filter(fn: (r) => r["_measurement"] == "xray_usage")
-|> filter(fn: (r) => r["_field"] == "dl_bytes" or r["_field"] == "up_bytes")
-|> filter(fn: (r) => r["usage_type"] == "user")
-|> filter(fn: (r) => r["period_id"] == "{subscriptionperiod.id}")
-|> group(columns: ["_field"])  // group by _field to sum separately
-|> sum()
-"""
-        df = (
-            influxdb_client.InfluxDBClient(
-                url=settings.INFLUX_URL, token=settings.INFLUX_TOKEN, org=settings.INFLUX_ORG
-            )
-            .query_api()
-            .query_data_frame(query)
+    flow_bytes = services.get_periods_flow_bytes(
+        {i.id: i.flow_point_at for i in subscriptionperiods}, query_api=query_api
+    )
+    if len(flow_bytes) < len(subscriptionperiods):
+        sentry_sdk.capture_message(
+            f"did data not received by influx yet? {len(subscriptionperiods) - len(flow_bytes)} periods had no data"
         )
-        if df.empty:
-            sentry_sdk.capture_message("did data not received by influx yet?")
-            continue
+    updated_subscriptionperiods = []
+    for subscriptionperiod in subscriptionperiods:
         try:
-            new_flow_download_bytes = df[df["_field"] == "dl_bytes"].iloc[0].to_dict()["_value"]
-        except IndexError:
-            new_flow_download_bytes = 0
-        try:
-            new_flow_upload_bytes = df[df["_field"] == "up_bytes"].iloc[0].to_dict()["_value"]
-        except IndexError:
-            new_flow_upload_bytes = 0
+            period_flow_bytes = flow_bytes[subscriptionperiod.id]
+        except KeyError:
+            continue
+        new_flow_download_bytes = period_flow_bytes["dl_bytes"]
+        new_flow_upload_bytes = period_flow_bytes["up_bytes"]
         if new_flow_download_bytes == 0 and new_flow_upload_bytes == 0:
             continue
 
@@ -87,13 +79,66 @@ from(bucket: "{settings.INFLUX_BUCKET}")
         subscriptionperiod.current_upload_bytes += upload_flow_diff
 
         subscriptionperiod.last_flow_sync_at = timezone.now()
-        subscriptionperiod.save()
-        count += 1
-    return f"{count} processed"
+        updated_subscriptionperiods.append(subscriptionperiod)
+    models.SubscriptionPeriod.objects.using("main").bulk_update(
+        updated_subscriptionperiods,
+        fields=[
+            "flow_download_bytes",
+            "current_download_bytes",
+            "flow_upload_bytes",
+            "current_upload_bytes",
+            "flow_point_at",
+            "last_flow_sync_at",
+        ],
+    )
+    if updated_subscriptionperiods:
+        services.refresh_subscriptionperiods_stored_limits(
+            models.SubscriptionPeriod.objects.using("main").filter(id__in=[i.id for i in updated_subscriptionperiods])
+        )
+    return len(updated_subscriptionperiods)
 
 
 @app.task
-def forward_flow_point(flow_point_delta_seconds: int = 5 * 24 * 60 * 60):
+def sync_usage(regulate_seconds: int = 1 * 60 * 60, batch_size: int | None = None):
+    if not getattr(settings, "INFLUX_URL", False):
+        return "no INFLUX_URL"
+    # todo transaction.atomic(using="main") and select_for_update() had bug
+    started_at = time.monotonic()
+    subscriptionperiod_qs = models.SubscriptionPeriod.objects.using("main").filter(
+        Q(last_usage_at__gt=F("last_flow_sync_at") + timedelta(minutes=1))
+        | Q(last_usage_at__isnull=False, last_flow_sync_at__isnull=True)
+    )
+    backlog_count = subscriptionperiod_qs.count()
+    if not backlog_count:
+        return "nothing to do"
+    batch_size = batch_size or get_sync_usage_batch_size(backlog_count)
+    period_ids = list(
+        subscriptionperiod_qs.order_by("last_flow_sync_at").values_list("id", flat=True)[
+            : batch_size * SYNC_USAGE_MAX_BATCHES
+        ]
+    )
+    config = models.Config.get_solo()
+    count = 0
+    batches_count = 0
+    with influxdb_client.InfluxDBClient(
+        url=settings.INFLUX_URL, token=settings.INFLUX_TOKEN, org=settings.INFLUX_ORG
+    ) as influx_client:
+        query_api = influx_client.query_api()
+        for i in range(0, len(period_ids), batch_size):
+            if time.monotonic() - started_at > SYNC_USAGE_TIME_BUDGET:
+                break
+            subscriptionperiods = list(
+                models.SubscriptionPeriod.objects.using("main").filter(id__in=period_ids[i : i + batch_size])
+            )
+            count += sync_usage_batch(
+                subscriptionperiods, config=config, regulate_seconds=regulate_seconds, query_api=query_api
+            )
+            batches_count += 1
+    return f"{count} processed in {batches_count} batches of {batch_size} out of {backlog_count}"
+
+
+@app.task
+def forward_flow_point(flow_point_delta_seconds: int = 5 * 24 * 60 * 60, batch_size: int | None = None):
     if not getattr(settings, "INFLUX_URL", False):
         return "no INFLUX_URL"
     flow_point_delta = timedelta(seconds=flow_point_delta_seconds)
@@ -101,43 +146,28 @@ def forward_flow_point(flow_point_delta_seconds: int = 5 * 24 * 60 * 60):
     now = timezone.now()
     new_flow_point = now - flow_point_delta
     with transaction.atomic(using="main"):
-        subscriptionperiod_qs = (
-            models.SubscriptionPeriod.objects.filter(
-                flow_point_at__lt=new_flow_point - flow_point_delta_margin,  # not to run on each execution
-                last_usage_at__gt=F("flow_point_at"),  # not bother to run on closed periods
-                flow_point_at__gt=now - timedelta(days=29),  # to insure we won't lose any data
-            )
-            .order_by("flow_point_at")[:10]
-            .select_for_update()
+        subscriptionperiod_qs = models.SubscriptionPeriod.objects.filter(
+            flow_point_at__lt=new_flow_point - flow_point_delta_margin,  # not to run on each execution
+            last_usage_at__gt=F("flow_point_at"),  # not bother to run on closed periods
+            flow_point_at__gt=now - timedelta(days=29),  # to insure we won't lose any data
         )
-        if not subscriptionperiod_qs.exists():
+        batch_size = batch_size or get_sync_usage_batch_size(subscriptionperiod_qs.count())
+        subscriptionperiods = list(subscriptionperiod_qs.order_by("flow_point_at")[:batch_size].select_for_update())
+        if not subscriptionperiods:
             return "nothing to do"
-        period_ids = []
         config = models.Config.get_solo()
-        for subscriptionperiod in subscriptionperiod_qs:
-            period_ids.append(subscriptionperiod.id)
-            query = f"""
-from(bucket: "{settings.INFLUX_BUCKET}")
-|> range(start: {subscriptionperiod.flow_point_at.strftime('%Y-%m-%dT%H:%M:%SZ')}, stop: {new_flow_point.strftime('%Y-%m-%dT%H:%M:%SZ')})
-|> filter(fn: (r) => r["_measurement"] == "xray_usage")
-|> filter(fn: (r) => r["_field"] == "dl_bytes" or r["_field"] == "up_bytes")
-|> filter(fn: (r) => r["usage_type"] == "user")
-|> filter(fn: (r) => r["period_id"] == "{subscriptionperiod.id}")
-|> group(columns: ["_field"])  // group by _field to sum separately
-|> sum()
-"""
-            df = (
-                influxdb_client.InfluxDBClient(
-                    url=settings.INFLUX_URL, token=settings.INFLUX_TOKEN, org=settings.INFLUX_ORG
-                )
-                .query_api()
-                .query_data_frame(query=query)
+        with influxdb_client.InfluxDBClient(
+            url=settings.INFLUX_URL, token=settings.INFLUX_TOKEN, org=settings.INFLUX_ORG
+        ) as influx_client:
+            flow_bytes = services.get_periods_flow_bytes(
+                {i.id: i.flow_point_at for i in subscriptionperiods},
+                stop=new_flow_point,
+                query_api=influx_client.query_api(),
             )
-            if not df.empty:
-                dl_df = df[df["_field"] == "dl_bytes"]
-                between_download_bytes = dl_df.iloc[0].to_dict()["_value"] if not dl_df.empty else 0
-                up_df = df[df["_field"] == "up_bytes"]
-                between_upload_bytes = up_df.iloc[0].to_dict()["_value"] if not up_df.empty else 0
+        for subscriptionperiod in subscriptionperiods:
+            if period_flow_bytes := flow_bytes.get(subscriptionperiod.id):
+                between_download_bytes = period_flow_bytes["dl_bytes"]
+                between_upload_bytes = period_flow_bytes["up_bytes"]
 
                 if config.usage_correction_factor:
                     between_download_bytes = int(between_download_bytes * config.usage_correction_factor)
@@ -159,16 +189,26 @@ from(bucket: "{settings.INFLUX_BUCKET}")
                 subscriptionperiod.flow_upload_bytes = new_flow_upload_bytes
 
             subscriptionperiod.flow_point_at = new_flow_point
-            subscriptionperiod.save()
-        return period_ids
+        models.SubscriptionPeriod.objects.bulk_update(
+            subscriptionperiods,
+            fields=[
+                "flow_download_bytes",
+                "current_download_bytes",
+                "flow_upload_bytes",
+                "current_upload_bytes",
+                "flow_point_at",
+            ],
+        )
+        return [i.id for i in subscriptionperiods]
 
 
-@app.task
+@app.task(ignore_result=True)
+@bigO.utils.blobs.resolve_blob_args("xray_lines")
 def handle_xray_conf(node_id: int, xray_lines: str, base_labels: dict[str, Any]):
     alive_outbound_observatory_pattern = r"""(?P<datetime_str>\d{4}\/\d{2}\/\d{2}[ ]\d{2}:\d{2}:\d{2}\.\d{6}).*app\/observatory:[ ]the outbound[ ](?P<outbound_name>.*)[ ]is[ ]alive:(?P<delay_secs>.*)"""
     dead_outbound_observatory_pattern = r"(?P<datetime_str>\d{4}\/\d{2}\/\d{2}[ ]\d{2}:\d{2}:\d{2}\.\d{6}).*app\/observatory:[ ]the outbound[ ](?P<outbound_name>.*)[ ]is[ ]dead:(?P<description>.*)"
     node = node_manager_models.Node.objects.get(id=node_id)
-    points: list[influxdb_client.Point] = []
+    points: list[InfluxPoint] = []
     for line in xray_lines.split("\n"):
         observatory_checked = False
         if not line:
@@ -178,7 +218,7 @@ def handle_xray_conf(node_id: int, xray_lines: str, base_labels: dict[str, Any])
             and (match_res := re.search(alive_outbound_observatory_pattern, line))
             and len(match_res.groups()) == 3
         ):
-            point = influxdb_client.Point("connection_health")
+            point = InfluxPoint("connection_health")
             observatory_checked = True
             datetime_str = match_res.group("datetime_str")
             outbound_name = match_res.group("outbound_name")
@@ -201,7 +241,7 @@ def handle_xray_conf(node_id: int, xray_lines: str, base_labels: dict[str, Any])
             and (match_res := re.search(dead_outbound_observatory_pattern, line))
             and len(match_res.groups()) == 3
         ):
-            point = influxdb_client.Point("connection_health")
+            point = InfluxPoint("connection_health")
             observatory_checked = True
             datetime_str = match_res.group("datetime_str")
             outbound_name = match_res.group("outbound_name")
@@ -220,22 +260,8 @@ def handle_xray_conf(node_id: int, xray_lines: str, base_labels: dict[str, Any])
 
     if not points:
         return "no points!!!"
-    with influxdb_client.InfluxDBClient(
-        url=settings.INFLUX_URL, token=settings.INFLUX_TOKEN, org=settings.INFLUX_ORG
-    ) as _client:
-        with _client.write_api(
-            write_options=influxdb_client.WriteOptions(
-                batch_size=500,
-                flush_interval=10_000,
-                jitter_interval=2_000,
-                retry_interval=5_000,
-                max_retries=3,
-                max_retry_delay=30_000,
-                max_close_wait=300_000,
-                exponential_base=2,
-            )
-        ) as _write_client:
-            _write_client.write(settings.INFLUX_BUCKET, settings.INFLUX_ORG, points)
+    written_count = get_influx_writer().write(points)
+    return f"{written_count} points queued"
 
 
 @app.task
@@ -259,6 +285,25 @@ def subscription_nearly_ended_notify(remained_seconds: int, remained_bytes: int,
     return res[0]
 
 
+@app.task
+def refresh_subscriptionperiods_stored_limits(max_age_seconds: int = 60 * 60):
+    """the periods are refreshed on their changes, this covers the ones that are missed"""
+    subscriptionperiod_qs = models.SubscriptionPeriod.objects.using("main").filter(
+        Q(stored_limits_at__isnull=True) | Q(stored_limits_at__lt=timezone.now() - timedelta(seconds=max_age_seconds)),
+        selected_as_current=True,
+    )
+    count = 0
+    while period_ids := list(
+        subscriptionperiod_qs.order_by("stored_limits_at").values_list("id", flat=True)[
+            : services.SUBSCRIPTIONPERIOD_STORED_LIMITS_BATCH_SIZE
+        ]
+    ):
+        count += services.refresh_subscriptionperiods_stored_limits(
+            models.SubscriptionPeriod.objects.using("main").filter(id__in=period_ids)
+        )
+    return f"{count} refreshed"
+
+
 @app.task
 def typesimpleasyougo1_check_use_credit():
     res = subscription.planproviders.TypeSimpleAsYouGO1.check_use_credit()
@@ -304,3 +349,29 @@ def reality_checks():
     config.reality_settings = reality_settings.model_dump()
     config.save()
     return result
+
+
+@app.task(ignore_result=True)
+def flush_sublink_accesses():
+    """writes the access times recorded by services.record_sublink_access with bulk updates"""
+    redis_conn = get_redis_connection("default")
+    flushing_key = f"{services.SUBLINK_ACCESS_KEY}:flushing"
+    # the leftover of a failed flush is written first
+    if not redis_conn.exists(flushing_key):
+        try:
+            redis_conn.rename(services.SUBLINK_ACCESS_KEY, flushing_key)
+        except redis.exceptions.ResponseError:
+            return "nothing to flush"
+    accesses = redis_conn.hgetall(flushing_key)
+    subscriptionperiods = [
+        models.SubscriptionPeriod(
+            id=int(subscriptionperiod_id),
+            last_sublink_at=datetime.datetime.fromtimestamp(float(timestamp), tz=ZoneInfo("UTC")),
+        )
+        for subscriptionperiod_id, timestamp in accesses.items()
+    ]
+    models.SubscriptionPeriod.objects.bulk_update(
+        subscriptionperiods, fields=["last_sublink_at"], batch_size=SUBLINK_ACCESS_FLUSH_BATCH_SIZE
+    )
+    redis_conn.delete(flushing_key)
+    return f"{len(subscriptionperiods)} accesses are flushed"
@@ -1,7 +1,7 @@
 import ipaddress
 from decimal import Decimal
 from enum import Enum
-from typing import Protocol, TypedDict
+from typing import Literal, Protocol, TypedDict
 
 import pydantic
 
@@ -68,6 +68,11 @@ class ProxyUserProtocol(Protocol):
         ...
 
 
+class ConsumerObjSchema(pydantic.BaseModel):
+    fields: dict[str, Literal["xray_uuid", "xray_email"]]
+    constants: dict[str, str | int | bool | None] = {}
+
+
 #
 # class VLESSClient(pydantic.BaseModel):
 #     id: uuid.uuid5
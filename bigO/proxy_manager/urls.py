@@ -5,4 +5,5 @@ from . import views
 urlpatterns = [
     path("change-me/todo/<uuid:subscription_uuid>/", views.sublink_view),
     path("sub/<uuid:subscription_uuid>/", views.sublink_view),
+    path("node/xray-users/delta/", views.xray_users_delta_view, name="xray_users_delta"),
 ]
@@ -3,11 +3,14 @@ import logging
 import random
 import uuid
 
+from asgiref.sync import sync_to_async
 from packaging.version import InvalidVersion, Version
 
 import django.template
 import django.urls.resolvers
-from django.http import Http404, HttpResponse
+from bigO.node_manager import services as node_manager_services
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, JsonResponse
 from django.template.defaultfilters import floatformat
 from django.utils import timezone
 
@@ -66,8 +69,7 @@ async def sublink_view(request, subscription_uuid: uuid.UUID):
         )
         return "todo"
     if not is_test:
-        subscriptionperiod_obj.last_sublink_at = timezone.now()
-        await subscriptionperiod_obj.asave()
+        await sync_to_async(services.record_sublink_access)(subscriptionperiod_obj.id, timezone.now())
     r_headers = {}
     short_title = f"⚡️{subscriptionprofile_obj.title}"
     r_headers["profile-title"] = "base64:" + base64.b64encode(short_title.encode("utf-8")).decode()
@@ -122,11 +124,20 @@ async def sublink_view(request, subscription_uuid: uuid.UUID):
             style_type = "uri"
     if style_type == "uri":
         res_lines = []
-        sublink_header_content = django.template.Template(
-            subscriptionprofile_obj.initial_agency.sublink_header_template
+        # rendered on every request as it may show the usage
+        agency = subscriptionprofile_obj.initial_agency
+        sublink_header_content = node_manager_services.template_registry.get(
+            agency.sublink_header_template, obj=agency, field="sublink_header_template"
         ).render(context=django.template.Context({"subscriptionperiod_obj": subscriptionperiod_obj}))
         res_lines.append(sublink_header_content)
-        proxies = await services.get_profile_proxies(subscriptionperiod_obj=subscriptionperiod_obj)
+        cache_key = await services.get_sublink_cache_key(
+            subscriptionprofile_obj, subscriptionperiod_obj, style_type=style_type, fingerprint_bucket=None
+        )
+        proxies = await cache.aget(cache_key)
+        cached = proxies is not None
+        if proxies is None:
+            proxies = await services.get_profile_proxies(subscriptionperiod_obj=subscriptionperiod_obj)
+            await cache.aset(cache_key, proxies, timeout=services.SUBLINK_CACHE_TIMEOUT)
         res_lines.extend(proxies)
 
         sublink_content = "\n".join(res_lines)
@@ -139,21 +150,30 @@ async def sublink_view(request, subscription_uuid: uuid.UUID):
             return "todo"
         client_json_template = client_json_template_snippet.template
 
-        profile_json_proxies = await services.get_profile_json_proxies(
-            subscriptionperiod_obj=subscriptionperiod_obj, fp_list=fp_list
+        cache_key = await services.get_sublink_cache_key(
+            subscriptionprofile_obj, subscriptionperiod_obj, style_type=style_type, fingerprint_bucket=agent_os_family
         )
-        reses = []
-        if not profile_json_proxies:
-            return "todo"
-        for profile_json_proxy in profile_json_proxies:
-            ctx = {
-                "outbounds": profile_json_proxy["outbounds"],
-                "balancer": profile_json_proxy["balancer"],
-                "remark": profile_json_proxy["remark"],
-            }
-            res = django.template.Template(client_json_template).render(django.template.Context(ctx))
-            reses.append(res)
-        sublink_content = "[\n" + ",\n".join(reses) + "\n]"
+        sublink_content = await cache.aget(cache_key)
+        cached = sublink_content is not None
+        if sublink_content is None:
+            profile_json_proxies = await services.get_profile_json_proxies(
+                subscriptionperiod_obj=subscriptionperiod_obj, fp_list=fp_list
+            )
+            reses = []
+            if not profile_json_proxies:
+                return "todo"
+            for profile_json_proxy in profile_json_proxies:
+                ctx = {
+                    "outbounds": profile_json_proxy["outbounds"],
+                    "balancer": profile_json_proxy["balancer"],
+                    "remark": profile_json_proxy["remark"],
+                }
+                res = node_manager_services.template_registry.get(
+                    client_json_template, obj=client_json_template_snippet, field="template"
+                ).render(django.template.Context(ctx))
+                reses.append(res)
+            sublink_content = "[\n" + ",\n".join(reses) + "\n]"
+            await cache.aset(cache_key, sublink_content, timeout=services.SUBLINK_CACHE_TIMEOUT)
     else:
         raise NotImplementedError
     if not is_test:
@@ -164,8 +184,27 @@ async def sublink_view(request, subscription_uuid: uuid.UUID):
                 "connection_rule_id": str(subscriptionperiod_obj.plan.connection_rule_id),
                 "profile_id": subscriptionprofile_obj.id,
                 "type": style_type,
+                "cached": cached,
                 "status": "ok",
             },
         )
 
     return HttpResponse(sublink_content, headers=r_headers)
+
+
+def xray_users_delta_view(request):
+    """the users changes of the hot inbounds of the node since the revision that its goingto has applied"""
+    node_id = services.get_xray_users_token_node_id(request.headers.get("X-Xray-Users-Token", ""))
+    if node_id is None:
+        return JsonResponse({"error_info": "invalid token"}, status=403)
+    try:
+        since = int(request.GET.get("since") or 0)
+    except ValueError:
+        return JsonResponse({"error_info": "invalid since"}, status=400)
+    delta = services.get_xray_users_delta(node_id=node_id, since=since)
+    if delta is None:
+        return JsonResponse({"error_info": "no users snapshot yet"}, status=404)
+    metrics.xray_users_delta_counter.add(
+        1, attributes={"node_id": node_id, "full": delta["full"], "changed": bool(delta["inbounds"])}
+    )
+    return JsonResponse(delta)
@@ -1,11 +1,12 @@
 import asyncio
 
-from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.sync import sync_to_async
 
 import aiogram
 from django.contrib import admin, messages
 
 from . import models
+from .sessions import run_on_shared_loop
 
 
 @admin.register(models.TelegramBot)
@@ -15,8 +16,7 @@ class TelegramBotModelAdmin(admin.ModelAdmin):
     list_display = ("id", "title", "tid", "tusername", "is_revoked", "is_powered_off")
     autocomplete_fields = ("webhook_domain",)
 
-    @async_to_sync
-    async def set_webhook_action(what, self, request, queryset):
+    def set_webhook_action(self, request, queryset):
         async def set_webhook(telegram_bot_obj: models.TelegramBot):
             try:
                 await telegram_bot_obj.sync_webhook()
@@ -29,11 +29,13 @@ class TelegramBotModelAdmin(admin.ModelAdmin):
                 level=messages.SUCCESS if success else messages.ERROR,
             )
 
-        tasks = [set_webhook(bot) async for bot in queryset]
-        await asyncio.gather(*tasks)
+        async def main():
+            tasks = [set_webhook(bot) async for bot in queryset]
+            await asyncio.gather(*tasks)
 
-    @async_to_sync
-    async def delete_webhook_action(what, self, request, queryset):
+        run_on_shared_loop(main)
+
+    def delete_webhook_action(self, request, queryset):
         async def delete_webhook(telegram_bot_obj):
             bot = telegram_bot_obj.get_aiobot()
             success = await bot.delete_webhook()
@@ -43,11 +45,13 @@ class TelegramBotModelAdmin(admin.ModelAdmin):
                 level=messages.SUCCESS if success else messages.ERROR,
             )
 
-        tasks = [delete_webhook(bot) async for bot in queryset]
-        await asyncio.gather(*tasks)
+        async def main():
+            tasks = [delete_webhook(bot) async for bot in queryset]
+            await asyncio.gather(*tasks)
+
+        run_on_shared_loop(main)
 
-    @async_to_sync
-    async def get_webhook_info_action(what, self, request, queryset):
+    def get_webhook_info_action(self, request, queryset):
         async def get_webhook_info(telegram_bot_obj):
             webhook_url_shouldbe = await sync_to_async(lambda: telegram_bot_obj.webhook_url)()
             bot = telegram_bot_obj.get_aiobot()
@@ -65,8 +69,11 @@ class TelegramBotModelAdmin(admin.ModelAdmin):
                 level = messages.ERROR
             self.message_user(request, message, level=level)
 
-        tasks = [get_webhook_info(bot) async for bot in queryset]
-        await asyncio.gather(*tasks)
+        async def main():
+            tasks = [get_webhook_info(bot) async for bot in queryset]
+            await asyncio.gather(*tasks)
+
+        run_on_shared_loop(main)
 
 
 @admin.register(models.TelegramUser)
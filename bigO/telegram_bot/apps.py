@@ -6,7 +6,16 @@ class TelegramBotConfig(AppConfig):
     name = "bigO.telegram_bot"
 
     def ready(self):
-        from . import dispatchers, router, settings
+        from django.db.models.signals import post_delete, post_save
+
+        from . import dispatchers, lookups, models, router, settings
+
+        post_save.connect(
+            lookups.telegram_bot_changed, sender=models.TelegramBot, dispatch_uid=f"bot_saved_{self.name}"
+        )
+        post_delete.connect(
+            lookups.telegram_bot_changed, sender=models.TelegramBot, dispatch_uid=f"bot_deleted_{self.name}"
+        )
 
         for middleware_path in settings.TELEGRAM_MIDDLEWARE:
             Middleware = import_string(middleware_path)
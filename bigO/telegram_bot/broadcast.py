@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, NamedTuple
+
+import aiogram
+import aiogram.exceptions
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["Broadcaster", "BroadcastReport"]
+
+# telegram allows about 30 messages per second per bot and one message per second per chat
+BOT_MESSAGES_PER_SECOND = 25
+CHAT_MESSAGE_INTERVAL = 1.05  # seconds
+DEFAULT_CONCURRENCY = 16
+MAX_ATTEMPTS = 4
+
+
+class BroadcastMessage(NamedTuple):
+    chat_id: int
+    text: str
+    reply_markup: Any = None
+    key: Any = None
+
+
+class BroadcastReport:
+    __slots__ = ("delivered", "blocked", "failed", "delivered_keys", "blocked_keys", "blocked_chat_ids")
+
+    def __init__(self):
+        self.delivered = 0
+        self.blocked = 0
+        self.failed = 0
+        self.delivered_keys: list = []
+        self.blocked_keys: list = []
+        self.blocked_chat_ids: set[int] = set()
+
+    def __str__(self):
+        return f"{self.delivered} delivered, {self.blocked} blocked, {self.failed} failed"
+
+
+class RateLimiter:
+    """token bucket shared by the senders of a bot, paused as a whole on flood waits"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.rate, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class Broadcaster:
+    """
+    sends the added messages of a bot concurrently, the messages of a chat are sent in order,
+    flood waits (429) are retried after their retry_after
+    """
+
+    def __init__(
+        self,
+        aiobot: aiogram.Bot,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        messages_per_second: float = BOT_MESSAGES_PER_SECOND,
+        chat_message_interval: float = CHAT_MESSAGE_INTERVAL,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        self.aiobot = aiobot
+        self.concurrency = concurrency
+        self.chat_message_interval = chat_message_interval
+        self.max_attempts = max_attempts
+        self.rate_limiter = RateLimiter(messages_per_second)
+        self._chats_messages: OrderedDict[int, list[BroadcastMessage]] = OrderedDict()
+
+    def add(self, chat_id: int, text: str, reply_markup=None, key=None) -> None:
+        message = BroadcastMessage(chat_id=chat_id, text=text, reply_markup=reply_markup, key=key)
+        self._chats_messages.setdefault(chat_id, []).append(message)
+
+    async def send(self) -> BroadcastReport:
+        report = BroadcastReport()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send_chat(chat_messages: list[BroadcastMessage]):
+            async with semaphore:
+                for index, message in enumerate(chat_messages):
+                    if index:
+                        await asyncio.sleep(self.chat_message_interval)
+                    result = await self._send_message(message)
+                    metrics.broadcast_message_total_counter.add(1, attributes={"result": result})
+                    if result == "delivered":
+                        report.delivered += 1
+                        report.delivered_keys.append(message.key)
+                    elif result in ("blocked", "forbidden"):
+                        # the rest of the chat messages would be rejected as well
+                        report.blocked += len(chat_messages) - index
+                        report.blocked_keys.extend(i.key for i in chat_messages[index:])
+                        if result == "blocked":
+                            report.blocked_chat_ids.add(message.chat_id)
+                        break
+                    else:
+                        report.failed += 1
+
+        chats_messages = list(self._chats_messages.values())
+        self._chats_messages = OrderedDict()
+        await asyncio.gather(*[send_chat(i) for i in chats_messages])
+        return report
+
+    async def _send_message(self, message: BroadcastMessage) -> str:
+        for attempt in range(1, self.max_attempts + 1):
+            await self.rate_limiter.acquire()
+            try:
+                await self.aiobot.send_message(
+                    chat_id=message.chat_id, text=message.text, reply_markup=message.reply_markup
+                )
+            except aiogram.exceptions.TelegramRetryAfter as e:
+                logger.info(f"flood wait of {e.retry_after}s for bot {self.aiobot.id}")
+                self.rate_limiter.pause(e.retry_after)
+            except aiogram.exceptions.TelegramForbiddenError as e:
+                # like a deactivated user or a kicked bot, only the block is marked on the user
+                if "bot was blocked by the user" in e.message:
+                    return "blocked"
+                return "forbidden"
+            except (aiogram.exceptions.TelegramNetworkError, aiogram.exceptions.TelegramServerError) as e:
+                logger.warning(f"error in sending to {message.chat_id} at {attempt=}: {e}")
+                await asyncio.sleep(attempt)
+            except aiogram.exceptions.TelegramAPIError as e:
+                logger.warning(f"could not send to {message.chat_id}: {e}")
+                return "failed"
+            else:
+                return "delivered"
+        return "failed"
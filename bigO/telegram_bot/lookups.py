@@ -0,0 +1,34 @@
+import copy
+
+from bigO.utils.py_helpers import MISSING, TTLCache
+
+from . import models
+
+# the other processes learn about the changes of a bot after this
+BOT_LOOKUP_TTL = 30
+
+_bot_ids_by_tid: TTLCache[int | None] = TTLCache(ttl=BOT_LOOKUP_TTL)
+_bots_by_url_specifier: TTLCache[models.TelegramBot | None] = TTLCache(ttl=BOT_LOOKUP_TTL)
+
+
+async def aget_bot_id_by_tid(tid: int) -> int | None:
+    bot_id = _bot_ids_by_tid.get(tid)
+    if bot_id is MISSING:
+        bot_id = await models.TelegramBot.objects.filter(tid=tid).values_list("id", flat=True).afirst()
+        _bot_ids_by_tid.set(tid, bot_id)
+    return bot_id
+
+
+async def aget_bot_by_url_specifier(url_specifier: str) -> models.TelegramBot | None:
+    """a copy is returned, so the handlers can change it"""
+    bot_obj = _bots_by_url_specifier.get(url_specifier)
+    if bot_obj is MISSING:
+        bot_obj = await models.TelegramBot.objects.filter(webhook_url_specifier=url_specifier).afirst()
+        _bots_by_url_specifier.set(url_specifier, bot_obj)
+    return copy.copy(bot_obj)
+
+
+def telegram_bot_changed(sender, instance, **kwargs) -> None:
+    """post_save and post_delete receiver, the tid or the url specifier itself may be changed"""
+    _bot_ids_by_tid.clear()
+    _bots_by_url_specifier.clear()
@@ -1,4 +1,5 @@
 from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
 
 meter = metrics.get_meter("telegram_bot")
 
@@ -13,3 +14,32 @@ method_total_counter = meter.create_counter(
     unit="update",
     description="Number of method calls",
 )
+
+broadcast_message_total_counter = meter.create_counter(
+    name="broadcast.message.total",
+    unit="message",
+    description="Number of broadcast messages by their result",
+)
+
+session_pool_created_counter = meter.create_counter(
+    name="session.pool.created",
+    unit="1",
+    description="Number of connection pools created, each one needs new connections to telegram",
+)
+
+
+def observe_session_pool(options: CallbackOptions):
+    from .settings import TELEGRAM_SESSION
+
+    stats = TELEGRAM_SESSION.get_pool_stats()
+    yield Observation(stats["in_use"], {"state": "in_use"})
+    yield Observation(stats["idle"], {"state": "idle"})
+    yield Observation(stats["limit"], {"state": "limit"})
+
+
+session_pool_connections_gauge = meter.create_observable_gauge(
+    name="session.pool.connections",
+    callbacks=[observe_session_pool],
+    unit="1",
+    description="Connections of the shared telegram session pools of the process",
+)
@@ -23,7 +23,6 @@ from django.utils import timezone
 from django.utils.translation import gettext as _
 
 from .. import settings
-from ..settings import AiohttpSession
 from .telegram_mappings import TelegramChat
 
 
@@ -31,8 +30,7 @@ class TelegramBotManager(models.Manager):
     async def register(
         self, token: str, tid: int, tbot_name: str, tusername: str, added_from: TelegramBot, added_by: User
     ):
-        session = AiohttpSession(proxy=settings.TELEGRAM_PROXY)
-        aiobot = aiogram.Bot(token, session=session)
+        aiobot = self.model.new_aiobot(token)
         obj: TelegramBot = self.model()
         obj.tid = tid
         obj.title = tbot_name
@@ -93,6 +91,10 @@ class TelegramBot(TimeStampedModel, models.Model):
         return self.ChangePowerResult.DONE
 
     def get_aiobot(self, session: BaseSession | None = None) -> aiogram.Bot:
+        if session is None:
+            from ..sessions import get_aiobot
+
+            return get_aiobot(self.api_token)
         return self.new_aiobot(self.api_token, session=session)
 
     class RegisterResult(str, Enum):
@@ -0,0 +1,97 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+from asgiref.sync import sync_to_async
+
+import aiogram
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+from bigO.utils.py_helpers import MISSING, TTLCache
+from django.db import close_old_connections
+
+from . import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+SESSION_CLOSE_WAIT = 10  # seconds
+# the bots are only bound to their token, so they can be kept for long
+AIOBOT_TTL = 60 * 60
+
+_aiobots: TTLCache[aiogram.Bot] = TTLCache(ttl=AIOBOT_TTL)
+
+_shared_loop: asyncio.AbstractEventLoop | None = None
+_shared_loop_pid: int | None = None
+_shared_loop_lock = threading.Lock()
+
+
+def get_aiobot(token: str) -> aiogram.Bot:
+    """the bot of the token on the shared session of the process"""
+    aiobot = _aiobots.get(token)
+    if aiobot is MISSING:
+        aiobot = aiogram.Bot(
+            token, default=DefaultBotProperties(parse_mode=ParseMode.HTML), session=settings.TELEGRAM_SESSION
+        )
+        _aiobots.set(token, aiobot)
+    return aiobot
+
+
+def get_shared_loop() -> asyncio.AbstractEventLoop:
+    """
+    an event loop that lives as long as the process,
+    unlike async_to_sync that runs every call on a new loop and so a new connection pool
+    """
+    global _shared_loop, _shared_loop_pid
+    pid = os.getpid()
+    if _shared_loop is None or _shared_loop_pid != pid:
+        with _shared_loop_lock:
+            if _shared_loop is None or _shared_loop_pid != pid:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="telegram-loop", daemon=True).start()
+                _shared_loop = loop
+                _shared_loop_pid = pid
+    return _shared_loop
+
+
+def run_on_shared_loop(func: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+    """
+    runs the telegram calls of the sync code (celery tasks) on the shared loop,
+    func should be given the already fetched objects since it does not run in the thread of the caller
+    """
+
+    async def main():
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            # like the end of a request, for the queries that were run in the executor of the loop
+            await sync_to_async(close_old_connections)()
+
+    return asyncio.run_coroutine_threadsafe(main(), get_shared_loop()).result()
+
+
+def close_sessions() -> None:
+    """closes the connection pools of the loops that are still usable, to be called on the process shutdown"""
+    global _shared_loop
+    for loop, session in settings.TELEGRAM_SESSION.get_loop_sessions():
+        if loop.is_closed():
+            continue
+        try:
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(session.close(), loop).result(SESSION_CLOSE_WAIT)
+            else:
+                loop.run_until_complete(session.close())
+        except Exception as e:
+            logger.warning(f"could not close the telegram session: {e}")
+    _aiobots.clear()
+    if _shared_loop is not None and _shared_loop_pid == os.getpid():
+        _shared_loop.call_soon_threadsafe(_shared_loop.stop)
+        _shared_loop = None
+
+
+atexit.register(close_sessions)
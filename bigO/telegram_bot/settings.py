@@ -1,11 +1,89 @@
+import asyncio
+import threading
+from collections.abc import AsyncGenerator
+
+import aiohttp
 from environ import environ
 
+import aiogram
 import aiogram.client.session.aiohttp
 
 from . import metrics
 
 
 class AiohttpSession(aiogram.client.session.aiohttp.AiohttpSession):
+    """
+    keeps a connection pool per event loop instead of a single one,
+    so one session can be shared by the whole process and the keep-alive connections are reused,
+    the pool of a loop is closed when the loop shuts down its async generators (asyncio.run and async_to_sync do)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the closer keeps waiting in the loop until its shutdown, see _close_on_loop_shutdown
+        self._loop_sessions: dict[
+            asyncio.AbstractEventLoop, tuple[aiohttp.ClientSession, AsyncGenerator[None, None]]
+        ] = {}
+        self._loop_sessions_lock = threading.Lock()
+
+    async def create_session(self) -> aiohttp.ClientSession:
+        if self._should_reset_connector:
+            await self.close()
+        loop = asyncio.get_running_loop()
+        closer = None
+        with self._loop_sessions_lock:
+            session, _ = self._loop_sessions.get(loop, (None, None))
+            if session is None or session.closed:
+                session = aiohttp.ClientSession(
+                    connector=self._connector_type(**self._connector_init),
+                    headers={aiohttp.hdrs.USER_AGENT: f"{aiohttp.http.SERVER_SOFTWARE} aiogram/{aiogram.__version__}"},
+                )
+                closer = self._close_on_loop_shutdown(loop, session)
+                self._loop_sessions[loop] = (session, closer)
+                metrics.session_pool_created_counter.add(1)
+            self._should_reset_connector = False
+        if closer is not None:
+            # starting it in the loop registers it to be closed by loop.shutdown_asyncgens()
+            await anext(closer)
+        return session
+
+    async def _close_on_loop_shutdown(
+        self, loop: asyncio.AbstractEventLoop, session: aiohttp.ClientSession
+    ) -> AsyncGenerator[None, None]:
+        try:
+            yield
+        finally:
+            with self._loop_sessions_lock:
+                if self._loop_sessions.get(loop, (None, None))[0] is session:
+                    del self._loop_sessions[loop]
+            if not session.closed:
+                await session.close()
+
+    async def close(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._loop_sessions_lock:
+            _, closer = self._loop_sessions.pop(loop, (None, None))
+        if closer is not None:
+            await closer.aclose()
+
+    def get_loop_sessions(self) -> list[tuple[asyncio.AbstractEventLoop, aiohttp.ClientSession]]:
+        with self._loop_sessions_lock:
+            return [(loop, session) for loop, (session, _) in self._loop_sessions.items() if not session.closed]
+
+    def get_pool_stats(self) -> dict[str, int]:
+        """connections of all the pools, counted from the private state of the aiohttp connectors"""
+        stats = {"in_use": 0, "idle": 0, "limit": 0}
+        for loop, session in self.get_loop_sessions():
+            if loop.is_closed():
+                continue
+            connector = session.connector
+            if connector is None:
+                continue
+            stats["in_use"] += len(getattr(connector, "_acquired", ()))
+            stats["idle"] += sum(len(i) for i in getattr(connector, "_conns", {}).values())
+            stats["limit"] += connector.limit
+        return stats
+
     async def make_request(
         self,
         bot: aiogram.Bot,
@@ -16,13 +94,13 @@ class AiohttpSession(aiogram.client.session.aiohttp.AiohttpSession):
         """
         metrics added
         """
-        from . import models
+        from . import lookups
 
-        bot_obj = await models.TelegramBot.objects.filter(tid=bot.id).afirst()
+        bot_id = await lookups.aget_bot_id_by_tid(bot.id)
         metric_attrs = None
-        if bot_obj:
+        if bot_id:
             metric_attrs = {
-                "bot_id": bot_obj.id,
+                "bot_id": bot_id,
                 "method_name": method.__api_method__,
             }
         try:
@@ -58,5 +136,7 @@ TELEGRAM_MIDDLEWARE = [
     "bigO.telegram_bot.t_middleware.TimeZoneMiddleware",
 ]
 
-TELEGRAM_SESSION = AiohttpSession(proxy=TELEGRAM_PROXY)
+TELEGRAM_POOL_LIMIT = env.int("TELEGRAM_POOL_LIMIT", 100)
+# shared by all the bots of the process, see sessions.py
+TELEGRAM_SESSION = AiohttpSession(proxy=TELEGRAM_PROXY, limit=TELEGRAM_POOL_LIMIT)
 REDIS_STORAGE_URL = env.str("REDIS_URL")
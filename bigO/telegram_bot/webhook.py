@@ -1,24 +1,21 @@
 import json
 import secrets
 
-from asgiref.sync import sync_to_async
-
 from aiogram import Dispatcher
 from aiogram.types import InputFile, Update
 from bigO.utils.decorators import require_http_methods
-from django.http import HttpResponse, HttpResponseForbidden
-from django.shortcuts import get_object_or_404
+from django.http import Http404, HttpResponse, HttpResponseForbidden
 from rest_framework import status
 
-from . import models, settings
+from . import lookups, models, settings
 
 
 def get_webhook_view(dp: Dispatcher):
     @require_http_methods(["POST"])
     async def webhook_view(request, url_specifier: str):
-        telegram_bot_obj: models.TelegramBot = await sync_to_async(get_object_or_404)(
-            models.TelegramBot.objects.filter(webhook_url_specifier=url_specifier)
-        )
+        telegram_bot_obj: models.TelegramBot | None = await lookups.aget_bot_by_url_specifier(url_specifier)
+        if telegram_bot_obj is None:
+            raise Http404()
         request_secret_token = request.headers.get("x-telegram-bot-api-secret-token")
 
         if request_secret_token is None or not secrets.compare_digest(
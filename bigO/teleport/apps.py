@@ -18,6 +18,17 @@ class TeleportConfig(AppConfig):
 
         dp.include_router(router)
 
+        from bigO.proxy_manager.models import Agency
+        from django.db.models.signals import post_delete, post_save
+
+        from . import lookups, models
+
+        for sender in (models.Panel, Agency):
+            post_save.connect(lookups.panel_changed, sender=sender, dispatch_uid=f"panel_saved_{sender._meta.label}")
+            post_delete.connect(
+                lookups.panel_changed, sender=sender, dispatch_uid=f"panel_deleted_{sender._meta.label}"
+            )
+
         from bigO.finance.payment_providers.providers import BankTransfer1
 
         from . import services
@@ -15,7 +15,7 @@ from bigO.telegram_bot.router import AppRouter
 from bigO.telegram_bot.utils import thtml_render_to_string
 from django.utils.translation import gettext
 
-from .. import models, services
+from .. import lookups, models, services
 from ..types import (
     AgentAgencyAction,
     AgentAgencyCallbackData,
@@ -32,9 +32,8 @@ async def app_filter_callback(*args, **kwargs):
     bot_obj: TelegramBot | None = kwargs.get("bot_obj")
     if bot_obj is None:
         return False, args, kwargs
-    try:
-        panel_obj = await models.Panel.objects.select_related("agency").aget(bot=bot_obj, is_active=True)
-    except models.Panel.DoesNotExist:
+    panel_obj = await lookups.aget_active_panel(bot_obj.id)
+    if panel_obj is None:
         return False, args, kwargs
     return True, args, {**kwargs, "panel_obj": panel_obj}
 
@@ -150,7 +149,7 @@ async def menu_handler(
                 return message.reply(gettext("تغییری ایجاد شده، ار ابتدا اقدام کنید."))
 
         wallet_balances = await sync_to_async(
-            proxy_manager_models.MemberCredit.objects.filter(agency_user=useragency).balance
+            proxy_manager_models.MemberCreditBalance.objects.filter(agency_user=useragency).balance
         )()
 
         referlink = (
@@ -187,7 +187,7 @@ async def member_wallet_handler(
         return message.message.edit_text(gettext("تغییری ایجاد شده، ار ابتدا اقدام کنید."))
 
     wallet_balances = await sync_to_async(
-        proxy_manager_models.MemberCredit.objects.filter(agency_user=useragency).balance
+        proxy_manager_models.MemberCreditBalance.objects.filter(agency_user=useragency).balance
     )()
 
     paymentproviders_qs = await sync_to_async(proxy_manager_services.get_user_available_paymentproviders)(
@@ -825,7 +825,7 @@ async def member_initpaybill_handler(
             )
         except ProxyManagerWalletCredit.NotSufficientCredit:
             wallet_balances = await sync_to_async(
-                proxy_manager_models.MemberCredit.objects.filter(agency_user=useragency).balance
+                proxy_manager_models.MemberCreditBalance.objects.filter(agency_user=useragency).balance
             )(currency=invoice.total_price.currency)
             return message.answer(
                 gettext("اعتبار {0} مورد نیاز است، اعتبار فعلی شما {1} است.").format(payment.amount, wallet_balances)
@@ -0,0 +1,24 @@
+import copy
+
+from bigO.utils.py_helpers import MISSING, TTLCache
+
+from . import models
+
+# the other processes learn about the changes of a panel after this
+PANEL_LOOKUP_TTL = 30
+
+_active_panels_by_bot_id: TTLCache[models.Panel | None] = TTLCache(ttl=PANEL_LOOKUP_TTL)
+
+
+async def aget_active_panel(bot_id: int) -> models.Panel | None:
+    """the active panel of the bot with its agency, a copy is returned so the handlers can change it"""
+    panel_obj = _active_panels_by_bot_id.get(bot_id)
+    if panel_obj is MISSING:
+        panel_obj = await models.Panel.objects.select_related("agency").filter(bot_id=bot_id, is_active=True).afirst()
+        _active_panels_by_bot_id.set(bot_id, panel_obj)
+    return copy.copy(panel_obj)
+
+
+def panel_changed(sender, instance, **kwargs) -> None:
+    """post_save and post_delete receiver of the panels and their agencies"""
+    _active_panels_by_bot_id.clear()
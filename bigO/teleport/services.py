@@ -1,11 +1,11 @@
 import json
+import logging
 import random
 import string
 from enum import Enum
 
 from asgiref.sync import async_to_sync, sync_to_async
 
-import aiogram.exceptions
 from aiogram.filters.callback_data import CallbackData
 from aiogram.types import InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
@@ -13,7 +13,8 @@ from bigO.finance import models as finance_models
 from bigO.proxy_manager import models as proxy_manager_models
 from bigO.proxy_manager import services as proxy_manager_services
 from bigO.telegram_bot import models as telegram_bot_models
-from bigO.telegram_bot.settings import AiohttpSession
+from bigO.telegram_bot.broadcast import Broadcaster
+from bigO.telegram_bot.sessions import run_on_shared_loop
 from bigO.users.models import User
 from bigO.utils import calander_type
 from django.core.cache import cache
@@ -25,6 +26,8 @@ from django.utils.translation import gettext
 from ..telegram_bot.utils import thtml_render_to_string
 from . import keyboard_layouts, models
 
+logger = logging.getLogger(__name__)
+
 
 class TelegramBotNotSet(Exception):
     pass
@@ -163,7 +166,15 @@ async def bank_transfer1_pend(sender, admin: User, payment: finance_models.Payme
         await aiobot.send_message(chat_id=tuser.tid, text=text, reply_markup=ikbuilder.as_markup())
 
 
-async def near_end_periods_notify(sender, periods_qs: QuerySet[proxy_manager_models.SubscriptionPeriod], **kwargs):
+def near_end_periods_notify(sender, periods_qs: QuerySet[proxy_manager_models.SubscriptionPeriod], **kwargs):
+    """
+    the signal is sent by a celery task, an async receiver would be run by async_to_sync on a new loop
+    and so a new telegram connection pool on every run
+    """
+    run_on_shared_loop(anear_end_periods_notify, sender=sender, periods_qs=periods_qs, **kwargs)
+
+
+async def anear_end_periods_notify(sender, periods_qs: QuerySet[proxy_manager_models.SubscriptionPeriod], **kwargs):
     panel_qs = models.Panel.objects.filter(is_active=True, agency__is_active=True).select_related("agency", "bot")
     current_timezone = timezone.get_current_timezone()
     current_language = translation.get_language()
@@ -180,65 +191,84 @@ async def near_end_periods_notify(sender, periods_qs: QuerySet[proxy_manager_mod
             calander_type.activate(preferred_calendar_type)
 
         panel: models.Panel
-        agency_periods_qs = (
-            periods_qs.filter(profile__initial_agency=panel.agency)
-            .select_related("profile__user")
+        agency_periods = [
+            i
+            async for i in periods_qs.filter(profile__initial_agency=panel.agency)
+            .select_related("profile__user", "profile__initial_agency__sublink_host")
             .ann_total_limit_bytes()
-        )
-        sent_periods_ids = set()
+        ]
+        if not agency_periods:
+            continue
+        # recipients and the already notified periods are fetched at once
+        profile_tusers = {}
+        async for tuser in telegram_bot_models.TelegramUser.objects.filter(
+            bot=panel.bot, user_id__in={i.profile.user_id for i in agency_periods if i.profile.user_id}
+        ).order_by("last_accessed_at"):
+            profile_tusers[tuser.user_id] = tuser
+        notified_keys = await cache.aget_many([f"send_member_period_notif_{i.id}" for i in agency_periods])
+
         admin_txt_list = []
-        async with AiohttpSession() as session:
-            aiobot = panel.bot.get_aiobot(session=session)
-            async for period in agency_periods_qs:
-                period: proxy_manager_models.SubscriptionPeriod
-                profile_tuser = None
-                if period.profile and period.profile.user:
-                    profile_tuser = await telegram_bot_models.TelegramUser.objects.filter(
-                        user=period.profile.user, bot=panel.bot
-                    ).afirst()
-                if profile_tuser and period.profile.send_notifications and panel.member_subscription_notif:
-                    a = f"send_member_period_notif_{period.id}"
-                    send_member_period_notif = cache.get(a)
-                    if send_member_period_notif is None:
-                        normal_sublink = await sync_to_async(period.profile.get_sublink)()
-                        ikbuilder = InlineKeyboardBuilder()
-                        keyboard_layouts.ik_member_overview_layout(
-                            ikbuilder=ikbuilder,
-                            subscriptionprofile_id=period.profile.id,
-                            agency_id=panel.agency_id,
-                            normal_sublink=normal_sublink,
-                        )
-                        text = await thtml_render_to_string(
-                            "teleport/member/subscription_profile_overview.thtml",
-                            context={"state": None, "subscriptionperiod": period},
-                        )
-                        try:
-                            await aiobot.send_message(
-                                chat_id=profile_tuser.tid, text=text, reply_markup=ikbuilder.as_markup()
-                            )
-                        except aiogram.exceptions.TelegramForbiddenError as e:
-                            if "bot was blocked by the user" in e.message:
-                                await profile_tuser.blocked_detected()
-                        cache.set(a, True, timeout=30 * 60)
-                        sent_periods_ids.add(period.id)
-                admin_txt_list.append(
-                    "\n"
-                    + await thtml_render_to_string(
-                        "teleport/agent/subscription_profile_overview.thtml",
-                        context={"state": None, "subscriptionperiod": period, "profile_tuser": profile_tuser},
-                    )
+        aiobot = panel.bot.get_aiobot()
+        member_broadcaster = Broadcaster(aiobot)
+        for period in agency_periods:
+            period: proxy_manager_models.SubscriptionPeriod
+            profile_tuser = profile_tusers.get(period.profile.user_id) if period.profile.user_id else None
+            if (
+                profile_tuser
+                and period.profile.send_notifications
+                and panel.member_subscription_notif
+                and f"send_member_period_notif_{period.id}" not in notified_keys
+            ):
+                normal_sublink = period.profile.get_sublink()
+                ikbuilder = InlineKeyboardBuilder()
+                keyboard_layouts.ik_member_overview_layout(
+                    ikbuilder=ikbuilder,
+                    subscriptionprofile_id=period.profile.id,
+                    agency_id=panel.agency_id,
+                    normal_sublink=normal_sublink,
+                )
+                text = await thtml_render_to_string(
+                    "teleport/member/subscription_profile_overview.thtml",
+                    context={"state": None, "subscriptionperiod": period},
+                )
+                member_broadcaster.add(
+                    chat_id=profile_tuser.tid, text=text, reply_markup=ikbuilder.as_markup(), key=period.id
+                )
+            admin_txt_list.append(
+                "\n"
+                + await thtml_render_to_string(
+                    "teleport/agent/subscription_profile_overview.thtml",
+                    context={"state": None, "subscriptionperiod": period, "profile_tuser": profile_tuser},
                 )
-            admin_texts_list = [admin_txt_list[i : i + 5] for i in range(0, len(admin_txt_list), 5)]
-            qs2 = telegram_bot_models.TelegramUser.objects.filter(bot=panel.bot, user=OuterRef("user"))
-            agents = proxy_manager_models.Agent.objects.filter(agency=panel.agency, is_active=True).annotate(
-                tid=Subquery(qs2.values("tid"))
             )
-            async for agent in agents.filter(tid__isnull=False):
-                for i, admin_texts in enumerate(admin_texts_list):
-                    await aiobot.send_message(
-                        chat_id=agent.tid,
-                        text=("\n" + "-" * 10).join(admin_texts) + f"\n\n{i + 1} / {len(admin_texts_list)}",
-                    )
+        member_report = await member_broadcaster.send()
+        if member_report.blocked_chat_ids:
+            await telegram_bot_models.TelegramUser.objects.filter(
+                bot=panel.bot, tid__in=member_report.blocked_chat_ids
+            ).aupdate(block_detected_at=timezone.now())
+        # the failed ones are tried again on the next run
+        await cache.aset_many(
+            {
+                f"send_member_period_notif_{i}": True
+                for i in [*member_report.delivered_keys, *member_report.blocked_keys]
+            },
+            timeout=30 * 60,
+        )
+
+        admin_texts_list = [admin_txt_list[i : i + 5] for i in range(0, len(admin_txt_list), 5)]
+        qs2 = telegram_bot_models.TelegramUser.objects.filter(bot=panel.bot, user=OuterRef("user"))
+        agents = proxy_manager_models.Agent.objects.filter(agency=panel.agency, is_active=True).annotate(
+            tid=Subquery(qs2.values("tid"))
+        )
+        agent_broadcaster = Broadcaster(aiobot)
+        async for agent in agents.filter(tid__isnull=False):
+            for i, admin_texts in enumerate(admin_texts_list):
+                agent_broadcaster.add(
+                    chat_id=agent.tid,
+                    text=("\n" + "-" * 10).join(admin_texts) + f"\n\n{i + 1} / {len(admin_texts_list)}",
+                )
+        agent_report = await agent_broadcaster.send()
+        logger.info(f"near end notify of {panel=}, members: {member_report}, agents: {agent_report}")
     timezone.activate(current_timezone)
     translation.activate(current_language)
     calander_type.activate(current_calendar_type)
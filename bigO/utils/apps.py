@@ -8,10 +8,16 @@ class UtilsConfig(AppConfig):
 
     def ready(self):
         from django.conf import settings
+        from django.db.models.signals import post_delete, post_save
         from django.template import base
 
+        from . import dependency_versions
+
         base.render_value_in_context = new_render_value_in_context
 
+        post_save.connect(dependency_versions.dependency_changed, dispatch_uid=f"dependency_saved_{self.name}")
+        post_delete.connect(dependency_versions.dependency_changed, dispatch_uid=f"dependency_deleted_{self.name}")
+
         if settings.MAX_DBCONN_RETRY_TIMES:
             from bigO.utils import db_conn_retry
 
@@ -0,0 +1,82 @@
+import functools
+import gzip
+import logging
+import uuid
+
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+BLOB_TIMEOUT = 60 * 60
+# smaller contents are passed to the tasks as they are
+BLOB_INLINE_MAX_SIZE = 16 * 1024
+
+
+def get_blob_key(blob_ref: str) -> str:
+    return f"blob:{blob_ref}"
+
+
+def put_blob(content: str, timeout: int = BLOB_TIMEOUT) -> str:
+    """
+    stores content in redis and returns its reference,
+    unique per put since the blob is deleted by the first task that consumes it
+    """
+    content_bytes = content.encode("utf-8")
+    blob_ref = uuid.uuid4().hex
+    redis_conn = get_redis_connection("default")
+    redis_conn.set(get_blob_key(blob_ref), gzip.compress(content_bytes, compresslevel=1), ex=timeout)
+    return blob_ref
+
+
+def get_blob(blob_ref: str) -> str | None:
+    redis_conn = get_redis_connection("default")
+    compressed = redis_conn.get(get_blob_key(blob_ref))
+    if compressed is None:
+        return None
+    return gzip.decompress(compressed).decode("utf-8")
+
+
+def delete_blob(blob_ref: str) -> None:
+    redis_conn = get_redis_connection("default")
+    redis_conn.delete(get_blob_key(blob_ref))
+
+
+def delay_with_blob(task, blob_arg_name: str, content: str, **kwargs):
+    """
+    enqueues task with a reference to content instead of content itself as <blob_arg_name>_blob,
+    the task must be decorated with resolve_blob_args
+    """
+    if len(content) <= BLOB_INLINE_MAX_SIZE:
+        return task.delay(**{blob_arg_name: content}, **kwargs)
+    try:
+        blob_ref = put_blob(content)
+    except Exception as e:
+        logger.warning(f"could not store the blob of {task.name}, passing it inline: {e}")
+        return task.delay(**{blob_arg_name: content}, **kwargs)
+    return task.delay(**{f"{blob_arg_name}_blob": blob_ref}, **kwargs)
+
+
+def resolve_blob_args(*arg_names: str):
+    """replaces the <arg_name>_blob keyword arguments with the content they refer to"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            blob_refs = []
+            for arg_name in arg_names:
+                blob_ref = kwargs.pop(f"{arg_name}_blob", None)
+                if blob_ref is None:
+                    continue
+                content = get_blob(blob_ref)
+                if content is None:
+                    return f"blob of {arg_name} is expired"
+                kwargs[arg_name] = content
+                blob_refs.append(blob_ref)
+            res = func(*args, **kwargs)
+            for blob_ref in blob_refs:
+                delete_blob(blob_ref)
+            return res
+
+        return wrapper
+
+    return decorator
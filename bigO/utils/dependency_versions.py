@@ -0,0 +1,71 @@
+from collections.abc import Iterable
+
+from django.core.cache import cache
+from django.db import transaction
+
+# no cached output is rendered from these (tasks, logs, stats and ledgers), so none of the versions are bumped by them
+untracked_models = {
+    "core.CertificateTask",
+    "node_manager.AnsibleTask",
+    "node_manager.AnsibleTaskNode",
+    "node_manager.ContainerSpec",
+    "node_manager.NodeLatestSyncStat",
+    "node_manager.SupervisorProcessInfo",
+    "proxy_manager.MemberCredit",
+    "proxy_manager.MemberCreditBalance",
+    "proxy_manager.SubscriptionEvent",
+    "proxy_manager.SubscriptionNodeUsage",
+}
+
+_dependency_versions: list["DependencyVersion"] = []
+
+
+class DependencyVersion:
+    """
+    a version in the cache that is bumped on commit whenever a model its consumer is rendered from changes,
+    so the consumer can keep its outputs by it, the models are given by their labels (app_label.ModelName)
+    dependent_apps: the saves and deletes of their models bump the version,
+    except untracked_models and independent_models, the ones that only this consumer does not depend on
+    created_dependent_models: only their creation and deletion bump the version, e.g. the ones saved on every sync
+    """
+
+    def __init__(
+        self,
+        key: str,
+        dependent_apps: Iterable[str],
+        independent_models: Iterable[str] = (),
+        created_dependent_models: Iterable[str] = (),
+    ):
+        self.key = key
+        self.dependent_apps = frozenset(dependent_apps)
+        self.independent_models = frozenset(independent_models)
+        self.created_dependent_models = frozenset(created_dependent_models)
+        _dependency_versions.append(self)
+
+    def get(self) -> int:
+        return cache.get(self.key, 0)
+
+    async def aget(self) -> int:
+        return await cache.aget(self.key, 0)
+
+    def bump(self) -> None:
+        try:
+            cache.incr(self.key)
+        except ValueError:
+            cache.set(self.key, 1, timeout=None)
+
+    def is_changed_by(self, sender, created: bool = True) -> bool:
+        label = sender._meta.label
+        if sender._meta.app_label not in self.dependent_apps:
+            return False
+        if label in untracked_models or label in self.independent_models:
+            return False
+        return created or label not in self.created_dependent_models
+
+
+def dependency_changed(sender, using: str, **kwargs) -> None:
+    """the post_save and post_delete receiver of all the versions, connected in UtilsConfig.ready"""
+    created = kwargs.get("created", True)
+    for version in _dependency_versions:
+        if version.is_changed_by(sender, created=created):
+            transaction.on_commit(version.bump, using=using)
@@ -1,8 +1,11 @@
+import zlib
 from io import BytesIO
 
 from django.conf import settings
 from django.core.exceptions import RequestDataTooBig
 from django.http import HttpRequest, RawPostDataException, UnreadablePostError
+from rest_framework.exceptions import UnsupportedMediaType
+from rest_framework.parsers import JSONParser
 
 
 def get_body_from_request(request: HttpRequest, max_body_size: int):
@@ -25,3 +28,66 @@ def get_body_from_request(request: HttpRequest, max_body_size: int):
             request._stream.close()
         request._stream = BytesIO(request._body)
     return request._body
+
+
+def decompress_body(body: bytes, content_encoding: str | None, max_body_size: int) -> bytes:
+    if not content_encoding or content_encoding == "identity":
+        return body
+    if content_encoding != "gzip":
+        raise UnsupportedMediaType(content_encoding)
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    res = decompressor.decompress(body, max_body_size)
+    if decompressor.unconsumed_tail:
+        raise RequestDataTooBig(f"Decompressed request body exceeded {max_body_size} bytes.")
+    return res
+
+
+class GzipJSONParser(JSONParser):
+    """JSONParser that also accepts a gzip Content-Encoding"""
+
+    max_body_size = 100 * 1024 * 1024
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get("request")
+        content_encoding = request.headers.get("Content-Encoding") if request is not None else None
+        if content_encoding and content_encoding != "identity":
+            stream = BytesIO(decompress_body(stream.read(), content_encoding, self.max_body_size))
+        return super().parse(stream, media_type=media_type, parser_context=parser_context)
+
+
+def parse_range_header(range_header: str, size: int) -> tuple[int, int] | None:
+    """
+    parses a single "bytes=" range into an inclusive (start, end), multiple or malformed ranges give None
+    so the whole content gets served, start is not less than size if it is not satisfiable
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+    start_str, sep, end_str = ranges.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not start_str:
+            suffix_length = int(end_str)
+            if suffix_length <= 0:
+                return size, size
+            return max(size - suffix_length, 0), size - 1
+        start = int(start_str)
+        end = int(end_str) if end_str else size - 1
+    except ValueError:
+        return None
+    if start < 0 or (end_str and end < start):
+        return None
+    return start, min(end, size - 1)
+
+
+def iter_file_range(file, length: int, chunk_size: int = 512 * 1024):
+    try:
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
@@ -1,4 +1,7 @@
-from typing import TypeVar
+import threading
+import time
+from collections import OrderedDict
+from typing import Generic, TypeVar
 
 
 def access_index_default(iterable: iter, index: int, default):
@@ -19,3 +22,42 @@ class Singleton(type):
         if cls not in cls._instances:
             cls._instances[cls] = super().__call__(*args, **kwargs)
         return cls._instances[cls]
+
+
+MISSING = object()
+
+
+class TTLCache(Generic[T]):
+    """in process cache that keeps the values for ttl seconds, the owners should invalidate it on their changes"""
+
+    def __init__(self, ttl: float, max_size: int = 1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._values: OrderedDict[object, tuple[float, T]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            item = self._values.get(key)
+            if item is None:
+                return default
+            if item[0] < time.monotonic():
+                del self._values[key]
+                return default
+            self._values.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value: T) -> None:
+        with self._lock:
+            self._values[key] = (time.monotonic() + self.ttl, value)
+            self._values.move_to_end(key)
+            while len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._values.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
@@ -1,7 +1,7 @@
 import os
 
 from celery import Celery
-from celery.signals import worker_init, worker_process_init
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown
 from opentelemetry.instrumentation.celery import CeleryInstrumentor
 
 from . import otel_config
@@ -29,6 +29,16 @@ def worker_process_init_handler(**kwargs):
         CeleryInstrumentor().instrument()
 
 
+@worker_process_shutdown.connect(weak=False)
+def worker_process_shutdown_handler(**kwargs):
+    # flush the points that are still buffered in this process
+    from bigO.core.influx import close_influx_writer
+    from bigO.telegram_bot.sessions import close_sessions
+
+    close_influx_writer()
+    close_sessions()
+
+
 app = Celery("bigO")
 
 # Using a string here means the worker doesn't have to serialize
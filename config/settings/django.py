@@ -338,6 +338,7 @@ if env("LOKI_BASE_ENDPOINT", default=None):
     LOKI_BASE_ENDPOINT = env.url("LOKI_BASE_ENDPOINT").geturl()
     LOKI_USERNAME = env.str("LOKI_USERNAME")
     LOKI_PASSWORD = env.str("LOKI_PASSWORD")
+    LOKI_SPOOL_MAX_LENGTH = env.int("LOKI_SPOOL_MAX_LENGTH", default=20_000)
 if env.bool("LOKI_LOGGING", default=False):
     # Define the log queue
     loki_log_queue = queue.Queue(-1)  # Use an unlimited queue size
@@ -20,6 +20,12 @@ GRAPHIQL = env.bool("GRAPHIQL", False)
 CERTBOT_LOGS_DIR = pathlib.Path(settings.LOGS_DIR) / "certbot"
 CERTBOT_LOGS_DIR.mkdir(exist_ok=True)
 CERTBOT_CONFIG_DIR = pathlib.Path(settings.MEDIA_ROOT) / "protected" / "certbot"
+# the isolated config dirs of the batched runs, certbot locks its config dir so each run has its own
+CERTBOT_RUNS_DIR = pathlib.Path(settings.MEDIA_ROOT) / "protected" / "certbot_runs"
+# number of certbot processes that run at once in a batch
+CERTBOT_CONCURRENCY = env.int("CERTBOT_CONCURRENCY", default=4)
+# the resolvers that the published challenges of a batch are checked against
+CERTBOT_DNS_CHECK_NAMESERVERS = env.list("CERTBOT_DNS_CHECK_NAMESERVERS", default=["1.1.1.1", "8.8.8.8"])
 
 # ansible
 # ------------------------------------------------------------------------------
@@ -13,5 +13,10 @@ type Config struct {
 		Metrics *struct {
 			Interval int `toml:"interval"`
 		} `toml:"metric"`
+		Users *struct {
+			Interval int    `toml:"interval"`
+			Url      string `toml:"url"`
+			Token    string `toml:"token"`
+		} `toml:"users"`
 	} `toml:"xray"`
 }
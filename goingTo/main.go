@@ -44,7 +44,7 @@ func main() {
 	logger.Debug(fmt.Sprintf("Configuration Loaded:\n%+v\n", config))
 
 	var xrayapi *xray.XrayAPI
-	if config.Xray.Usage != nil && config.Xray.APIHost != "" && config.Xray.APIPort != 0 {
+	if (config.Xray.Usage != nil || config.Xray.Users != nil) && config.Xray.APIHost != "" && config.Xray.APIPort != 0 {
 		xrayapi = &xray.XrayAPI{}
 		logger.Info("initializing Xray API")
 		err := xrayapi.Init(config.Xray.APIPort)
@@ -54,6 +54,14 @@ func main() {
 		}
 	}
 
+	if config.Xray.Users != nil {
+		if xrayapi == nil {
+			panic("xray api is needed for syncing the users")
+		}
+		usersSync := NewUsersSync(xrayapi, config.Xray.Users.Url, config.Xray.Users.Token)
+		go usersSync.Run(time.Duration(config.Xray.Users.Interval)*time.Second, logger)
+	}
+
 	for {
 		logger.Debug("getting usage")
 		DoTrafficStats(xrayapi, &config, output, logger)
@@ -8,3 +8,15 @@ type Stat struct {
 type Result struct {
 	Stats []Stat `json:"stats"`
 }
+
+type InboundUsersDelta struct {
+	Protocol string                   `json:"protocol"`
+	Added    []map[string]interface{} `json:"added"`
+	Removed  []string                 `json:"removed"`
+}
+
+type UsersDelta struct {
+	Revision int64                        `json:"revision"`
+	Full     bool                         `json:"full"`
+	Inbounds map[string]InboundUsersDelta `json:"inbounds"`
+}
@@ -0,0 +1,128 @@
+package main
+
+import (
+	"bigO/goingTo/xray"
+	"encoding/json"
+	"fmt"
+	"go.uber.org/zap"
+	"net/http"
+	"strings"
+	"time"
+)
+
+const defaultUsersSyncInterval = 5 * time.Second
+
+// uptime of xray has a second resolution, so smaller differences of the start time are not restarts
+const xrayRestartTolerance = 3 * time.Second
+
+// UsersSync adds and removes the users of the running xray by the changes that the server gives since the
+// revision that has been applied, so that the users changes do not restart xray and drop the connections
+type UsersSync struct {
+	xrayapi   *xray.XrayAPI
+	url       string
+	token     string
+	client    *http.Client
+	revision  int64
+	startedAt time.Time
+}
+
+func NewUsersSync(xrayapi *xray.XrayAPI, url string, token string) *UsersSync {
+	return &UsersSync{
+		xrayapi: xrayapi,
+		url:     url,
+		token:   token,
+		client:  &http.Client{Timeout: 30 * time.Second},
+	}
+}
+
+func (u *UsersSync) Run(interval time.Duration, logger *zap.Logger) {
+	if interval <= 0 {
+		interval = defaultUsersSyncInterval
+	}
+	for {
+		u.Sync(logger)
+		time.Sleep(interval)
+	}
+}
+
+func (u *UsersSync) Sync(logger *zap.Logger) {
+	startedAt, err := u.xrayapi.GetStartedAt()
+	if err != nil {
+		logger.Error("Error getting xray start time", zap.Error(err))
+		return
+	}
+	if u.startedAt.IsZero() || startedAt.Sub(u.startedAt).Abs() > xrayRestartTolerance {
+		// xray has only the users of its config file, so all the users are asked for
+		if !u.startedAt.IsZero() {
+			logger.Info("xray has restarted, syncing all the users")
+		}
+		u.revision = 0
+		u.startedAt = startedAt
+	}
+
+	delta, err := u.fetch()
+	if err != nil {
+		logger.Error("Error getting users delta", zap.Error(err))
+		return
+	}
+	if delta.Revision == u.revision {
+		return
+	}
+	failed := 0
+	for tag, inboundDelta := range delta.Inbounds {
+		failed += u.apply(tag, inboundDelta, logger)
+	}
+	if failed > 0 {
+		// the revision is kept so the same changes are retried, the already applied ones are skipped by xray
+		logger.Error(fmt.Sprintf("%d users changes of revision %d failed", failed, delta.Revision))
+		return
+	}
+	logger.Info(
+		"users synced",
+		zap.Int64("revision", delta.Revision),
+		zap.Bool("full", delta.Full),
+		zap.Int("inbounds", len(delta.Inbounds)),
+	)
+	u.revision = delta.Revision
+}
+
+func (u *UsersSync) apply(tag string, inboundDelta InboundUsersDelta, logger *zap.Logger) int {
+	failed := 0
+	// removed comes first since the changed users are both removed and added
+	for _, email := range inboundDelta.Removed {
+		err := u.xrayapi.RemoveUser(tag, email)
+		if err != nil && !strings.Contains(strings.ToLower(err.Error()), "not found") {
+			logger.Error("Error removing user", zap.String("tag", tag), zap.String("email", email), zap.Error(err))
+			failed++
+		}
+	}
+	for _, user := range inboundDelta.Added {
+		err := u.xrayapi.AddUser(inboundDelta.Protocol, tag, user)
+		if err != nil && !strings.Contains(strings.ToLower(err.Error()), "already exists") {
+			logger.Error("Error adding user", zap.String("tag", tag), zap.Any("email", user["email"]), zap.Error(err))
+			failed++
+		}
+	}
+	return failed
+}
+
+func (u *UsersSync) fetch() (*UsersDelta, error) {
+	req, err := http.NewRequest("GET", fmt.Sprintf("%s?since=%d", u.url, u.revision), nil)
+	if err != nil {
+		return nil, err
+	}
+	req.Header.Set("X-Xray-Users-Token", u.token)
+	resp, err := u.client.Do(req)
+	if err != nil {
+		return nil, err
+	}
+	defer resp.Body.Close()
+	if resp.StatusCode != http.StatusOK {
+		return nil, fmt.Errorf("users delta response code is %d", resp.StatusCode)
+	}
+	var delta UsersDelta
+	if err := json.NewDecoder(resp.Body).Decode(&delta); err != nil {
+		return nil, err
+	}
+	return &delta, nil
+}
@@ -92,25 +92,36 @@ func (x *XrayAPI) DelInbound(tag string) error {
 	return err
 }
 
+// userString is the string field of a user object, the optional fields (like flow) may be missing
+func userString(user map[string]interface{}, key string) string {
+	value, _ := user[key].(string)
+	return value
+}
+
 func (x *XrayAPI) AddUser(Protocol string, inboundTag string, user map[string]interface{}) error {
 	var account *serial.TypedMessage
 	switch Protocol {
 	case "vmess":
 		account = serial.ToTypedMessage(&vmess.Account{
-			Id: user["id"].(string),
+			Id: userString(user, "id"),
 		})
 	case "vless":
 		account = serial.ToTypedMessage(&vless.Account{
-			Id:   user["id"].(string),
-			Flow: user["flow"].(string),
+			Id:   userString(user, "id"),
+			Flow: userString(user, "flow"),
 		})
 	case "trojan":
 		account = serial.ToTypedMessage(&trojan.Account{
-			Password: user["password"].(string),
+			Password: userString(user, "password"),
 		})
 	case "shadowsocks":
 		var ssCipherType shadowsocks.CipherType
-		switch user["cipher"].(string) {
+		// the client objects of xray inbounds name it method
+		method := userString(user, "method")
+		if method == "" {
+			method = userString(user, "cipher")
+		}
+		switch method {
 		case "aes-128-gcm":
 			ssCipherType = shadowsocks.CipherType_AES_128_GCM
 		case "aes-256-gcm":
@@ -125,26 +136,32 @@ func (x *XrayAPI) AddUser(Protocol string, inboundTag string, user map[string]in
 
 		if ssCipherType != shadowsocks.CipherType_NONE {
 			account = serial.ToTypedMessage(&shadowsocks.Account{
-				Password:   user["password"].(string),
+				Password:   userString(user, "password"),
 				CipherType: ssCipherType,
 			})
 		} else {
 			account = serial.ToTypedMessage(&shadowsocks_2022.ServerConfig{
-				Key:   user["password"].(string),
-				Email: user["email"].(string),
+				Key:   userString(user, "password"),
+				Email: userString(user, "email"),
 			})
 		}
 	default:
-		return nil
+		return fmt.Errorf("adding users to %s inbounds is not supported", Protocol)
 	}
+	// json numbers are decoded as float64
+	level, _ := user["level"].(float64)
+
+	ctx, cancel := context.WithTimeout(context.Background(), 5*time.Second)
+	defer cancel()
 
 	client := *x.HandlerServiceClient
 
-	_, err := client.AlterInbound(context.Background(), &command.AlterInboundRequest{
+	_, err := client.AlterInbound(ctx, &command.AlterInboundRequest{
 		Tag: inboundTag,
 		Operation: serial.ToTypedMessage(&command.AddUserOperation{
 			User: &protocol.User{
-				Email:   user["email"].(string),
+				Level:   uint32(level),
+				Email:   userString(user, "email"),
 				Account: account,
 			},
 		}),
@@ -170,6 +187,22 @@ func (x *XrayAPI) RemoveUser(inboundTag, email string) error {
 	return nil
 }
 
+// GetStartedAt is when the running xray has started, a change means that it has been restarted
+func (x *XrayAPI) GetStartedAt() (time.Time, error) {
+	if x.StatsServiceClient == nil {
+		return time.Time{}, common.NewError("xray StatusServiceClient is not initialized")
+	}
+
+	ctx, cancel := context.WithTimeout(context.Background(), 5*time.Second)
+	defer cancel()
+
+	resp, err := (*x.StatsServiceClient).GetSysStats(ctx, &statsService.SysStatsRequest{})
+	if err != nil {
+		return time.Time{}, err
+	}
+	return time.Now().Add(-time.Duration(resp.GetUptime()) * time.Second), nil
+}
+
 func (x *XrayAPI) GetTrafficRaw(reset bool, logger *zap.Logger) ([]*statsService.Stat, error) {
 	if x.grpcClient == nil {
 		return nil, common.NewError("xray api is not initialized")
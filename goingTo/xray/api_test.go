@@ -0,0 +1,208 @@
+package xray
+
+import (
+	"bytes"
+	"encoding/binary"
+	"fmt"
+	"io"
+	"net"
+	"os"
+	"os/exec"
+	"path/filepath"
+	"testing"
+	"time"
+
+	"github.com/xtls/xray-core/common/uuid"
+)
+
+// getXrayBinary is the xray of XRAY_BINARY or the PATH, the test is skipped without one
+func getXrayBinary(t *testing.T) string {
+	if path := os.Getenv("XRAY_BINARY"); path != "" {
+		return path
+	}
+	path, err := exec.LookPath("xray")
+	if err != nil {
+		t.Skip("no xray binary, set XRAY_BINARY or put xray on the PATH")
+	}
+	return path
+}
+
+func getFreePort(t *testing.T) int {
+	listener, err := net.Listen("tcp", "127.0.0.1:0")
+	if err != nil {
+		t.Fatal(err)
+	}
+	defer listener.Close()
+	return listener.Addr().(*net.TCPAddr).Port
+}
+
+func waitForPort(t *testing.T, port int) {
+	deadline := time.Now().Add(10 * time.Second)
+	for time.Now().Before(deadline) {
+		conn, err := net.DialTimeout("tcp", fmt.Sprintf("127.0.0.1:%d", port), time.Second)
+		if err == nil {
+			conn.Close()
+			return
+		}
+		time.Sleep(100 * time.Millisecond)
+	}
+	t.Fatalf("port %d is not listening", port)
+}
+
+func runXray(t *testing.T, xrayPath string, config string) {
+	configPath := filepath.Join(t.TempDir(), "config.json")
+	if err := os.WriteFile(configPath, []byte(config), 0o600); err != nil {
+		t.Fatal(err)
+	}
+	cmd := exec.Command(xrayPath, "run", "-c", configPath)
+	cmd.Stdout = os.Stderr
+	cmd.Stderr = os.Stderr
+	if err := cmd.Start(); err != nil {
+		t.Fatal(err)
+	}
+	t.Cleanup(func() {
+		cmd.Process.Kill()
+		cmd.Wait()
+	})
+}
+
+func startEchoServer(t *testing.T) int {
+	listener, err := net.Listen("tcp", "127.0.0.1:0")
+	if err != nil {
+		t.Fatal(err)
+	}
+	t.Cleanup(func() { listener.Close() })
+	go func() {
+		for {
+			conn, err := listener.Accept()
+			if err != nil {
+				return
+			}
+			go func() {
+				defer conn.Close()
+				io.Copy(conn, conn)
+			}()
+		}
+	}()
+	return listener.Addr().(*net.TCPAddr).Port
+}
+
+// dialSocks5 connects to 127.0.0.1:targetPort through the socks inbound of the client xray
+func dialSocks5(t *testing.T, socksPort int, targetPort int) net.Conn {
+	conn, err := net.DialTimeout("tcp", fmt.Sprintf("127.0.0.1:%d", socksPort), 5*time.Second)
+	if err != nil {
+		t.Fatal(err)
+	}
+	conn.SetDeadline(time.Now().Add(10 * time.Second))
+	defer conn.SetDeadline(time.Time{})
+	reply := make([]byte, 10)
+	if _, err := conn.Write([]byte{5, 1, 0}); err != nil {
+		t.Fatal(err)
+	}
+	if _, err := io.ReadFull(conn, reply[:2]); err != nil || reply[1] != 0 {
+		t.Fatalf("socks greeting failed: %v %v", reply[:2], err)
+	}
+	request := []byte{5, 1, 0, 1, 127, 0, 0, 1, 0, 0}
+	binary.BigEndian.PutUint16(request[8:], uint16(targetPort))
+	if _, err := conn.Write(request); err != nil {
+		t.Fatal(err)
+	}
+	if _, err := io.ReadFull(conn, reply); err != nil || reply[1] != 0 {
+		t.Fatalf("socks connect failed: %v %v", reply, err)
+	}
+	return conn
+}
+
+func assertEcho(t *testing.T, conn net.Conn, msg string) {
+	conn.SetDeadline(time.Now().Add(10 * time.Second))
+	defer conn.SetDeadline(time.Time{})
+	if _, err := conn.Write([]byte(msg)); err != nil {
+		t.Fatalf("writing %q: %v", msg, err)
+	}
+	buf := make([]byte, len(msg))
+	if _, err := io.ReadFull(conn, buf); err != nil {
+		t.Fatalf("reading %q: %v", msg, err)
+	}
+	if !bytes.Equal(buf, []byte(msg)) {
+		t.Fatalf("got %q instead of %q", buf, msg)
+	}
+}
+
+// TestUserChurnKeepsConnections adds and removes users of a running inbound through the api,
+// the established connections of the other users must not be dropped and xray must not be restarted
+func TestUserChurnKeepsConnections(t *testing.T) {
+	xrayPath := getXrayBinary(t)
+	apiPort, vlessPort, socksPort := getFreePort(t), getFreePort(t), getFreePort(t)
+	echoPort := startEchoServer(t)
+	userId := uuid.New()
+
+	runXray(t, xrayPath, fmt.Sprintf(`{
+  "log": {"loglevel": "warning"},
+  "api": {"tag": "api", "services": ["HandlerService", "StatsService"]},
+  "stats": {},
+  "inbounds": [
+    {"tag": "api", "listen": "127.0.0.1", "port": %d, "protocol": "dokodemo-door", "settings": {"address": "127.0.0.1"}},
+    {"tag": "vless_in", "listen": "127.0.0.1", "port": %d, "protocol": "vless",
+     "settings": {"clients": [{"id": "%s", "email": "steady@love.com"}], "decryption": "none"}}
+  ],
+  "outbounds": [{"protocol": "freedom"}],
+  "routing": {"rules": [{"type": "field", "inboundTag": ["api"], "outboundTag": "api"}]}
+}`, apiPort, vlessPort, userId.String()))
+	runXray(t, xrayPath, fmt.Sprintf(`{
+  "log": {"loglevel": "warning"},
+  "inbounds": [{"listen": "127.0.0.1", "port": %d, "protocol": "socks", "settings": {"udp": false}}],
+  "outbounds": [{"protocol": "vless", "settings": {"vnext": [
+    {"address": "127.0.0.1", "port": %d, "users": [{"id": "%s", "encryption": "none"}]}
+  ]}}]
+}`, socksPort, vlessPort, userId.String()))
+	waitForPort(t, apiPort)
+	waitForPort(t, vlessPort)
+	waitForPort(t, socksPort)
+
+	api := XrayAPI{}
+	if err := api.Init(apiPort); err != nil {
+		t.Fatal(err)
+	}
+	defer api.Close()
+	startedAt, err := api.GetStartedAt()
+	if err != nil {
+		t.Fatal(err)
+	}
+
+	conn := dialSocks5(t, socksPort, echoPort)
+	defer conn.Close()
+	assertEcho(t, conn, "before churn")
+
+	for round := 0; round < 5; round++ {
+		var emails []string
+		for i := 0; i < 50; i++ {
+			email := fmt.Sprintf("churn%d_%d@love.com", round, i)
+			id := uuid.New()
+			user := map[string]interface{}{"id": id.String(), "email": email, "level": float64(0)}
+			if err := api.AddUser("vless", "vless_in", user); err != nil {
+				t.Fatalf("adding %s: %v", email, err)
+			}
+			emails = append(emails, email)
+		}
+		assertEcho(t, conn, fmt.Sprintf("after adding round %d", round))
+		for _, email := range emails {
+			if err := api.RemoveUser("vless_in", email); err != nil {
+				t.Fatalf("removing %s: %v", email, err)
+			}
+		}
+		assertEcho(t, conn, fmt.Sprintf("after removing round %d", round))
+	}
+
+	newConn := dialSocks5(t, socksPort, echoPort)
+	defer newConn.Close()
+	assertEcho(t, newConn, "new connection")
+
+	newStartedAt, err := api.GetStartedAt()
+	if err != nil {
+		t.Fatal(err)
+	}
+	// the start is derived from the uptime seconds
+	if diff := newStartedAt.Sub(startedAt); diff > 2*time.Second || diff < -2*time.Second {
+		t.Fatalf("xray is restarted during the churn, started at %v and then %v", startedAt, newStartedAt)
+	}
+}
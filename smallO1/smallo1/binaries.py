@@ -0,0 +1,144 @@
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from hashlib import sha256
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import requests
+import requests.adapters
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["BinaryStore", "BinaryDownloader", "ContentDownloadError"]
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class ContentDownloadError(Exception):
+    pass
+
+
+class BinaryStore:
+    """content addressed store of the program binaries, each one is kept at sha256/<hash>"""
+
+    def __init__(self, bin_dir: Path):
+        self.bin_dir = bin_dir
+        self.store_dir = bin_dir.joinpath("sha256")
+        self.store_dir.mkdir(parents=False, exist_ok=True)
+
+    def path(self, identifier: str) -> Path:
+        return self.store_dir.joinpath(identifier)
+
+    def part_path(self, identifier: str) -> Path:
+        return self.store_dir.joinpath(f"{identifier}.part")
+
+    def has(self, identifier: str) -> bool:
+        return self.path(identifier).is_file()
+
+    def gc(self, referenced_paths: Iterable[Path], keep_identifiers: Iterable[str] = ()):
+        """removes the binaries (and the legacy ones of bin_dir) that are not referenced anymore"""
+        keep = {i.absolute() for i in referenced_paths}
+        for identifier in keep_identifiers:
+            keep.add(self.path(identifier).absolute())
+            keep.add(self.part_path(identifier).absolute())
+        for path in [*self.bin_dir.iterdir(), *self.store_dir.iterdir()]:
+            if not path.is_file() or path.absolute() in keep:
+                continue
+            logger.info(f"removing unreferenced binary {path}")
+            path.unlink(missing_ok=True)
+
+
+class BinaryDownloader:
+    """downloads the binaries into the store in a thread pool, resuming the partial ones with ranged requests"""
+
+    def __init__(
+        self,
+        store: BinaryStore,
+        get_content_url: Callable[[str], str],
+        headers: Dict[str, str],
+        timeout: Optional[Tuple[int, int]],
+        max_workers: int = 4,
+        retry_limit: int = 3,
+    ):
+        self.store = store
+        self.get_content_url = get_content_url
+        self.headers = headers
+        self.timeout = timeout
+        self.retry_limit = retry_limit
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="binary-download")
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, identifier: str) -> Future:
+        """the same future is returned while a download of identifier is in progress"""
+        with self._lock:
+            future = self._futures.get(identifier)
+            if future is None or (future.done() and future.exception() is not None):
+                future = self.executor.submit(self.download, identifier)
+                self._futures[identifier] = future
+            return future
+
+    def in_progress(self) -> set:
+        with self._lock:
+            return {k for k, v in self._futures.items() if not v.done()}
+
+    def download(self, identifier: str) -> Path:
+        dest = self.store.path(identifier)
+        if dest.is_file():
+            return dest
+        for retry_count in range(1, self.retry_limit + 1):
+            try:
+                if self._download_part(identifier):
+                    return dest
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"error in binary download of {identifier=} at {retry_count=}: {e}")
+        raise ContentDownloadError(identifier)
+
+    def _download_part(self, identifier: str) -> bool:
+        part_path = self.store.part_path(identifier)
+        received_sha256 = sha256()
+        offset = 0
+        if part_path.is_file():
+            with open(part_path, "rb") as f:
+                while chunk := f.read(MAX_CHUNK_SIZE):
+                    received_sha256.update(chunk)
+                    offset += len(chunk)
+        headers = dict(self.headers)
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = f'"{identifier}"'
+        with self.session.get(
+            self.get_content_url(identifier), headers=headers, stream=True, timeout=self.timeout
+        ) as r:
+            if r.status_code == 416:
+                # the part is already complete, or broken
+                r.close()
+            elif r.status_code == 200:
+                if offset:
+                    received_sha256 = sha256()
+                    offset = 0
+            elif r.status_code != 206:
+                logger.warning(f"binary-content returned {r.status_code=}, and the content is {r.text[:50]}")
+                return False
+            if r.status_code in (200, 206):
+                content_length = int(r.headers.get("Content-Length") or 0)
+                chunk_size = min(max(content_length // 100, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+                with open(part_path, "ab" if offset else "wb") as f:
+                    for chunk in r.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                        received_sha256.update(chunk)
+        if received_sha256.hexdigest() != identifier:
+            logger.debug(f"sha missmatch happened for {identifier=}")
+            part_path.unlink(missing_ok=True)
+            return False
+        os.chmod(part_path, 0o755)
+        os.replace(part_path, self.store.path(identifier))
+        logger.debug(f"successfully downloaded {identifier=}")
+        return True
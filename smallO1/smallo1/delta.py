@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import xmlrpc.client
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .api_types import ConfigStateRequest, SupervisorProcessTailLog
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["LogOffsets", "StatesSpool", "tail_processes_logs"]
+
+
+class LogOffsets:
+    """byte offsets of the supervisor process logs that are already uploaded"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.offsets: Dict[str, int] = {}
+        if path.is_file():
+            try:
+                self.offsets = json.loads(path.read_text())
+            except ValueError:
+                logger.warning(f"could not load log offsets from {path}, starting over")
+
+    def get(self, name: str, channel: str) -> int:
+        return self.offsets.get(f"{name}:{channel}", 0)
+
+    def set(self, name: str, channel: str, offset: int):
+        self.offsets[f"{name}:{channel}"] = offset
+
+    def save(self):
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.offsets))
+        os.replace(tmp_path, self.path)
+
+
+class StatesSpool:
+    """
+    append only file of the configs states that are not uploaded yet, one json per line,
+    new states are dropped when it is bigger than max_bytes
+    """
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def read(self) -> List[ConfigStateRequest]:
+        if not self.path.is_file():
+            return []
+        res = []
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    res.append(ConfigStateRequest.model_validate_json(line))
+                except ValueError:
+                    # most likely a partially written line
+                    logger.warning("skipping a broken line of the states spool")
+        return res
+
+    def append(self, configs_states: List[ConfigStateRequest]):
+        size = self.path.stat().st_size if self.path.is_file() else 0
+        if size >= self.max_bytes:
+            logger.warning(f"states spool is full ({size} bytes), dropping {len(configs_states)} states")
+            return
+        with open(self.path, "ab") as f:
+            for i in configs_states:
+                f.write(i.model_dump_json().encode("utf-8") + b"\n")
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+
+
+def read_log_after_fault(
+    sup_server: xmlrpc.client.ServerProxy,
+    name: str,
+    channel: str,
+    offset: int,
+    length: int,
+    fault: xmlrpc.client.Fault,
+) -> Tuple[str, int]:
+    """
+    supervisor fails to decode a window that ends in the middle of a multibyte utf-8 character,
+    so the window is read again up to 3 bytes shorter, when that fails too the window is skipped
+    not to get stuck on it until the log is rotated, returns the data and the bytes read
+    """
+    read_log = getattr(sup_server.supervisor, f"readProcess{channel.capitalize()}Log")
+    for shorter_length in range(length - 1, max(length - 4, 0), -1):
+        try:
+            data = read_log(name, offset, shorter_length)
+        except xmlrpc.client.Fault:
+            continue
+        logger.info(f"read {channel} log of {name} at {offset=} with {shorter_length} bytes instead of {length}")
+        return data, len(data.encode("utf-8"))
+    logger.error(f"could not read {channel} log of {name} at {offset=}, skipping {length} bytes: {fault}")
+    return "", length
+
+
+def tail_processes_logs(
+    sup_server: xmlrpc.client.ServerProxy, process_infos: List[dict], offsets: LogOffsets, bytes_limit: int
+) -> Dict[str, Tuple[SupervisorProcessTailLog, SupervisorProcessTailLog]]:
+    """
+    reads only the new bytes of stdout and stderr of all the processes in a single xml-rpc multicall,
+    tail*Log is not used since it returns the last bytes whenever offset + length passes the end
+    """
+    reads = []
+    for info in process_infos:
+        name = info["name"]
+        for channel in ("stdout", "stderr"):
+            offset = offsets.get(name, channel)
+            logfile = info.get(f"{channel}_logfile")
+            size = os.path.getsize(logfile) if logfile and os.path.isfile(logfile) else 0
+            if size < offset:
+                # the log is rotated or cleared, read the new file from the start
+                logger.info(f"{channel} log of {name} is rotated")
+                offset = 0
+            reads.append((name, channel, offset, size))
+
+    multicall = xmlrpc.client.MultiCall(sup_server)
+    for name, channel, offset, size in reads:
+        if size > offset:
+            getattr(multicall.supervisor, f"readProcess{channel.capitalize()}Log")(name, offset, bytes_limit)
+    results = multicall()
+    res = {}
+    result_index = 0
+    for name, channel, offset, size in reads:
+        data, read_bytes = "", 0
+        if size > offset:
+            try:
+                data = results[result_index]
+                read_bytes = len(data.encode("utf-8"))
+            except xmlrpc.client.Fault as e:
+                data, read_bytes = read_log_after_fault(
+                    sup_server, name, channel, offset, min(size - offset, bytes_limit), fault=e
+                )
+            result_index += 1
+        new_offset = offset + read_bytes
+        offsets.set(name, channel, new_offset)
+        res.setdefault(name, []).append(
+            SupervisorProcessTailLog(bytes=data, offset=new_offset, overflow=size - offset > bytes_limit)
+        )
+    return {name: (tails[0], tails[1]) for name, tails in res.items()}
@@ -1,18 +1,18 @@
 import argparse
+import concurrent.futures
 import datetime
+import gzip
 import importlib.metadata
 import logging.config
 import logging.handlers
 import os
-import shutil
+import re
 import subprocess
-import tempfile
 import time
 import urllib.parse
 import xmlrpc.client
-from hashlib import sha256
 from pathlib import Path
-from typing import Union, Tuple, Optional, List
+from typing import Union, Tuple, Optional, List, Dict
 import pydantic
 import requests
 import sentry_sdk
@@ -22,6 +22,8 @@ from pydantic_settings import BaseSettings
 from .api_types import BaseSyncRequest, BaseSyncResponse, MetricRequest, SupervisorProcessInfoDict, \
     SupervisorProcessTailLog, ConfigStateRequest
 from . import utils
+from .binaries import BinaryDownloader, BinaryStore
+from .delta import LogOffsets, StatesSpool, tail_processes_logs
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +36,14 @@ class Settings(BaseSettings):
     working_dir: str
     full_control_supervisord: bool
     sentry_dsn: Union[pydantic.HttpUrl, None] = None
+    # only upload the new bytes of the process logs instead of the tail and clearing them
+    delta_upload: bool = True
+    sync_log_bytes_limit: int = 1_000_000
+    spool_max_bytes: int = 50_000_000
+    compress_requests: bool = True
+    binary_download_workers: int = 4
+    # how long a sync waits for the binaries before keeping the previous programs of their configs until the next sync
+    binary_download_wait_sec: int = 60
 
     @pydantic.model_validator(mode="before")
     def check_working_dir(cls, values):
@@ -128,6 +138,16 @@ def is_supervisor_running(sup_server: xmlrpc.client.ServerProxy):
     return res["statecode"] == 1
 
 
+def get_supervisor_program_sections(supervisor_config: str) -> Dict[str, str]:
+    """the [program:x] sections of a supervisor config written by the sync loop, by their program name"""
+    res = {}
+    for section in re.split(r"(?=\n\n# config_hash=)", supervisor_config):
+        match = re.search(r"^\[program:(.+)\]$", section, flags=re.MULTILINE)
+        if match:
+            res[match.group(1)] = section
+    return res
+
+
 def main(settings: Settings):
     _version = importlib.metadata.version("smallo1")
     formatter = logging.Formatter("%(levelname)s %(asctime)s %(module)s %(process)d %(thread)d %(message)s")
@@ -173,13 +193,33 @@ def main(settings: Settings):
         else:
             logger.critical("supervisor is not running, start it !!!")
 
+    binary_store = BinaryStore(settings.get_bin_dir())
+    binary_downloader = BinaryDownloader(
+        store=binary_store,
+        get_content_url=settings.get_binary_content_url,
+        headers={"Authorization": f"Api-Key {settings.api_key}", "User-Agent": f"smallo1:{_version}"},
+        timeout=settings.get_timeout(),
+        max_workers=settings.binary_download_workers,
+    )
     while True:
         try:
             headers = {"Authorization": f"Api-Key {settings.api_key}", "User-Agent": f"smallo1:{_version}"}
             base_sync_url = settings.get_base_sync_url()
             logger.debug(f"requesting {base_sync_url}")
-            with BaseSyncRequestPayload(sup_server=sup_server, backup_dir=settings.get_logs_dir(), self_log_file=settings.get_logs_dir().joinpath("debug.log")) as payloadmanager:
-                r = requests.post(base_sync_url, json=payloadmanager.payload.model_dump(mode="json"), headers=headers, timeout=settings.get_timeout())
+            with BaseSyncRequestPayload(
+                sup_server=sup_server,
+                backup_dir=settings.get_logs_dir(),
+                self_log_file=settings.get_logs_dir().joinpath("debug.log"),
+                delta_upload=settings.delta_upload,
+                bytes_limit=settings.sync_log_bytes_limit if settings.delta_upload else 20_000_000,
+                spool_max_bytes=settings.spool_max_bytes,
+            ) as payloadmanager:
+                body = payloadmanager.payload.model_dump_json().encode("utf-8")
+                request_headers = {**headers, "Content-Type": "application/json"}
+                if settings.compress_requests:
+                    body = gzip.compress(body)
+                    request_headers["Content-Encoding"] = "gzip"
+                r = requests.post(base_sync_url, data=body, headers=request_headers, timeout=settings.get_timeout())
                 if r.status_code != 200:
                     next_try_in = settings.interval_sec
                     logger.warning(f"base-sync returned {r.status_code=}, {next_try_in=} and the content is {r.content}")
@@ -191,29 +231,52 @@ def main(settings: Settings):
             logger.debug(f"base-sync respond with {r.status_code=} and content is: {response}")
 
             response = BaseSyncResponse(**response)
+            # download all the missing binaries in parallel before applying any config
+            downloads = {}
+            for config in response.configs:
+                outer_binary_identifier = config.program.outer_binary_identifier
+                if config.program.inner_binary_path or not outer_binary_identifier:
+                    continue
+                legacy_binary_path = settings.get_bin_dir().joinpath(
+                    f"{config.program.program_version_id}_{outer_binary_identifier[:6]}"
+                )
+                if not legacy_binary_path.is_file() and not binary_store.has(outer_binary_identifier):
+                    downloads[outer_binary_identifier] = binary_downloader.submit(outer_binary_identifier)
+            if downloads:
+                concurrent.futures.wait(downloads.values(), timeout=settings.binary_download_wait_sec)
+
+            with open(supervisor_config_path, encoding="utf8") as f:
+                current = f.read()
+            current_program_sections = get_supervisor_program_sections(current)
             new_supervisor_config = ""
+            binary_paths = []
+            is_any_skipped = False
             for config in response.configs:
                 if config.program.inner_binary_path:
                     binary_path = Path(config.program.inner_binary_path)
                     if not binary_path.is_file():
                         logger.critical(f"inner {binary_path=} is not a valid file")
+                        is_any_skipped = True
                         continue
                 elif outer_binary_identifier := config.program.outer_binary_identifier:
+                    # binaries downloaded by the older versions are kept where they are not to restart them
                     binary_path = settings.get_bin_dir().joinpath(
                         f"{config.program.program_version_id}_{outer_binary_identifier[:6]}"
                     )
                     if not binary_path.is_file():
-                        try:
-                            download_outerbinary(
-                                binary_content_url=settings.get_binary_content_url(outer_binary_identifier),
-                                save_to=binary_path,
-                                identifier=outer_binary_identifier,
-                                api_key=settings.api_key,
-                                timeout=settings.get_timeout()
-                            )
-                        except ContentDownloadError as e:
+                        binary_path = binary_store.path(outer_binary_identifier)
+                    if not binary_path.is_file():
+                        download = downloads.get(outer_binary_identifier)
+                        if download is not None and download.done():
                             logger.critical(f"could not download {outer_binary_identifier} for {config.id=}")
-                            continue
+                        else:
+                            logger.warning(f"{outer_binary_identifier} for {config.id=} is still downloading")
+                        is_any_skipped = True
+                        # keep running the previous program with its binary until the new binary is ready
+                        if previous_section := current_program_sections.get(str(config.id)):
+                            new_supervisor_config += previous_section
+                        continue
+                    binary_paths.append(binary_path)
                 else:
                     raise NotImplementedError
                 conf_dir = settings.get_conf_dir()
@@ -252,10 +315,10 @@ priority=10
                 if config.comma_separated_environment:
                     new_supervisor_config += f"\nenvironment={config._processed_comma_separated_environment}"
 
-            with open(supervisor_config_path, encoding="utf8") as f:
-                current = f.read()
             if current == new_supervisor_config:
                 logging.debug("already up to date.")
+                if not is_any_skipped:
+                    binary_store.gc(binary_paths, keep_identifiers=binary_downloader.in_progress())
             else:
                 logging.debug("change found.")
                 with open(supervisor_config_path, "wb") as f:
@@ -297,15 +360,28 @@ priority=10
 
 
 class BaseSyncRequestPayload:
-    def __init__(self, sup_server: xmlrpc.client.ServerProxy, backup_dir: Path, self_log_file: Path):
+    def __init__(
+        self,
+        sup_server: xmlrpc.client.ServerProxy,
+        backup_dir: Path,
+        self_log_file: Path,
+        delta_upload: bool = False,
+        bytes_limit: int = 20_000_000,
+        spool_max_bytes: int = 50_000_000,
+    ):
         self.sup_server = sup_server
         self.backup_dir = backup_dir
         self.is_committed = False
         self.payload: pydantic.BaseModel
         self.self_log_file = self_log_file
+        self.delta_upload = delta_upload
+        self.bytes_limit = bytes_limit
+        self.spool = StatesSpool(backup_dir.joinpath("configs_states.spool"), max_bytes=spool_max_bytes)
+        self.log_offsets = LogOffsets(backup_dir.joinpath("log_offsets.json"))
+        self.new_configs_states: List[ConfigStateRequest] = []
 
     def __enter__(self):
-        bytes_limit = 20_000_000
+        bytes_limit = self.bytes_limit
         try:
             all_process_info_list: List[SupervisorProcessInfoDict] = self.sup_server.supervisor.getAllProcessInfo()
         except Exception as e:
@@ -313,21 +389,28 @@ class BaseSyncRequestPayload:
             if is_supervisor_running(sup_server=self.sup_server):
                 raise e
         else:
-            configs_states: List[ConfigStateRequest] = []
-            with open(self.backup_file, "rb") as f:
-                perv_configs_states_json = f.read()
-            if perv_configs_states_json:
-                perv_configs_states = pydantic.TypeAdapter(List[ConfigStateRequest]).validate_json(perv_configs_states_json)
-                configs_states.extend(perv_configs_states)
-            for i in all_process_info_list:
+            self.migrate_backup_file()
+            configs_states: List[ConfigStateRequest] = self.spool.read()
+            if self.delta_upload:
+                tails = tail_processes_logs(
+                    self.sup_server, all_process_info_list, self.log_offsets, bytes_limit
+                )
                 now = datetime.datetime.now().astimezone()
-                r = self.sup_server.supervisor.tailProcessStdoutLog(i["name"], 0, bytes_limit)
-                stdout_r = SupervisorProcessTailLog(bytes=r[0], offset=r[1], overflow=r[2])
-                r = self.sup_server.supervisor.tailProcessStderrLog(i["name"], 0, bytes_limit)
-                stderr_r = SupervisorProcessTailLog(bytes=r[0], offset=r[1], overflow=r[2])
-                self.sup_server.supervisor.clearProcessLogs(i["name"])
-                configs_states.append(
-                    ConfigStateRequest(time=now, supervisorprocessinfo=i, stdout=stdout_r, stderr=stderr_r))
+                for i in all_process_info_list:
+                    stdout_r, stderr_r = tails[i["name"]]
+                    self.new_configs_states.append(
+                        ConfigStateRequest(time=now, supervisorprocessinfo=i, stdout=stdout_r, stderr=stderr_r))
+            else:
+                for i in all_process_info_list:
+                    now = datetime.datetime.now().astimezone()
+                    r = self.sup_server.supervisor.tailProcessStdoutLog(i["name"], 0, bytes_limit)
+                    stdout_r = SupervisorProcessTailLog(bytes=r[0], offset=r[1], overflow=r[2])
+                    r = self.sup_server.supervisor.tailProcessStderrLog(i["name"], 0, bytes_limit)
+                    stderr_r = SupervisorProcessTailLog(bytes=r[0], offset=r[1], overflow=r[2])
+                    self.sup_server.supervisor.clearProcessLogs(i["name"])
+                    self.new_configs_states.append(
+                        ConfigStateRequest(time=now, supervisorprocessinfo=i, stdout=stdout_r, stderr=stderr_r))
+            configs_states.extend(self.new_configs_states)
 
         ipa_res = subprocess.run(["ip", "a"], capture_output=True)
         with open(self.self_log_file, "r+b") as f:
@@ -343,11 +426,18 @@ class BaseSyncRequestPayload:
         )
         return self
 
-    @property
-    def backup_file(self) -> Path:
-        configs_states = self.backup_dir.joinpath("configs_states.json.bak")
-        configs_states.touch(exist_ok=True)
-        return configs_states
+    def migrate_backup_file(self):
+        # states backed up by the older versions which rewrote the whole file
+        backup_file = self.backup_dir.joinpath("configs_states.json.bak")
+        if not backup_file.is_file():
+            return
+        with open(backup_file, "rb") as f:
+            perv_configs_states_json = f.read()
+        if perv_configs_states_json:
+            perv_configs_states = pydantic.TypeAdapter(List[ConfigStateRequest]).validate_json(perv_configs_states_json)
+            self.spool.append(perv_configs_states)
+        backup_file.unlink()
+
     def __exit__(self, exc_type, exc_value, exc_traceback):
         if not self.is_committed:
             with open(self.self_log_file, "r+b") as f:
@@ -357,55 +447,18 @@ class BaseSyncRequestPayload:
                 f.write(red_content)
                 f.write(content)
 
-            with open(self.backup_file, "wb") as f:
-                ta = pydantic.TypeAdapter(List[ConfigStateRequest])
-                f.write(ta.dump_json(self.payload.configs_states))
+            # the spooled ones are still in the spool, only append the new ones
+            self.spool.append(self.new_configs_states)
         else:
-            self.backup_file.unlink(missing_ok=True)
+            self.spool.clear()
+        if self.delta_upload:
+            self.log_offsets.save()
 
 
     def commited(self):
         self.is_committed = True
 
 
-class ContentDownloadError(Exception):
-    pass
-
-
-def download_outerbinary(*, binary_content_url: str, save_to: Path, identifier: str, api_key: str, timeout=Optional[Tuple[int, int]]):
-    _version = importlib.metadata.version("smallo1")
-    retry_limit = 3
-    headers = {"Authorization": f"Api-Key {api_key}", "User-Agent": f"smallo1:{_version}"}
-    retry_count = 0
-    for i in range(retry_limit):
-        retry_count += 1
-        try:
-            r = requests.get(binary_content_url, json={}, headers=headers, stream=True, timeout=timeout)
-            if r.status_code == 200:
-                recieved_sha256 = sha256()
-                with tempfile.NamedTemporaryFile(delete=False) as file:
-                    for chunk in r.iter_content(chunk_size=2048):
-                        file.write(chunk)
-                        recieved_sha256.update(chunk)
-
-                    if recieved_sha256.hexdigest() != identifier:
-                        logger.debug(f"sha missmatch happened for {identifier=}")
-                        continue
-                    shutil.move(file.name, save_to)
-                os.chmod(save_to, 0o755)
-                logger.debug(f"successfully downloaded {identifier=}")
-                break
-            else:
-                logger.warning(f"binary-content returned {r.status_code=}, and the content is {r.text[:50]}")
-        except requests.exceptions.Timeout:
-            logger.warning(f"timeout in binary download at {retry_count=}")
-            if save_to.exists():
-                os.remove(str(save_to))
-            continue
-    else:
-        raise ContentDownloadError()
-
-
 def cli():
     parser = argparse.ArgumentParser(description="CLI for my_package")
     parser.add_argument("--env-file", type=str, default=None, help="Path to the .env file to load settings from")
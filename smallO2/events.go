@@ -0,0 +1,301 @@
+package main
+
+import (
+	"alexejk.io/go-xmlrpc"
+	"bufio"
+	"encoding/json"
+	"fmt"
+	"go.uber.org/zap"
+	"io"
+	"math/rand"
+	"net"
+	"net/http"
+	"net/url"
+	"os"
+	"path/filepath"
+	"strconv"
+	"strings"
+	"sync"
+	"time"
+)
+
+const eventListenerName = "smallo2_events"
+
+// the triggers of a burst (a reload changes many processes) end up in one sync
+const syncDebounce = 500 * time.Millisecond
+
+// the supervisor events (chatty logs, a program in a crash loop) trigger a sync at most this often
+const eventsSyncInterval = 5 * time.Second
+
+// the server changes reach every node at once, so they are spread a bit
+const serverChangeJitter = 500 * time.Millisecond
+
+func getEventsSocketPath(config Config) string {
+	return filepath.Join(config.WorkingDir, "smallo2_events.sock")
+}
+
+// withEventListener adds the supervisor event listener of smallO2 to the supervisor config of the server
+func withEventListener(supervisorConfigContent string, config Config) string {
+	executable, err := os.Executable()
+	if err != nil {
+		return supervisorConfigContent
+	}
+	return supervisorConfigContent + fmt.Sprintf(`
+[eventlistener:%s]
+command=%s event_listener --socket %s
+events=PROCESS_STATE,PROCESS_LOG
+buffer_size=100
+autostart=true
+autorestart=true
+priority=1
+`, eventListenerName, executable, getEventsSocketPath(config))
+}
+
+func triggerSync(triggers chan<- string, reason string) {
+	select {
+	case triggers <- reason:
+	default:
+		// a sync is already pending
+	}
+}
+
+// waitForNextSync waits for the interval or an earlier trigger (supervisor events, server changes)
+func waitForNextSync(triggers <-chan string, interval time.Duration, logger *zap.Logger) {
+	timer := time.NewTimer(interval)
+	defer timer.Stop()
+	select {
+	case <-timer.C:
+		return
+	case reason := <-triggers:
+		logger.Debug(fmt.Sprintf("sync triggered by %s", reason))
+	}
+	debounce := time.NewTimer(syncDebounce)
+	defer debounce.Stop()
+	for {
+		select {
+		case <-triggers:
+		case <-debounce.C:
+			return
+		}
+	}
+}
+
+// runEventListener speaks the supervisor event listener protocol on stdin and stdout,
+// each event is passed to the socket that the main loop listens on
+func runEventListener(socketPath string) {
+	stdin := bufio.NewReader(os.Stdin)
+	var conn net.Conn
+	for {
+		fmt.Fprint(os.Stdout, "READY\n")
+		header, err := stdin.ReadString('\n')
+		if err != nil {
+			fmt.Fprintf(os.Stderr, "error in reading the event header: %v\n", err)
+			return
+		}
+		headers := map[string]string{}
+		for _, token := range strings.Fields(header) {
+			if key, value, ok := strings.Cut(token, ":"); ok {
+				headers[key] = value
+			}
+		}
+		length, err := strconv.Atoi(headers["len"])
+		if err != nil {
+			fmt.Fprintf(os.Stderr, "invalid event header %q\n", header)
+			return
+		}
+		payload := make([]byte, length)
+		if _, err := io.ReadFull(stdin, payload); err != nil {
+			fmt.Fprintf(os.Stderr, "error in reading the event payload: %v\n", err)
+			return
+		}
+		payloadHeader, _, _ := strings.Cut(string(payload), "\n")
+		// the events of the listener itself would trigger syncs endlessly
+		if !strings.Contains(payloadHeader, "groupname:"+eventListenerName) {
+			if conn == nil {
+				conn, err = net.Dial("unixgram", socketPath)
+			}
+			if conn != nil {
+				if _, err := conn.Write([]byte(headers["eventname"] + " " + payloadHeader)); err != nil {
+					// smallO2 may have been restarted, the socket is dialed again on the next event
+					conn.Close()
+					conn = nil
+				}
+			}
+		}
+		fmt.Fprint(os.Stdout, "RESULT 2\nOK")
+	}
+}
+
+// syncRateLimiter passes a trigger at most once per interval,
+// the triggers in between are deferred to the end of the interval so no event is lost
+type syncRateLimiter struct {
+	interval    time.Duration
+	triggers    chan<- string
+	mu          sync.Mutex
+	lastTrigger time.Time
+	isDeferred  bool
+}
+
+func (l *syncRateLimiter) trigger(reason string) {
+	l.mu.Lock()
+	defer l.mu.Unlock()
+	if l.isDeferred {
+		return
+	}
+	wait := l.interval - time.Since(l.lastTrigger)
+	if wait <= 0 {
+		l.lastTrigger = time.Now()
+		triggerSync(l.triggers, reason)
+		return
+	}
+	l.isDeferred = true
+	time.AfterFunc(wait, func() {
+		l.mu.Lock()
+		defer l.mu.Unlock()
+		l.isDeferred = false
+		l.lastTrigger = time.Now()
+		triggerSync(l.triggers, reason)
+	})
+}
+
+// listenSupervisorEvents triggers a sync for the events that the event listener passes,
+// all of them share one rate limiter so neither the chatty processes nor a crash loop keep the loop syncing
+func listenSupervisorEvents(socketPath string, triggers chan<- string, logger *zap.Logger) error {
+	os.Remove(socketPath)
+	conn, err := net.ListenUnixgram("unixgram", &net.UnixAddr{Name: socketPath, Net: "unixgram"})
+	if err != nil {
+		return err
+	}
+	limiter := &syncRateLimiter{interval: eventsSyncInterval, triggers: triggers}
+	go func() {
+		defer conn.Close()
+		buffer := make([]byte, 4096)
+		for {
+			n, _, err := conn.ReadFromUnix(buffer)
+			if err != nil {
+				logger.Error("Error reading supervisor events", zap.Error(err))
+				return
+			}
+			limiter.trigger(string(buffer[:n]))
+		}
+	}()
+	return nil
+}
+
+// watchServerChanges long polls the server and triggers a sync when the bundle version changes
+func watchServerChanges(config Config, triggers chan<- string, logger *zap.Logger) {
+	var version *int64
+	for {
+		spec := config.SyncURLSpecs[rand.Intn(len(config.SyncURLSpecs))]
+		newVersion, err := waitServerChange(spec, config, version)
+		if err != nil {
+			logger.Debug("Error waiting for server changes", zap.Error(err))
+			time.Sleep(time.Second * time.Duration(config.IntervalSec))
+			continue
+		}
+		if version != nil && newVersion != *version {
+			time.Sleep(time.Duration(rand.Int63n(int64(serverChangeJitter))))
+			triggerSync(triggers, "server change")
+		}
+		version = &newVersion
+	}
+}
+
+func waitServerChange(spec UrlSpec, config Config, version *int64) (int64, error) {
+	client, err := getSyncHTTPClient(spec.ProxyUrl, config.IsDev)
+	if err != nil {
+		return 0, err
+	}
+	changesUrl := strings.TrimRight(spec.URL, "/") + "/changes/"
+	if version != nil {
+		changesUrl += "?version=" + url.QueryEscape(strconv.FormatInt(*version, 10))
+	}
+	req, err := http.NewRequest("GET", changesUrl, nil)
+	if err != nil {
+		return 0, err
+	}
+	req.Header.Set("Authorization", "Api-Key "+config.APIKey)
+	req.Header.Set("User-Agent", fmt.Sprintf("smallO2:%v", Release))
+	resp, err := client.Do(req)
+	if err != nil {
+		return 0, err
+	}
+	defer resp.Body.Close()
+	if resp.StatusCode != http.StatusOK {
+		return 0, fmt.Errorf("server changes returned non-OK status: %s", resp.Status)
+	}
+	var result struct {
+		Version int64 `json:"version"`
+	}
+	if err := json.NewDecoder(resp.Body).Decode(&result); err != nil {
+		return 0, err
+	}
+	return result.Version, nil
+}
+
+// updateSupervisorGroups applies the result of reloadConfig like `supervisorctl update` does
+func updateSupervisorGroups(supervisorXmlRpcClient *xmlrpc.Client, added []string, changed []string, removed []string, logger *zap.Logger) error {
+	var errs []string
+	stopAndRemove := func(name string) {
+		stopResultDummy := struct {
+			Statuses []struct {
+				Name        string `xmlrpc:"Name"`
+				Group       string `xmlrpc:"Group"`
+				Status      int    `xmlrpc:"Status"`
+				Description string `xmlrpc:"Description"`
+			}
+		}{}
+		err := supervisorXmlRpcClient.Call("supervisor.stopProcessGroup", struct {
+			DumParam1 string
+			DumParam2 bool
+		}{
+			DumParam1: name,
+			DumParam2: true,
+		}, &stopResultDummy)
+		if err != nil {
+			errs = append(errs, fmt.Sprintf("stopping %s: %v", name, err))
+		}
+		removeResultDummy := struct {
+			Success bool
+		}{}
+		err = supervisorXmlRpcClient.Call("supervisor.removeProcessGroup", struct {
+			DumParam1 string
+		}{
+			DumParam1: name,
+		}, &removeResultDummy)
+		if err != nil {
+			errs = append(errs, fmt.Sprintf("removing %s: %v", name, err))
+		}
+	}
+	add := func(name string) {
+		addResultDummy := struct {
+			Success bool
+		}{}
+		err := supervisorXmlRpcClient.Call("supervisor.addProcessGroup", struct {
+			DumParam1 string
+		}{
+			DumParam1: name,
+		}, &addResultDummy)
+		if err != nil {
+			errs = append(errs, fmt.Sprintf("adding %s: %v", name, err))
+		}
+	}
+
+	for _, name := range removed {
+		stopAndRemove(name)
+		logger.Info(fmt.Sprintf("%s: stopped and removed process group", name))
+	}
+	for _, name := range changed {
+		stopAndRemove(name)
+		add(name)
+		logger.Info(fmt.Sprintf("%s: updated process group", name))
+	}
+	for _, name := range added {
+		add(name)
+		logger.Info(fmt.Sprintf("%s: added process group", name))
+	}
+	if len(errs) > 0 {
+		return fmt.Errorf("failed to update supervisor groups: %s", strings.Join(errs, "; "))
+	}
+	return nil
+}
@@ -3,7 +3,7 @@ package main
 import (
 	"alexejk.io/go-xmlrpc"
 	"bufio"
-	"bytes"
+	"compress/gzip"
 	"context"
 	"crypto/sha256"
 	"encoding/hex"
@@ -28,9 +28,94 @@ import (
 	"sort"
 	"strconv"
 	"strings"
+	"sync"
+	"sync/atomic"
 	"time"
 )
 
+const fileDownloadConcurrency = 4
+
+// the sync clients live as long as the process, one per proxy, so the connections are reused between the cycles
+var (
+	syncHTTPClients   = map[string]*http.Client{}
+	syncHTTPClientsMu sync.Mutex
+)
+
+var fileHTTPClient = &http.Client{
+	Transport: &http.Transport{
+		Proxy: http.ProxyFromEnvironment,
+		DialContext: (&net.Dialer{
+			Timeout:   5 * time.Second,
+			KeepAlive: 30 * time.Second,
+		}).DialContext,
+		ForceAttemptHTTP2:     true,
+		MaxIdleConns:          fileDownloadConcurrency,
+		MaxIdleConnsPerHost:   fileDownloadConcurrency,
+		IdleConnTimeout:       60 * time.Second,
+		TLSHandshakeTimeout:   10 * time.Second,
+		ResponseHeaderTimeout: 30 * time.Second,
+	},
+}
+
+func getSyncHTTPClient(proxyUrl string, isDev bool) (*http.Client, error) {
+	syncHTTPClientsMu.Lock()
+	defer syncHTTPClientsMu.Unlock()
+	if client, ok := syncHTTPClients[proxyUrl]; ok {
+		return client, nil
+	}
+	var proxyURL *url.URL
+	if proxyUrl != "" {
+		parsedURL, err := url.Parse(proxyUrl)
+		if err != nil {
+			return nil, err
+		}
+		proxyURL = parsedURL
+	}
+	transport := &http.Transport{
+		Proxy: http.ProxyURL(proxyURL),
+		DialContext: (&net.Dialer{
+			Timeout:   2 * time.Second,
+			KeepAlive: 30 * time.Second,
+		}).DialContext,
+		ForceAttemptHTTP2:   true,
+		MaxIdleConns:        4,
+		MaxIdleConnsPerHost: 2,
+		// below the usual keepalive_timeout of the reverse proxies (75s of nginx) to not reuse a closed one
+		IdleConnTimeout:       60 * time.Second,
+		TLSHandshakeTimeout:   5 * time.Second,
+		ResponseHeaderTimeout: 15 * time.Second,
+	}
+	client := &http.Client{Transport: transport}
+	if isDev {
+		client.Timeout = 600 * time.Second
+	}
+	syncHTTPClients[proxyUrl] = client
+	return client, nil
+}
+
+// gzipJSONBody streams the json of v through gzip so the payload is never held in memory as a whole,
+// dump (if not nil) gets the uncompressed json as well and is closed at the end
+func gzipJSONBody(v any, dump io.WriteCloser) io.ReadCloser {
+	pr, pw := io.Pipe()
+	go func() {
+		if dump != nil {
+			defer dump.Close()
+		}
+		gzipWriter, _ := gzip.NewWriterLevel(pw, gzip.BestSpeed)
+		var writer io.Writer = gzipWriter
+		if dump != nil {
+			writer = io.MultiWriter(gzipWriter, dump)
+		}
+		err := json.NewEncoder(writer).Encode(v)
+		if err == nil {
+			err = gzipWriter.Close()
+		}
+		// the request body is closed by the client on failures, which ends the writes here as well
+		pw.CloseWithError(err)
+	}()
+	return pr
+}
+
 func getLogsDir(config Config) string {
 	logsDir := filepath.Join(config.WorkingDir, "logs")
 	if err := os.MkdirAll(logsDir, 0755); err != nil {
@@ -548,7 +633,7 @@ func getStatsBackUpProcedure(config Config, time time.Time) (string, func(stats
 	return filePath, save, getOnCommit
 }
 
-func makeSyncAPIRequest(config Config, payload *APIRequest, logger *zap.Logger) (*APIResponse, *[]byte, error) {
+func makeSyncAPIRequest(config Config, payload *APIRequest, bundleHash string, logger *zap.Logger) (*APIResponse, *[]byte, error) {
 	var response APIResponse
 	var loggingDebounce float64 = 3
 
@@ -562,13 +647,6 @@ func makeSyncAPIRequest(config Config, payload *APIRequest, logger *zap.Logger)
 		}
 	}
 
-	payloadBytes, err := json.Marshal(payload)
-	if err != nil {
-		return &response, nil, fmt.Errorf("failed to marshal request payload: %w", err)
-	}
-	err = os.WriteFile(filepath.Join(config.WorkingDir, "sync_request.txt"), payloadBytes, 0644)
-
-	var proxyURL *url.URL
 	var Url string
 	tries := 0
 	logTries := 0
@@ -576,43 +654,38 @@ func makeSyncAPIRequest(config Config, payload *APIRequest, logger *zap.Logger)
 	rand.Seed(time.Now().UnixNano())
 	for {
 		urlChoice := urlChoices[rand.Intn(len(urlChoices))]
-		if urlChoice.proxyUrl != "" {
-			proxyURL, err = url.Parse(urlChoice.proxyUrl)
+		client, err := getSyncHTTPClient(urlChoice.proxyUrl, config.IsDev)
+		if err != nil {
+			logger.Warn("failed to parse proxy url", zap.String("url", urlChoice.url), zap.Error(err))
+			continue
+		}
+		Url = urlChoice.url
+		var dump io.WriteCloser
+		if tries == 0 {
+			dump, err = os.Create(filepath.Join(config.WorkingDir, "sync_request.txt"))
 			if err != nil {
-				logger.Warn("failed to parse proxy url", zap.String("url", urlChoice.url), zap.Error(err))
-				continue
+				dump = nil
 			}
-		} else {
-			proxyURL = nil
 		}
-		Url = urlChoice.url
-		payloadBuffer := bytes.NewBuffer(payloadBytes)
-		req, err := http.NewRequest("POST", Url, payloadBuffer)
+		req, err := http.NewRequest("POST", Url, gzipJSONBody(payload, dump))
 		if err != nil {
 			return &response, nil, fmt.Errorf("failed to create request: %w", err)
 		}
 
 		req.Header.Set("Content-Type", "application/json")
+		req.Header.Set("Content-Encoding", "gzip")
 		req.Header.Set("Authorization", "Api-Key "+config.APIKey)
 		req.Header.Set("User-Agent", fmt.Sprintf("smallO2:%v", Release))
-
-		transport := &http.Transport{
-			Proxy: http.ProxyURL(proxyURL),
-			DialContext: (&net.Dialer{
-				Timeout: 2 * time.Second,
-			}).DialContext,
-			TLSHandshakeTimeout:   5 * time.Second,
-			ResponseHeaderTimeout: 15 * time.Second,
-		}
-		client := &http.Client{Transport: transport}
-		if config.IsDev {
-			client.Timeout = 600 * time.Second
+		if bundleHash != "" {
+			req.Header.Set("If-None-Match", fmt.Sprintf("\"%s\"", bundleHash))
 		}
+
+		// Accept-Encoding is left to the transport, which then decompresses the gzip responses itself
 		resp, err := client.Do(req)
 		if err != nil {
 			proxyPartMsg := ""
-			if proxyURL != nil {
-				proxyPartMsg = ": " + proxyURL.String()
+			if urlChoice.proxyUrl != "" {
+				proxyPartMsg = ": " + urlChoice.proxyUrl
 			}
 			lastLogDiff := time.Now().Sub(lastLog)
 			if lastLogDiff.Seconds() > loggingDebounce {
@@ -633,12 +706,21 @@ func makeSyncAPIRequest(config Config, payload *APIRequest, logger *zap.Logger)
 		}
 		defer resp.Body.Close()
 
+		if resp.StatusCode == http.StatusNotModified {
+			response.NotModified = true
+			response.BundleHash = bundleHash
+			return &response, nil, nil
+		}
 		if resp.StatusCode == http.StatusOK {
 			// Parse the response
 			err = json.NewDecoder(resp.Body).Decode(&response)
 			if err != nil {
 				return &response, nil, fmt.Errorf("failed to decode response: %w", err)
 			}
+			// the connection is only reused once the body is read to the end
+			io.Copy(io.Discard, resp.Body)
+			// a compressed response has a weak etag
+			response.BundleHash = strings.Trim(strings.TrimPrefix(resp.Header.Get("ETag"), "W/"), "\"")
 			return &response, nil, nil
 		}
 		bodyBytes, err := io.ReadAll(resp.Body)
@@ -659,15 +741,15 @@ func downloadAndVerifyFile(fileInfo FileSchema, config Config) error {
 		return fmt.Errorf("failed to create destination directory at %s: %v", destPathDir, err)
 	}
 
-	// Create temp file
+	// Create temp file, unique since the files are downloaded concurrently and the names may be the same
 	tempDir := os.TempDir()
 	fileName := filepath.Base(fileInfo.DestPath)
-	tempFilePath := filepath.Join(tempDir, fileName+".tmp")
-
-	tempFile, err := os.Create(tempFilePath)
+	tempFile, err := os.CreateTemp(tempDir, fileName+".*.tmp")
 	if err != nil {
 		return fmt.Errorf("failed to create temp file: %w", err)
 	}
+	tempFilePath := tempFile.Name()
+	defer os.Remove(tempFilePath)
 	defer tempFile.Close()
 
 	// Download the file
@@ -679,8 +761,7 @@ func downloadAndVerifyFile(fileInfo FileSchema, config Config) error {
 	req.Header.Set("Authorization", "Api-Key "+config.APIKey)
 	req.Header.Set("User-Agent", fmt.Sprintf("smallO2:%v", Release))
 
-	client := &http.Client{}
-	resp, err := client.Do(req)
+	resp, err := fileHTTPClient.Do(req)
 	if err != nil {
 		return fmt.Errorf("failed to start download: %w", err)
 	}
@@ -741,7 +822,7 @@ func downloadAndVerifyFile(fileInfo FileSchema, config Config) error {
 	if err != nil {
 		log.Fatalf("Failed to open source file: %v", err)
 	}
-	defer out.Close()
+	defer in.Close()
 
 	if _, err = io.Copy(out, in); err != nil {
 		return fmt.Errorf("failed to copy temp file to destination file: %w", err)
@@ -754,6 +835,36 @@ func downloadAndVerifyFile(fileInfo FileSchema, config Config) error {
 	return nil
 }
 
+// downloadFiles downloads the files concurrently with a bound, returns the number of the failed ones
+func downloadFiles(files []FileSchema, config Config, logger *zap.Logger) int {
+	var wg sync.WaitGroup
+	var failed atomic.Int32
+	semaphore := make(chan struct{}, fileDownloadConcurrency)
+	seenDestPaths := map[string]bool{}
+	for _, fileInfo := range files {
+		if seenDestPaths[fileInfo.DestPath] {
+			continue
+		}
+		seenDestPaths[fileInfo.DestPath] = true
+		wg.Add(1)
+		semaphore <- struct{}{}
+		go func() {
+			defer wg.Done()
+			defer func() { <-semaphore }()
+			logger.Debug(fmt.Sprintf("start downloading file %s", fileInfo.DestPath))
+			err := downloadAndVerifyFile(fileInfo, config)
+			if err != nil {
+				logger.Error(fmt.Sprintf("Error downloading file %s: %v", fileInfo.DestPath, err))
+				failed.Add(1)
+				return
+			}
+			logger.Debug(fmt.Sprintf("successfully downloaded %s", fileInfo.DestPath))
+		}()
+	}
+	wg.Wait()
+	return int(failed.Load())
+}
+
 func Contains(slice []string, str string) bool {
 	for _, s := range slice {
 		if s == str {
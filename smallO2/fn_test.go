@@ -0,0 +1,127 @@
+package main
+
+import (
+	"compress/gzip"
+	"encoding/json"
+	"fmt"
+	"io"
+	"net"
+	"net/http"
+	"net/http/httptest"
+	"strings"
+	"sync/atomic"
+	"testing"
+	"time"
+
+	"go.uber.org/zap"
+)
+
+const benchBundleHash = "bench-bundle"
+
+// countingReader counts the bytes that came over the wire
+type countingReader struct {
+	io.Reader
+	count *atomic.Int64
+}
+
+func (r countingReader) Read(p []byte) (int, error) {
+	n, err := r.Reader.Read(p)
+	r.count.Add(int64(n))
+	return n, err
+}
+
+// newBenchSyncServer is a sync endpoint that decodes the gzipped payloads like the server does,
+// it answers 304 to the requests that already have the bundle
+func newBenchSyncServer(tb testing.TB, wireBytes *atomic.Int64, newConns *atomic.Int64) *httptest.Server {
+	bundle, err := json.Marshal(APIResponse{
+		SupervisorConfig: SupervisorConfig{ConfigContent: strings.Repeat("[program:x]\ncommand=/bin/true\n", 200)},
+		Runtime:          RuntimeSchema{NodeID: "1", NodeName: "bench"},
+	})
+	if err != nil {
+		tb.Fatal(err)
+	}
+	server := httptest.NewUnstartedServer(http.HandlerFunc(func(w http.ResponseWriter, r *http.Request) {
+		var body io.Reader = countingReader{Reader: r.Body, count: wireBytes}
+		if r.Header.Get("Content-Encoding") == "gzip" {
+			gzipReader, err := gzip.NewReader(body)
+			if err != nil {
+				http.Error(w, err.Error(), http.StatusBadRequest)
+				return
+			}
+			defer gzipReader.Close()
+			body = gzipReader
+		}
+		var payload APIRequest
+		if err := json.NewDecoder(body).Decode(&payload); err != nil {
+			http.Error(w, err.Error(), http.StatusBadRequest)
+			return
+		}
+		if r.Header.Get("If-None-Match") == fmt.Sprintf("\"%s\"", benchBundleHash) {
+			w.WriteHeader(http.StatusNotModified)
+			return
+		}
+		w.Header().Set("Content-Type", "application/json")
+		w.Header().Set("ETag", fmt.Sprintf("\"%s\"", benchBundleHash))
+		w.Write(bundle)
+	}))
+	server.Config.ConnState = func(conn net.Conn, state http.ConnState) {
+		if state == http.StateNew {
+			newConns.Add(1)
+		}
+	}
+	server.Start()
+	tb.Cleanup(server.Close)
+	return server
+}
+
+// newBenchPayload is like the payload of a node with many processes that log a lot
+func newBenchPayload() *APIRequest {
+	payload := &APIRequest{Metrics: MetricSchema{IPA: strings.Repeat("inet 10.0.0.1/24 scope global eth0\n", 20)}}
+	logLine := `{"result_type": "xray_raw_traffic_v1", "timestamp": "2026-10-18T10:00:00Z", "msg": "..."}` + "\n"
+	for i := 0; i < 30; i++ {
+		payload.ConfigsStates = append(payload.ConfigsStates, ConfigStateSchema{
+			Time:                  time.Now(),
+			SupervisorProcessInfo: SupervisorProcessInfoSchema{Name: fmt.Sprintf("process_%d", i), StateName: "RUNNING"},
+			Stdout:                SupervisorProcessTailLogSerializerSchema{Bytes: strings.Repeat(logLine, 200)},
+			Stderr:                SupervisorProcessTailLogSerializerSchema{Bytes: strings.Repeat("warning\n", 100)},
+		})
+	}
+	return payload
+}
+
+// BenchmarkMakeSyncAPIRequest measures a sync cycle against a local server,
+// the wire bytes and the new connections of each request show the gzip and keep-alive gains
+func BenchmarkMakeSyncAPIRequest(b *testing.B) {
+	for _, bundleHash := range []string{"", benchBundleHash} {
+		name := "modified"
+		if bundleHash != "" {
+			name = "not_modified"
+		}
+		b.Run(name, func(b *testing.B) {
+			var wireBytes, newConns atomic.Int64
+			server := newBenchSyncServer(b, &wireBytes, &newConns)
+			config := Config{
+				SyncURLSpecs: []UrlSpec{{URL: server.URL, Weight: 1}},
+				APIKey:       "bench",
+				WorkingDir:   b.TempDir(),
+			}
+			payload := newBenchPayload()
+			logger := zap.NewNop()
+
+			b.ReportAllocs()
+			b.ResetTimer()
+			for i := 0; i < b.N; i++ {
+				response, _, err := makeSyncAPIRequest(config, payload, bundleHash, logger)
+				if err != nil {
+					b.Fatal(err)
+				}
+				if response.BundleHash != benchBundleHash {
+					b.Fatalf("unexpected bundle hash %q", response.BundleHash)
+				}
+			}
+			b.StopTimer()
+			b.ReportMetric(float64(wireBytes.Load())/float64(b.N), "wire-B/op")
+			b.ReportMetric(float64(newConns.Load())/float64(b.N), "conns/op")
+		})
+	}
+}
@@ -25,6 +25,8 @@ func main() {
 	} else if len(os.Args) == 4 && os.Args[1] == "pre_run" && os.Args[2] == "--config" {
 		configPath := os.Args[3]
 		mainLoop(configPath, true)
+	} else if len(os.Args) == 4 && os.Args[1] == "event_listener" && os.Args[2] == "--socket" {
+		runEventListener(os.Args[3])
 	} else if len(os.Args) > 1 && os.Args[1] == "--config" {
 		configPath := os.Args[2]
 		mainLoop(configPath, false)
@@ -72,6 +74,19 @@ func mainLoop(configPath string, preRun bool) {
 	defer supervisorXmlRpcClient.Close()
 
 	loopCount := 0
+	// hash of the latest bundle that is fully applied, sent back so the server can answer with not modified
+	appliedBundleHash := ""
+	// the supervisor config that supervisor has been updated with, read from the disk only at the start
+	var appliedSupervisorConfigContent *string
+	// besides the interval, a sync is started right after the supervisor events and the server changes
+	syncTriggers := make(chan string, 1)
+	if !preRun {
+		err = listenSupervisorEvents(getEventsSocketPath(config), syncTriggers, logger)
+		if err != nil {
+			logger.Error(fmt.Sprintf("Error listening to supervisor events: %v", err))
+		}
+		go watchServerChanges(config, syncTriggers, logger)
+	}
 MainLoop:
 	for {
 		if preRun && loopCount >= 1 {
@@ -102,7 +117,7 @@ MainLoop:
 			}
 		}
 
-		response, bodyBytes, err := makeSyncAPIRequest(config, payload, logger)
+		response, bodyBytes, err := makeSyncAPIRequest(config, payload, appliedBundleHash, logger)
 		if err != nil {
 			logger.Error(fmt.Sprintf("Error making Sync API request: %v", err))
 			if bodyBytes != nil {
@@ -111,13 +126,19 @@ MainLoop:
 					panic(fmt.Sprintf("err in writing api syc response to %s", err))
 				}
 			}
-			time.Sleep(time.Second * time.Duration(config.IntervalSec))
+			waitForNextSync(syncTriggers, time.Second*time.Duration(config.IntervalSec), logger)
 			continue MainLoop
 		}
 		err = StatsCommitted()
 		if err != nil {
 			logger.Error(fmt.Sprintf("Error in StatsCommitted: %v", err))
 		}
+		if response.NotModified {
+			logger.Debug(fmt.Sprintf("bundle not modified."))
+			waitForNextSync(syncTriggers, time.Second*time.Duration(config.IntervalSec), logger)
+			continue MainLoop
+		}
+		isBundleApplied := true
 		err = response.Config.Validate()
 		if err != nil {
 			logger.Error(fmt.Sprintf("could not validate config form api %v", err))
@@ -128,19 +149,12 @@ MainLoop:
 			scope.SetTag("node_id", response.Runtime.NodeID)
 			scope.SetTag("node_name", response.Runtime.NodeName)
 		})
-	FilesLoop:
+		var downloadingFiles []FileSchema
 		for _, fileInfo := range response.Files {
 			_, err := os.Stat(fileInfo.DestPath)
 			if os.IsNotExist(err) {
 				if fileInfo.URL != nil {
-					logger.Debug(fmt.Sprintf("start downloading file %v: %v", fileInfo.Hash, err))
-					err := downloadAndVerifyFile(fileInfo, config)
-					if err != nil {
-						logger.Error(fmt.Sprintf("Error downloading file %v: %v", fileInfo.Hash, err))
-						continue FilesLoop
-					} else {
-						logger.Debug(fmt.Sprintf("successfully downloaded %v", fileInfo.Hash))
-					}
+					downloadingFiles = append(downloadingFiles, fileInfo)
 				} else if fileInfo.Content != nil {
 					if err := os.MkdirAll(filepath.Dir(fileInfo.DestPath), 0755); err != nil {
 						logger.Error(fmt.Sprintf("error in creating parent directories for %s", fileInfo.DestPath))
@@ -149,6 +163,7 @@ MainLoop:
 					err = os.WriteFile(fileInfo.DestPath, []byte(content), os.FileMode(fileInfo.Permission))
 					if err != nil {
 						logger.Error(fmt.Sprintf("error in writing content for %s", fileInfo.DestPath))
+						isBundleApplied = false
 					}
 				} else {
 					//it should be present all along
@@ -158,36 +173,46 @@ MainLoop:
 				logger.Error(fmt.Sprintf("Error is file stats checking for %s failed with %v", fileInfo.DestPath, err))
 			}
 		}
+		if failedDownloads := downloadFiles(downloadingFiles, config, logger); failedDownloads > 0 {
+			logger.Error(fmt.Sprintf("%d of %d files failed to download", failedDownloads, len(downloadingFiles)))
+			isBundleApplied = false
+		}
 		supervisorDir, err := getSupervisorDir(config)
 		if err != nil {
 			panic(fmt.Sprintf("Error in getSupervisorDir: %v", err))
 		}
 		supervisorConfigPath := filepath.Join(supervisorDir, "supervisor.conf")
-		currentSupervisorContentBytes, err := os.ReadFile(supervisorConfigPath)
-		var currentSupervisorConfigContent string
-		if err == nil {
-			currentSupervisorConfigContent = string(currentSupervisorContentBytes)
-		} else {
-			if os.IsNotExist(err) {
-				_, err = os.Create(supervisorConfigPath)
-				if err != nil {
-					panic(fmt.Sprintf("panic in touching %s with %v", supervisorConfigPath, err))
+		if appliedSupervisorConfigContent == nil {
+			currentSupervisorContentBytes, err := os.ReadFile(supervisorConfigPath)
+			var currentSupervisorConfigContent string
+			if err == nil {
+				currentSupervisorConfigContent = string(currentSupervisorContentBytes)
+			} else {
+				if os.IsNotExist(err) {
+					_, err = os.Create(supervisorConfigPath)
+					if err != nil {
+						panic(fmt.Sprintf("panic in touching %s with %v", supervisorConfigPath, err))
+					} else {
+						currentSupervisorConfigContent = ""
+					}
 				} else {
-					currentSupervisorConfigContent = ""
+					panic(fmt.Sprintf("panic in reading %s with %v", supervisorConfigPath, err))
 				}
-			} else {
-				panic(fmt.Sprintf("panic in reading %s with %v", supervisorConfigPath, err))
-			}
 
+			}
+			appliedSupervisorConfigContent = &currentSupervisorConfigContent
 		}
-		newSupervisorConfigContent := response.SupervisorConfig.ConfigContent
-		if removeComments(newSupervisorConfigContent) == removeComments(currentSupervisorConfigContent) {
+		newSupervisorConfigContent := withEventListener(response.SupervisorConfig.ConfigContent, config)
+		if removeComments(newSupervisorConfigContent) == removeComments(*appliedSupervisorConfigContent) {
 			logger.Debug(fmt.Sprintf("already up to date."))
 			err = saveConfig(configPath, config)
 			if err != nil {
 				panic(fmt.Sprintf("Error saving updated config: %v", err))
 			}
-			time.Sleep(time.Second * time.Duration(config.IntervalSec))
+			if isBundleApplied {
+				appliedBundleHash = response.BundleHash
+			}
+			waitForNextSync(syncTriggers, time.Second*time.Duration(config.IntervalSec), logger)
 			continue MainLoop
 		}
 		logger.Debug("update identified.")
@@ -203,7 +228,7 @@ MainLoop:
 		err = supervisorXmlRpcClient.Call("supervisor.reloadConfig", nil, &reloadConfigResultDummy)
 		if err != nil {
 			logger.Error(fmt.Sprintf("Error reloading supervisor config: %v", err))
-			time.Sleep(time.Second * time.Duration(config.IntervalSec))
+			waitForNextSync(syncTriggers, time.Second*time.Duration(config.IntervalSec), logger)
 			continue MainLoop
 		}
 		reloadConfigResult := reloadConfigResultDummy.SupervisorProcessInfos
@@ -212,20 +237,22 @@ MainLoop:
 		removed := reloadConfigResult[0][2]
 		logger.Info(fmt.Sprintf("added %s changed %s removed %s from supervisor", added, changed, removed))
 
-		updateCmd := exec.Command("supervisorctl", "update")
-		updateRes, err := updateCmd.Output()
+		err = updateSupervisorGroups(supervisorXmlRpcClient, added, changed, removed, logger)
 		if err != nil {
 			logger.Error(fmt.Sprintf("Error updating supervisor config: %v", err))
-		}
-		if updateRes != nil {
-			logger.Info(fmt.Sprintf("supervisorctl updated result: %s", updateRes))
+			isBundleApplied = false
+		} else {
+			appliedSupervisorConfigContent = &newSupervisorConfigContent
 		}
 
 		err = saveConfig(configPath, config)
 		if err != nil {
 			panic(fmt.Sprintf("Error saving updated config: %v", err))
 		}
+		if isBundleApplied {
+			appliedBundleHash = response.BundleHash
+		}
 
-		time.Sleep(time.Second * time.Duration(config.IntervalSec))
+		waitForNextSync(syncTriggers, time.Second*time.Duration(config.IntervalSec), logger)
 	}
 }
@@ -51,6 +51,8 @@ type APIResponse struct {
 	Files            []FileSchema     `json:"files"`
 	Config           Config           `json:"config"`
 	Runtime          RuntimeSchema    `json:"runtime"`
+	BundleHash       string           `json:"-"`
+	NotModified      bool             `json:"-"`
 }
 type SupervisorProcessInfoSchema struct {
 	Name          string `xmlrpc:"Name" json:"name"`